@@ -26,7 +26,7 @@ def format_debug_output(step_name: str, content: str, is_tool_call=False) -> Non
         print(content)
         print("="*40)
 
-async def agent_respond(user_message: str, thread_id: str = None):
+async def agent_respond(user_message: str, thread_id: str = None, kb_ids: list = None):
     if thread_id is None:
         thread_id = str(uuid.uuid4())
     
@@ -47,7 +47,8 @@ You are an excellent engineer, your name is {name}""")
             prompt=SystemMessage(content=prompt.format(name="Bot")),
         )
         
-        config = RunnableConfig(configurable={"thread_id": thread_id}, recursion_limit=100)
+        # kb_ids is read by the query_rag tool, empty means all active knowledge bases
+        config = RunnableConfig(configurable={"thread_id": thread_id, "kb_ids": kb_ids or []}, recursion_limit=100)
         
         print(f"\n🤖 agent start thinking... (thread_id: {thread_id})")
         print("="*60)
@@ -62,7 +63,7 @@ You should first try to answer based on the chat history. If you cannot answer t
 
 When you need to use tools:
 1. If the question is about knowledge or information, first use query_rag tool to search the knowledge base
-2. If you need to perform file operations, use file_tools
+2. If you need to perform file operations, use file_tools. Find definitions with find_symbol or file_outline, other code with search_workspace, and read the lines you need with read_file_lines instead of reading whole files
 3. If you need to execute shell commands, use shell_tools
 4. If you need to execute PowerShell commands, use powershell_tools
 
@@ -73,7 +74,11 @@ When you need to use tools:
         ]
         
         try:
-            async for chunk in agent.astream(input={"messages": messages}, config=config):
+            # "custom" carries output that tools stream while they run
+            async for mode, chunk in agent.astream(input={"messages": messages}, config=config, stream_mode=["updates", "custom"]):
+                if mode == "custom":
+                    yield {"tool_output": chunk}
+                    continue
                 iteration_count += 1
 
                 print(f"iteration {iteration_count}: {chunk}")
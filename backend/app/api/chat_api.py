@@ -6,10 +6,8 @@ import uuid
 from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from langchain_core.runnables import RunnableConfig
-from langchain_core.messages import AIMessage, ToolMessage
 from pydantic import BaseModel
-from app.agent.code_agent import agent_respond
+from typing import List
 
 # Import RAG related modules
 from app.rag.knowledge_manager import kb_manager
@@ -20,6 +18,7 @@ router = APIRouter(prefix="/api", tags=["Chat API"])
 class ChatRequest(BaseModel):
     message: str
     kb_id: str = None  # Optional, select knowledge base ID
+    kb_ids: List[str] = None  # Optional, search several knowledge bases together
     thread_id: str = None
 
 class ChatResponse(BaseModel):
@@ -27,8 +26,15 @@ class ChatResponse(BaseModel):
     kb_id: str = None
     kb_name: str = None
 
-async def stream_agent_response(user_message: str, kb_id: str = None, thread_id: str = None):
-    async for chunk in agent_respond(user_message, thread_id):
+async def stream_agent_response(user_message: str, kb_ids: List[str] = None, thread_id: str = None):
+    # The agent pulls in langgraph, the LLM client and the tool loaders, imported on the first chat
+    from langchain_core.messages import AIMessage, ToolMessage
+    from app.agent.code_agent import agent_respond
+    
+    async for chunk in agent_respond(user_message, thread_id, kb_ids):
+        if "tool_output" in chunk:
+            yield f"data: {{\"content\": {json.dumps(chunk['tool_output']['output'], ensure_ascii=False)}, \"tool\": {json.dumps(chunk['tool_output']['tool'])}, \"type\": \"tool_output\"}}\n"
+            continue
         for node_name, node_output in chunk.items():
             if "messages" in node_output:
                 for msg in node_output["messages"]:
@@ -49,6 +55,7 @@ async def stream_agent_response(user_message: str, kb_id: str = None, thread_id:
 async def chat_endpoint(chat: ChatRequest):
     user_message = chat.message
     kb_id = chat.kb_id
+    kb_ids = list(dict.fromkeys((chat.kb_ids or []) + ([kb_id] if kb_id else [])))
     thread_id = chat.thread_id
     
     if not user_message:
@@ -60,7 +67,7 @@ async def chat_endpoint(chat: ChatRequest):
     async def generate():
         try:
             if kb_id:
-                kb = kb_manager.get_knowledge_base(kb_id)
+                kb = await kb_manager.aget_knowledge_base(kb_id)
                 if kb:
                     yield f"data: {{\"content\": {json.dumps(f'Available knowledge base: {kb.name}', ensure_ascii=False)}, \"type\": \"kb_info\"}}\n"
                     enhanced_message = f"{user_message}\n\nnote: current has available knowledge base '{kb.name}', if there is no related information in the chat history, you can consider using the knowledge base to query."
@@ -69,7 +76,7 @@ async def chat_endpoint(chat: ChatRequest):
             else:
                 enhanced_message = user_message
             
-            async for chunk in stream_agent_response(enhanced_message, kb_id, thread_id):
+            async for chunk in stream_agent_response(enhanced_message, kb_ids, thread_id):
                 yield chunk
             yield "data: [DONE]\n"
         except Exception as e:
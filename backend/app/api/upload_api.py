@@ -1,28 +1,65 @@
 import os
-import shutil
+import asyncio
 from pathlib import Path
-from typing import List
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
+from typing import List, Literal
+from fastapi import APIRouter, File, UploadFile, HTTPException, Form, BackgroundTasks
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
 # Import RAG related modules
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
-from app.rag.knowledge_manager import kb_manager, KnowledgeBase
-from app.mcp.rag_tools import rag_manager
+from app.rag.knowledge_manager import kb_manager, KnowledgeBase, KnowledgeBaseExistsError
+from app.rag.index_profiles import INDEX_PROFILES
+from app.rag.payload_filters import normalize_filters
+from app.rag.garbage_collector import KnowledgeBaseGarbageCollector
+from app.rag.ingestion import run_ingestion, ingest_file, ingest_files, analyze_repository
+from app.rag.blob_store import blob_store, UploadTooLargeError
+from app.rag.archive import is_archive, iter_archive_members, ArchiveError, MAX_ARCHIVE_SIZE, MEMBER_ERRORS
+from app.utils.lazy import aload, is_loaded, lazy_object
 
 # Create router instead of FastAPI app
 router = APIRouter(prefix="/rag", tags=["RAG System"])
 
-# Configure upload directory
-UPLOAD_DIR = Path("./uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Embedding model, Qdrant client and loaders load in a thread after startup instead of at import
+rag_manager = lazy_object("app.mcp.rag_tools", "rag_manager")
+
+kb_gc = KnowledgeBaseGarbageCollector(blob_store)
+
+async def warm_rag_stack():
+    """Import the RAG stack in a thread at startup, so no request imports it on the event loop"""
+    try:
+        await aload(rag_manager)
+    except Exception as e:
+        print(f"RAG stack warm-up failed: {e}")
+
+ALLOWED_EXTENSIONS = {'.txt', '.pdf', '.docx', '.doc', '.md', '.csv'}
+
+async def get_upload_knowledge_base(kb_id: str = None) -> KnowledgeBase:
+    """Knowledge base receiving new content, the first active one or a new default one when kb_id is empty"""
+    if kb_id:
+        kb = await kb_manager.aget_knowledge_base(kb_id)
+        if not kb:
+            raise HTTPException(status_code=404, detail=f"Knowledge base not found: {kb_id}")
+        return kb
+    active_kbs = await kb_manager.aget_active_knowledge_bases()
+    if not active_kbs:
+        try:
+            return await kb_manager.acreate_knowledge_base("Default Knowledge Base", "Default knowledge base")
+        except KnowledgeBaseExistsError:
+            # Created by a concurrent request
+            return await kb_manager.aget_kb_by_name("Default Knowledge Base")
+    return active_kbs[0]
 
 class QueryRequest(BaseModel):
     query: str
     kb_id: str = None  # Optional, if not provided use default knowledge base
     k: int = 5
+    mode: Literal["dense", "lexical", "hybrid"] = None  # Optional, defaults to RAG_SEARCH_MODE
+    file_types: List[str] = None  # Optional, e.g. [".py", ".md"]
+    path_prefix: str = None  # Optional, only files under this path
+    repository: str = None  # Optional, git repository project name
+    symbol: str = None  # Optional, only code chunks defining this function or class
 
 class UploadRequest(BaseModel):
     kb_id: str = None  # Optional, if not provided use default knowledge base or create new
@@ -32,6 +69,7 @@ class GitRepositoryRequest(BaseModel):
     username: str
     token: str
     kb_id: str = None  # Optional, if not provided use default knowledge base or create new
+    fetch_mode: Literal["partial", "clone"] = None  # Optional, "partial" (shallow blob-filtered fetch) or "clone", defaults to GIT_FETCH_MODE
 
 class UploadResponse(BaseModel):
     message: str
@@ -40,6 +78,18 @@ class UploadResponse(BaseModel):
     kb_name: str
     chunks_count: int
     collection_info: dict
+    sha256: str = None
+    duplicate: bool = False  # identical content was already in the knowledge base
+
+class BulkUploadResponse(BaseModel):
+    message: str
+    kb_id: str
+    kb_name: str
+    files_received: int
+    files_processed: int
+    chunks_count: int
+    files: List[dict]  # per file: file, status (processed, duplicate, skipped, failed), chunks_count, error
+    collection_info: dict
 
 class GitRepositoryResponse(BaseModel):
     message: str
@@ -53,8 +103,10 @@ class QueryResponse(BaseModel):
     kb_id: str
     kb_name: str
     query: str
+    mode: str
     results: List[str]
     total_documents: int
+    latency_ms: dict
 
 class KnowledgeBaseResponse(BaseModel):
     id: str
@@ -65,10 +117,12 @@ class KnowledgeBaseResponse(BaseModel):
     created_at: str
     updated_at: str
     status: str
+    index_profile: str = "default"
 
 class CreateKnowledgeBaseRequest(BaseModel):
     name: str
     description: str = ""
+    index_profile: str = "default"  # see GET /rag/index-profiles
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_file(
@@ -80,58 +134,65 @@ async def upload_file(
     """
     try:
         # Check file type
-        allowed_extensions = {'.txt', '.pdf', '.docx', '.doc', '.md', '.csv'}
         file_extension = Path(file.filename).suffix.lower()
         
-        if file_extension not in allowed_extensions:
+        if file_extension not in ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=400, 
-                detail=f"Unsupported file type: {file_extension}. Supported types: {allowed_extensions}"
+                detail=f"Unsupported file type: {file_extension}. Supported types: {ALLOWED_EXTENSIONS}"
             )
         
-        # Save file
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
         # Determine knowledge base
-        if kb_id:
-            kb = kb_manager.get_knowledge_base(kb_id)
-            if not kb:
-                raise HTTPException(status_code=404, detail=f"Knowledge base not found: {kb_id}")
-        else:
-            # Use default knowledge base or create new
-            active_kbs = kb_manager.get_active_knowledge_bases()
-            if not active_kbs:
-                kb = kb_manager.create_knowledge_base("Default Knowledge Base", "Default knowledge base")
-            else:
-                kb = active_kbs[0]
+        kb = await get_upload_knowledge_base(kb_id)
         
-        # Process file through RAG manager
+        # Stream file into the content-addressed store, hashed on the fly
         try:
-            result = rag_manager.upload_to_knowledge_base(kb.id, str(file_path))
+            blob = await blob_store.save_upload(file, file.filename)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        file_path = blob["path"]
+        
+        # Identical content is already indexed in this knowledge base, skip parsing and embedding
+        if not await kb_manager.aadd_kb_file(kb.id, file_path):
+            return UploadResponse(
+                message="Identical file already in knowledge base, processing skipped",
+                file_path=file_path,
+                kb_id=kb.id,
+                kb_name=kb.name,
+                chunks_count=0,
+                collection_info={"status": "duplicate"},
+                sha256=blob["sha256"],
+                duplicate=True
+            )
+        
+        # Process file in the ingestion process pool
+        try:
+            result = await run_ingestion(ingest_file, kb.id, file_path, file.filename)
             
             if result["success"]:
                 return UploadResponse(
                     message="File uploaded and processed successfully",
-                    file_path=str(file_path),
+                    file_path=file_path,
                     kb_id=kb.id,
                     kb_name=kb.name,
                     chunks_count=result["chunks_count"],
-                    collection_info=result["collection_info"]
+                    collection_info=result["collection_info"],
+                    sha256=blob["sha256"]
                 )
             else:
                 raise HTTPException(status_code=500, detail=f"File processing failed: {result['error']}")
                 
         except Exception as e:
-            # If RAG processing fails, still return success for file upload
+            # If RAG processing fails, still return success for file upload, a re-upload retries processing
+            await kb_manager.aremove_kb_file(kb.id, file_path)
             return UploadResponse(
                 message=f"File uploaded successfully but processing failed: {str(e)}",
-                file_path=str(file_path),
+                file_path=file_path,
                 kb_id=kb.id,
                 kb_name=kb.name,
                 chunks_count=0,
-                collection_info={"status": "error", "error": str(e)}
+                collection_info={"status": "error", "error": str(e)},
+                sha256=blob["sha256"]
             )
         
     except HTTPException:
@@ -139,6 +200,90 @@ async def upload_file(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+def store_archive_members(archive_path: Path) -> List[tuple]:
+    """Store supported archive members as blobs, returns (name, blob, error) per member"""
+    stored = []
+    for name, open_member in iter_archive_members(archive_path, ALLOWED_EXTENSIONS):
+        # A member that cannot be extracted fails alone, the rest of the archive is still stored
+        try:
+            with open_member() as member:
+                stored.append((name, blob_store.save_file(member, name), None))
+        except UploadTooLargeError as e:
+            stored.append((name, None, str(e)))
+        except MEMBER_ERRORS as e:
+            stored.append((name, None, f"Could not extract {name}: {e}"))
+    return stored
+
+@router.post("/upload/bulk", response_model=BulkUploadResponse)
+async def bulk_upload_files(
+    files: List[UploadFile] = File(...),
+    kb_id: str = Form(None)
+):
+    """
+    Upload many files or zip/tar archives, processed in parallel with one stats update at the end
+    """
+    try:
+        kb = await get_upload_knowledge_base(kb_id)
+        
+        # Store every file and archive member first, failures are reported per file
+        stored, skipped = [], []
+        for upload in files:
+            try:
+                if is_archive(upload.filename):
+                    archive_path, _, _ = await blob_store.spool_upload(upload, MAX_ARCHIVE_SIZE)
+                    try:
+                        stored.extend(await asyncio.to_thread(store_archive_members, archive_path))
+                    finally:
+                        archive_path.unlink(missing_ok=True)
+                elif Path(upload.filename).suffix.lower() in ALLOWED_EXTENSIONS:
+                    stored.append((upload.filename, await blob_store.save_upload(upload, upload.filename), None))
+                else:
+                    skipped.append({
+                        "file": upload.filename,
+                        "status": "skipped",
+                        "chunks_count": 0,
+                        "error": f"Unsupported file type: {Path(upload.filename).suffix.lower()}"
+                    })
+            except (UploadTooLargeError, ArchiveError) as e:
+                stored.append((upload.filename, None, str(e)))
+        
+        # Add blobs to the knowledge base file set, content already in it is not processed again
+        results, pending = [], []
+        for name, blob, error in stored:
+            if blob is None:
+                results.append({"file": name, "status": "failed", "chunks_count": 0, "error": error})
+            elif await kb_manager.aadd_kb_file(kb.id, blob["path"]):
+                pending.append((blob["path"], name))
+            else:
+                results.append({"file": name, "status": "duplicate", "chunks_count": 0})
+        
+        result = {"files": [], "files_processed": 0, "chunks_count": 0, "collection_info": {}}
+        if pending:
+            result = await run_ingestion(ingest_files, kb.id, pending)
+            if not result["success"]:
+                await kb_manager.aremove_kb_file(kb.id, *(file_path for file_path, _ in pending))
+                raise HTTPException(status_code=500, detail=f"Bulk processing failed: {result['error']}")
+            # Failed files are dropped from the file set so a re-upload retries them
+            await kb_manager.aremove_kb_file(kb.id, *(
+                file_path for (file_path, _), file_result in zip(pending, result["files"]) if file_result["status"] == "failed"
+            ))
+        
+        return BulkUploadResponse(
+            message=f"Processed {result['files_processed']} of {len(stored) + len(skipped)} files",
+            kb_id=kb.id,
+            kb_name=kb.name,
+            files_received=len(stored) + len(skipped),
+            files_processed=result["files_processed"],
+            chunks_count=result["chunks_count"],
+            files=result["files"] + results + skipped,
+            collection_info=result["collection_info"]
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Bulk upload failed: {str(e)}")
+
 @router.post("/query", response_model=QueryResponse)
 async def query_rag(request: QueryRequest):
     """
@@ -147,27 +292,31 @@ async def query_rag(request: QueryRequest):
     try:
         # Determine knowledge base
         if request.kb_id:
-            kb = kb_manager.get_knowledge_base(request.kb_id)
+            kb = await kb_manager.aget_knowledge_base(request.kb_id)
             if not kb:
                 raise HTTPException(status_code=404, detail=f"Knowledge base not found: {request.kb_id}")
         else:
             # Use default knowledge base
-            active_kbs = kb_manager.get_active_knowledge_bases()
+            active_kbs = await kb_manager.aget_active_knowledge_bases()
             if not active_kbs:
                 raise HTTPException(status_code=404, detail="No available knowledge bases")
             kb = active_kbs[0]
         
         # Query through RAG manager
         try:
-            result = rag_manager.query_knowledge_base(kb.id, request.query, k=request.k)
+            filters = normalize_filters(request.file_types, request.path_prefix, request.repository, request.symbol)
+            await aload(rag_manager)
+            result = await rag_manager.aquery_knowledge_base(kb.id, request.query, k=request.k, mode=request.mode, filters=filters)
             
             if result["success"]:
                 return QueryResponse(
                     kb_id=kb.id,
                     kb_name=kb.name,
                     query=request.query,
+                    mode=result["mode"],
                     results=result["results"],
-                    total_documents=result["total_documents"]
+                    total_documents=result["total_documents"],
+                    latency_ms=result["latency_ms"]
                 )
             else:
                 raise HTTPException(status_code=500, detail=f"Query failed: {result['error']}")
@@ -186,7 +335,7 @@ async def list_knowledge_bases():
     List all knowledge bases
     """
     try:
-        knowledge_bases = kb_manager.get_active_knowledge_bases()
+        knowledge_bases = await kb_manager.aget_active_knowledge_bases()
         return [
             KnowledgeBaseResponse(
                 id=kb.id,
@@ -196,7 +345,8 @@ async def list_knowledge_bases():
                 vector_count=kb.vector_count,
                 created_at=kb.created_at,
                 updated_at=kb.updated_at,
-                status="active"
+                status="active",
+                index_profile=kb.index_profile
             ) 
             for kb in knowledge_bases
         ]
@@ -209,25 +359,35 @@ async def create_knowledge_base(request: CreateKnowledgeBaseRequest):
     Create new knowledge base
     """
     try:
-        # Check if name already exists
-        existing_kb = kb_manager.get_kb_by_name(request.name)
-        if existing_kb:
-            raise HTTPException(status_code=400, detail=f"Knowledge base name already exists: {request.name}")
+        if request.index_profile not in INDEX_PROFILES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown index profile: {request.index_profile}. Available profiles: {list(INDEX_PROFILES)}"
+            )
         
-        kb = kb_manager.create_knowledge_base(request.name, request.description)
+        kb = await kb_manager.acreate_knowledge_base(request.name, request.description, request.index_profile)
         return KnowledgeBaseResponse(**kb.model_dump())
+    except KnowledgeBaseExistsError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create knowledge base: {str(e)}")
 
+@router.get("/index-profiles")
+async def list_index_profiles():
+    """
+    List vector index profiles available at knowledge base creation
+    """
+    return {"profiles": [profile.model_dump() for profile in INDEX_PROFILES.values()]}
+
 @router.get("/knowledge-bases/{kb_id}", response_model=KnowledgeBaseResponse)
 async def get_knowledge_base(kb_id: str):
     """
     Get knowledge base details
     """
     try:
-        kb = kb_manager.get_knowledge_base(kb_id)
+        kb = await kb_manager.aget_knowledge_base(kb_id)
         if not kb:
             raise HTTPException(status_code=404, detail=f"Knowledge base not found: {kb_id}")
         return KnowledgeBaseResponse(**kb.model_dump())
@@ -237,31 +397,44 @@ async def get_knowledge_base(kb_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to get knowledge base details: {str(e)}")
 
 @router.delete("/knowledge-bases/{kb_id}")
-async def delete_knowledge_base(kb_id: str):
+async def delete_knowledge_base(kb_id: str, background_tasks: BackgroundTasks):
     """
-    Delete knowledge base
+    Delete knowledge base, its collection and uploaded files are released in the background
     """
     try:
-        success = kb_manager.delete_knowledge_base(kb_id)
+        success = await kb_manager.adelete_knowledge_base(kb_id)
         if not success:
             raise HTTPException(status_code=404, detail=f"Knowledge base not found: {kb_id}")
-        return {"message": "Knowledge base deleted successfully"}
+        background_tasks.add_task(kb_gc.collect, kb_id)
+        return {"message": "Knowledge base deleted successfully", "garbage_collection": "scheduled"}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete knowledge base: {str(e)}")
 
+@router.post("/gc/reconcile")
+async def reconcile_knowledge_bases(dry_run: bool = True):
+    """
+    Retry pending knowledge base deletions and find (or drop, with dry_run=false) orphaned collections
+    """
+    try:
+        return await asyncio.to_thread(kb_gc.reconcile, dry_run=dry_run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reconciliation failed: {str(e)}")
+
 @router.get("/health")
 async def rag_health_check():
     """
     RAG system health check
     """
     try:
-        active_kbs = kb_manager.get_active_knowledge_bases()
+        all_kbs = await kb_manager.alist_knowledge_bases()
         return {
             "status": "healthy",
-            "active_knowledge_bases": len(active_kbs),
-            "total_knowledge_bases": len(kb_manager.list_knowledge_bases())
+            "active_knowledge_bases": len([kb for kb in all_kbs if kb.status == "active"]),
+            "total_knowledge_bases": len(all_kbs),
+            # Reported once the RAG stack is loaded, a health check must not import it on the event loop
+            "cache": rag_manager.get_cache_stats() if is_loaded(rag_manager) else "not loaded"
         }
     except Exception as e:
         return {
@@ -272,17 +445,21 @@ async def rag_health_check():
 @router.get("/files")
 async def list_uploaded_files():
     """
-    List uploaded files
+    List uploaded files from the blob index
     """
     try:
-        files = []
-        for file_path in UPLOAD_DIR.iterdir():
-            if file_path.is_file():
-                files.append({
-                    "name": file_path.name,
-                    "size": file_path.stat().st_size,
-                    "path": str(file_path)
-                })
+        blobs = await asyncio.to_thread(blob_store.list_blobs)
+        files = [
+            {
+                "name": blob["filenames"][0],
+                "filenames": blob["filenames"],
+                "size": blob["size"],
+                "path": blob["path"],
+                "sha256": blob["sha256"],
+                "created_at": blob["created_at"]
+            }
+            for blob in blobs
+        ]
         return {"files": files}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get files list: {str(e)}")
@@ -293,28 +470,17 @@ async def analyze_git_repository(request: GitRepositoryRequest):
     Analyze Git repository and add to knowledge base
     """
     try:
-        from app.rag.git_repository import GitRepositoryAnalyzer
-        
         # Determine knowledge base
-        if request.kb_id:
-            kb = kb_manager.get_knowledge_base(request.kb_id)
-            if not kb:
-                raise HTTPException(status_code=404, detail=f"Knowledge base not found: {request.kb_id}")
-        else:
-            # Use default knowledge base or create new
-            active_kbs = kb_manager.get_active_knowledge_bases()
-            if not active_kbs:
-                kb = kb_manager.create_knowledge_base("Default Knowledge Base", "Default knowledge base")
-            else:
-                kb = active_kbs[0]
+        kb = await get_upload_knowledge_base(request.kb_id)
         
-        # Create analyzer and process repository
-        analyzer = GitRepositoryAnalyzer()
-        result = analyzer.analyze_repository(
-            repo_url=request.repo_url,
-            username=request.username,
-            token=request.token,
-            kb_id=kb.id
+        # Clone and ingest the repository in the ingestion process pool
+        result = await run_ingestion(
+            analyze_repository,
+            request.repo_url,
+            request.username,
+            request.token,
+            kb.id,
+            request.fetch_mode
         )
         
         return GitRepositoryResponse(
@@ -1,157 +1,81 @@
-import subprocess
-import time
-import psutil
 import os
-import pyautogui
+import sys
+import uuid
 from typing import Annotated
-from mcp.server.fastmcp import FastMCP
 from pydantic import Field
+from mcp.server.fastmcp import Context
 
-mcp = FastMCP()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-def run_powershell_command(command: str, capture_output: bool = True):
-    """execute PowerShell command"""
-    try:
-        cmd = ["powershell", "-Command", command]
-        if capture_output:
-            result = subprocess.run(cmd, capture_output=True, text=True, shell=True)
-            return result.stdout.strip(), result.stderr.strip(), result.returncode
-        else:
-            result = subprocess.run(cmd, shell=True)
-            return "", "", result.returncode
-    except Exception as e:
-        return "", str(e), 1
+from app.utils.mcp_server import ToolServer
+from app.utils.process import SHELL_MAX_TIMEOUT, SHELL_OUTPUT_LIMIT, SHELL_STREAM_LIMIT, SHELL_TIMEOUT, format_command_result
+from app.utils.powershell_session import POWERSHELL_EXECUTABLE, PowerShellSession, powershell_available
+from app.utils.sandbox import ToolSandbox, ToolLimitError, TOOL_MAX_OUTPUT_MB
+from app.utils.shell_session import ShellSessionManager
 
-def get_powershell_processes():
-    """get all PowerShell processes"""
-    processes = []
-    for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-        try:
-            if proc.info['name'] and 'powershell' in proc.info['name'].lower():
-                processes.append({
-                    'pid': proc.info['pid'],
-                    'name': proc.info['name'],
-                    'cmdline': proc.info['cmdline']
-                })
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            pass
-    return processes
+mcp = ToolServer("powershell_tools")
+sandbox = ToolSandbox()
+powershell_sessions = ShellSessionManager(sandbox=sandbox, session_class=PowerShellSession)
+mcp.health_sources.update(
+    sandbox=sandbox.stats,
+    powershell_sessions=powershell_sessions.stats,
+    powershell=lambda: POWERSHELL_EXECUTABLE,
+)
 
-def activate_powershell_window():
-    """activate PowerShell window"""
-    try:
-        pyautogui.FAILSAFE = True
-        pyautogui.PAUSE = 0.1
-        
-        windows = pyautogui.getWindowsWithTitle('Windows PowerShell')
-        if not windows:
-            windows = pyautogui.getWindowsWithTitle('PowerShell')
-        
-        if windows:
-            window = windows[0]
-            window.activate()
-            time.sleep(0.5)
-            return True
-        else:
-            pyautogui.hotkey('alt', 'tab')
-            time.sleep(0.5)
-            return False
-    except Exception as e:
-        print(f"Failed to activate PowerShell window: {e}")
-        return False
+NOT_INSTALLED = "PowerShell (pwsh) is not installed on this host, use run_shell instead"
 
 
-@mcp.tool(name="get_powershell_processes", description="Get all PowerShell process information")
-def get_all_powershell_processes() -> str:
-    """Get list of all running PowerShell processes"""
+@mcp.tool(name="run_powershell_script", description="Run a PowerShell script in a headless session and return its output. Variables, functions and the current location carry over between scripts of a chat. Long output is truncated in the middle, limit hits and timeouts are returned as JSON errors and reset the session")
+async def run_powershell_script(
+    script: Annotated[str, Field(description="PowerShell script to run", examples="Get-ChildItem | Select-Object Name, Length")],
+    ctx: Context,
+    timeout: Annotated[float, Field(description=f"Seconds before the session is killed, at most {SHELL_MAX_TIMEOUT:g}")] = SHELL_TIMEOUT,
+    session_id: Annotated[str, Field(description="Run in the persistent PowerShell session of this session id")] = None
+) -> str:
+    if not powershell_available():
+        return NOT_INSTALLED
     try:
-        processes = get_powershell_processes()
-        if not processes:
-            return "No PowerShell processes currently running"
+        timeout = min(max(timeout, 1), SHELL_MAX_TIMEOUT)
 
-        result = "PowerShell Process List:\n"
-        for proc in processes:
-            result += f"PID: {proc['pid']}, Name: {proc['name']}\n"
-        return result
-    except Exception as e:
-        return f"Failed to get PowerShell processes: {str(e)}"
+        streamed = 0
+        async def stream_output(text: str):
+            nonlocal streamed
+            streamed += len(text)
+            await ctx.report_progress(streamed, message=text)
 
-@mcp.tool(name="close_powershell", description="close all PowerShell processes")
-def close_all_powershell() -> str:
-    """close all PowerShell processes"""
-    try:
-        processes = get_powershell_processes()
-        
-        if not processes:
-            return "can't find PowerShell process to close"
-        
-        closed_count = 0
-        for proc_info in processes:
+        async with sandbox.slot(session_id):
+            session = await powershell_sessions.get(session_id) if session_id else None
+            # Without a session id, or with every session busy, the script gets a session of its own
+            temporary = session is None
+            if temporary:
+                session = PowerShellSession(f"call-{uuid.uuid4().hex}", sandbox)
+                await session.start()
             try:
-                proc = psutil.Process(proc_info['pid'])
-                proc.terminate()
-                closed_count += 1
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                pass
-        return f"successfully closed {closed_count} PowerShell processes"
+                events = sandbox.cgroup_events(session.cgroup)
+                result = await session.run(script, timeout, SHELL_OUTPUT_LIMIT, stream_output, SHELL_STREAM_LIMIT, TOOL_MAX_OUTPUT_MB * 1024 * 1024)
+                limit = sandbox.check_result(result, session.cgroup, events)
+            finally:
+                if temporary:
+                    await session.close()
+        if limit:
+            raise limit
+        return format_command_result(result)
+    except ToolLimitError:
+        raise
     except Exception as e:
-        return f"Failed to close PowerShell processes: {str(e)}"
+        return f"PowerShell script failed: {e}"
 
-@mcp.tool(name="open_powershell", description="Open new PowerShell window")
-def open_new_powershell(working_directory:
-    Annotated[str, Field(description="Optional working directory, empty for current directory", examples="C:\\Users")] = "") -> str:
-    """Open new PowerShell window"""
-    try:
-        if working_directory and os.path.exists(working_directory):
-            # Open PowerShell in specified directory
-            command = f'Start-Process powershell -WorkingDirectory "{working_directory}"'
-        else:
-            # Open PowerShell in current directory
-            command = 'Start-Process powershell'
 
-        stdout, stderr, returncode = run_powershell_command(command, capture_output=False)
+@mcp.tool(name="reset_powershell_session", description="Close the PowerShell session of this chat, the next script starts with a fresh session")
+async def reset_powershell_session(
+    session_id: Annotated[str, Field(description="Session id whose PowerShell session is closed")] = None
+) -> str:
+    if not powershell_available():
+        return NOT_INSTALLED
+    if session_id and await powershell_sessions.close(session_id):
+        return "PowerShell session closed"
+    return "no PowerShell session to close"
 
-        if returncode != 0 and stderr:
-            return f"Failed to open PowerShell: {stderr}"
-
-        time.sleep(2)  # Wait for window to open
-        processes = get_powershell_processes()
-        return f"PowerShell opened, current running processes: {len(processes)}"
-    except Exception as e:
-        return f"close PowerShell process failed: {str(e)}"
-
-@mcp.tool(name="run_powershell_script", description="Send commands to PowerShell window via pyautogui")
-def run_powershell_script(script: 
-    Annotated[str, Field(description="Script command to execute in PowerShell window", examples="Get-Location")]) -> str:
-    """Send command to active PowerShell window via pyautogui"""
-    try:
-        print("-" * 50)
-        print("run_powershell_script (pyautogui):")
-        print(script)
-        print("-" * 50)
-        
-        processes = get_powershell_processes()
-        if not processes:
-            return "can't find running PowerShell process,please open PowerShell window first."
-        
-        if not activate_powershell_window():
-            return "can't activate PowerShell window,please ensure PowerShell window is open and visible."
-        
-        pyautogui.hotkey('ctrl', 'c') 
-        time.sleep(0.2)
-        
-        pyautogui.press('end')
-        time.sleep(0.1)
-        
-        pyautogui.write(script, interval=0.02)
-        time.sleep(0.3)
-        
-        pyautogui.press('enter')
-        
-        return f"command has been sent to PowerShell window: {script}"
-    except Exception as e:
-        return f"send PowerShell command failed:{str(e)}"
 
 if __name__ == '__main__':
-    mcp.run(transport="stdio")
-
+    mcp.serve()
@@ -1,52 +1,96 @@
 import os
 import sys
-from typing import Annotated, List, Optional
+from typing import Annotated, List, Optional, Tuple
 import hashlib
 from pathlib import Path
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from langchain_core.documents import Document
-from langchain_community.document_loaders import (
-    TextLoader, 
-    Docx2txtLoader,
-    UnstructuredMarkdownLoader,
-    CSVLoader,
-    GitHubIssuesLoader
+from qdrant_client.models import (
+    Distance, VectorParams, SparseVectorParams, SparseVector, Modifier, PointStruct, PayloadSchemaType,
+    Filter, FieldCondition, MatchValue, IsEmptyCondition, PayloadField
 )
-from langchain_community.document_loaders.pdf import PyPDFLoader
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Qdrant
-
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_core.retrievers import BaseRetriever
-from langchain_core.callbacks import CallbackManagerForRetrieverRun
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
 import uuid
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from mcp.server.fastmcp import FastMCP
 from pydantic import Field
 
-from app.rag.knowledge_manager import kb_manager
+from app.rag.knowledge_manager import kb_manager, KnowledgeBaseExistsError
+from app.rag.code_splitter import CodeAwareTextSplitter
+from app.rag.context_packer import pack_context
+from app.rag.vector_store import QDRANT_MODE, get_qdrant_client, get_async_qdrant_client
+from app.rag.payload_filters import PAYLOAD_INDEXES, path_prefixes, normalize_filters, filters_cache_key, build_filter
+from app.rag.index_profiles import get_index_profile, collection_params, search_params
+from app.rag.query_cache import query_embedding_cache, query_result_cache
+from app.rag.parsing import load_document, parse_document, parse_files
+from app.rag.lexical import document_sparse_vector, query_sparse_vector, reciprocal_rank_fusion
+from app.utils.lazy import LazyObject
+from app.utils.mcp_server import ToolServer
 
-mcp = FastMCP()
+mcp = ToolServer("rag_tools")
 
-VECTOR_DB_PATH = "./vector_db"
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+UPSERT_BATCH_SIZE = 64
+BACKFILL_SCROLL_SIZE = 1000
+
+SPARSE_VECTOR_NAME = "bm25"
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "hybrid")
+# Each ranking contributes this many candidates per requested result before fusion
+HYBRID_CANDIDATE_MULTIPLIER = 4
+# Chunks retrieved by query_rag before thresholding, diversification and packing
+RAG_CANDIDATE_COUNT = 20
+
+# Federated search over several knowledge bases
+FEDERATED_TIMEOUT = float(os.getenv("RAG_FEDERATED_TIMEOUT", "5"))
+# Knowledge bases searched per query, each gets a thread of its own so its timeout counts from its start
+FEDERATED_MAX_KBS = 8
+
+# Query embedding runs here so async handlers never run the model on the event loop
+EMBEDDING_WORKERS = int(os.getenv("RAG_EMBEDDING_WORKERS", "2"))
+embedding_executor = ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embedding")
+
+
+def _load_embeddings():
+    # Imported here, it pulls in sentence-transformers and torch
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+# One model instance for every collection, they all embed with EMBEDDING_MODEL
+embeddings = LazyObject(_load_embeddings)
+
+
+def embed_query(query: str) -> List[float]:
+    """Query embedding through the cache, shared by all collections"""
+    key = (EMBEDDING_MODEL, query)
+    vector = query_embedding_cache.get(key)
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        query_embedding_cache.put(key, vector)
+    return vector
+
+# Bulk ingestion embeds and upserts parsed chunks in batches of this size while the parse pool keeps going
+BULK_FLUSH_CHUNKS = 512
 
 class VectorDatabaseManager:
-    def __init__(self, collection_name: str):
+    def __init__(self, collection_name: str, index_profile: str = None):
         self.collection_name = collection_name
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-        self.client = QdrantClient(host="localhost", port=6333)
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        self.index_profile = get_index_profile(index_profile)
+        self.search_params = search_params(self.index_profile)
+        self.embeddings = embeddings
+        self.client = get_qdrant_client()
+        self.async_client = get_async_qdrant_client()
+        self.text_splitter = CodeAwareTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
-            length_function=len,
         )
+        self.has_sparse_index = False
         self._ensure_collection_exists()
-        self._init_vectorstore()
     
     def _ensure_collection_exists(self):
         try:
@@ -56,40 +100,249 @@ class VectorDatabaseManager:
             if self.collection_name not in collection_names:
                 self.client.create_collection(
                     collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=384, distance=Distance.COSINE)
+                    vectors_config=VectorParams(size=EMBEDDING_DIM, distance=Distance.COSINE, on_disk=self.index_profile.on_disk),
+                    sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)},
+                    **collection_params(self.index_profile)
                 )
-                print(f"Created collection: {self.collection_name}")
+                self.has_sparse_index = True
+                self._ensure_payload_indexes({})
+                print(f"Created collection: {self.collection_name} (index profile: {self.index_profile.name})")
             else:
+                collection_info = self.client.get_collection(self.collection_name)
+                sparse_vectors = collection_info.config.params.sparse_vectors
+                self.has_sparse_index = bool(sparse_vectors and SPARSE_VECTOR_NAME in sparse_vectors)
+                if not self.has_sparse_index:
+                    print(f"Collection {self.collection_name} has no lexical index, hybrid search falls back to dense")
+                self._ensure_payload_indexes(collection_info.payload_schema or {}, backfill=True)
                 print(f"Collection {self.collection_name} already exists")
         except Exception as e:
             print(f"Error ensuring collection exists: {e}")
     
-    def _init_vectorstore(self):
-        try:
-            self.vectorstore = Qdrant(
-                client=self.client,
+    def _ensure_payload_indexes(self, existing_schema: dict, backfill: bool = False):
+        for field_name, field_schema in PAYLOAD_INDEXES.items():
+            if field_name not in existing_schema:
+                # Before the index exists, a failed backfill is retried on the next start
+                if backfill and field_name == "metadata.path_prefixes":
+                    self._backfill_path_prefixes()
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=PayloadSchemaType(field_schema)
+                )
+    
+    def _backfill_path_prefixes(self):
+        """Chunks stored before path_prefixes existed get it from their source, one set_payload per source"""
+        missing = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="metadata.path_prefixes"))])
+        sources = set()
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
                 collection_name=self.collection_name,
-                embeddings=self.embeddings,
+                scroll_filter=missing,
+                limit=BACKFILL_SCROLL_SIZE,
+                offset=offset,
+                with_payload=["metadata.source"],
+                with_vectors=False
             )
-        except Exception as e:
-            print(f"Error initializing vectorstore: {e}")
+            for point in points:
+                source = ((point.payload or {}).get("metadata") or {}).get("source")
+                if source:
+                    sources.add(source)
+            if offset is None:
+                break
+        for source in sources:
+            self.client.set_payload(
+                collection_name=self.collection_name,
+                payload={"path_prefixes": path_prefixes(source)},
+                key="metadata",
+                points=Filter(must=[FieldCondition(key="metadata.source", match=MatchValue(value=source))])
+            )
+        if sources:
+            print(f"Backfilled path prefixes of {len(sources)} sources in {self.collection_name}")
     
-    def add_documents(self, documents: List[Document]) -> int:
+    def add_documents(self, documents: List[Document], split: bool = True) -> int:
         try:
-            texts = self.text_splitter.split_documents(documents)
-            print(f"Split {len(documents)} documents into {len(texts)} chunks")
-
-            self.vectorstore.add_documents(texts)
+            if split:
+                texts = self.text_splitter.split_documents(documents)
+                print(f"Split {len(documents)} documents into {len(texts)} chunks")
+            else:
+                texts = documents
+            
+            for i in range(0, len(texts), UPSERT_BATCH_SIZE):
+                batch = texts[i:i + UPSERT_BATCH_SIZE]
+                dense_vectors = self.embeddings.embed_documents([doc.page_content for doc in batch])
+                points = []
+                for doc, dense_vector in zip(batch, dense_vectors):
+                    metadata = dict(doc.metadata)
+                    source = str(metadata.get("source", ""))
+                    metadata.setdefault("file_type", Path(source).suffix.lower())
+                    metadata["path_prefixes"] = path_prefixes(source)
+                    if self.has_sparse_index:
+                        indices, values = document_sparse_vector(doc.page_content)
+                        vector = {"": dense_vector, SPARSE_VECTOR_NAME: SparseVector(indices=indices, values=values)}
+                    else:
+                        vector = dense_vector
+                    points.append(PointStruct(
+                        id=uuid.uuid4().hex,
+                        vector=vector,
+                        # Same payload layout as langchain's Qdrant vectorstore
+                        payload={"page_content": doc.page_content, "metadata": metadata}
+                    ))
+                self.client.upsert(collection_name=self.collection_name, points=points)
             
             return len(texts)
         except Exception as e:
             print(f"Error adding documents: {e}")
             raise e
     
+    def _to_document(self, point) -> Document:
+        payload = point.payload or {}
+        metadata = dict(payload.get("metadata") or {})
+        metadata.pop("path_prefixes", None)
+        metadata["_id"] = point.id
+        metadata["_collection_name"] = self.collection_name
+        return Document(page_content=payload.get("page_content", ""), metadata=metadata)
+    
+    def embed_query(self, query: str) -> List[float]:
+        return embed_query(query)
+    
+    async def aembed_query(self, query: str) -> List[float]:
+        """Cache lookup on the event loop, model inference on the bounded embedding executor"""
+        key = (EMBEDDING_MODEL, query)
+        vector = query_embedding_cache.get(key)
+        if vector is None:
+            # The model directly, embed_query would look the query up again and count a second miss
+            vector = await asyncio.get_running_loop().run_in_executor(embedding_executor, self.embeddings.embed_query, query)
+            query_embedding_cache.put(key, vector)
+        return vector
+    
+    def _dense_request(self, query_vector: List[float], k: int, filters: dict) -> dict:
+        return dict(
+            collection_name=self.collection_name,
+            query=query_vector,
+            query_filter=build_filter(filters),
+            limit=k,
+            search_params=self.search_params,
+            with_payload=True
+        )
+    
+    def _lexical_request(self, query: str, k: int, filters: dict) -> Optional[dict]:
+        indices, values = query_sparse_vector(query)
+        if not self.has_sparse_index or not indices:
+            return None
+        return dict(
+            collection_name=self.collection_name,
+            query=SparseVector(indices=indices, values=values),
+            using=SPARSE_VECTOR_NAME,
+            query_filter=build_filter(filters),
+            limit=k,
+            with_payload=True
+        )
+    
+    async def _aquery_points(self, request: dict):
+        if self.async_client is not None:
+            return await self.async_client.query_points(**request)
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: self.client.query_points(**request))
+    
+    def dense_search(self, query: str, k: int = 5, filters: dict = None) -> List[Tuple[Document, float]]:
+        response = self.client.query_points(**self._dense_request(self.embed_query(query), k, filters))
+        return [(self._to_document(point), point.score) for point in response.points]
+    
+    async def adense_search(self, query: str, k: int = 5, filters: dict = None) -> List[Tuple[Document, float]]:
+        query_vector = await self.aembed_query(query)
+        response = await self._aquery_points(self._dense_request(query_vector, k, filters))
+        return [(self._to_document(point), point.score) for point in response.points]
+    
+    def lexical_search(self, query: str, k: int = 5, filters: dict = None) -> List[Tuple[Document, float]]:
+        request = self._lexical_request(query, k, filters)
+        if request is None:
+            return []
+        response = self.client.query_points(**request)
+        return [(self._to_document(point), point.score) for point in response.points]
+    
+    async def alexical_search(self, query: str, k: int = 5, filters: dict = None) -> List[Tuple[Document, float]]:
+        request = self._lexical_request(query, k, filters)
+        if request is None:
+            return []
+        response = await self._aquery_points(request)
+        return [(self._to_document(point), point.score) for point in response.points]
+    
+    def _resolve_mode(self, mode: Optional[str]) -> str:
+        mode = mode or SEARCH_MODE
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unsupported search mode: {mode}. Supported modes: {SEARCH_MODES}")
+        if mode == "lexical" and not self.has_sparse_index:
+            raise ValueError(f"Collection {self.collection_name} has no lexical index")
+        if mode == "hybrid" and not self.has_sparse_index:
+            return "dense"
+        return mode
+    
+    def _combine(self, mode: str, dense_results: list, lexical_results: list, k: int, latency: dict) -> List[Tuple[Document, float]]:
+        for doc, score in dense_results:
+            doc.metadata["_dense_score"] = score
+        if mode != "hybrid":
+            return dense_results or lexical_results
+        
+        start = time.perf_counter()
+        documents = {}
+        for doc, _ in dense_results + lexical_results:
+            documents.setdefault(doc.metadata["_id"], doc)
+        fused = reciprocal_rank_fusion([
+            [doc.metadata["_id"] for doc, _ in dense_results],
+            [doc.metadata["_id"] for doc, _ in lexical_results],
+        ])
+        latency["fusion"] = round((time.perf_counter() - start) * 1000, 2)
+        return [(documents[point_id], score) for point_id, score in fused[:k]]
+    
+    def search(self, query: str, k: int = 5, mode: str = None, filters: dict = None) -> Tuple[List[Tuple[Document, float]], dict]:
+        """Search in dense, lexical or hybrid mode, returns (document, score) pairs and per-stage latency in ms"""
+        mode = self._resolve_mode(mode)
+        candidates = k * HYBRID_CANDIDATE_MULTIPLIER if mode == "hybrid" else k
+        latency = {}
+        total_start = time.perf_counter()
+        
+        dense_results, lexical_results = [], []
+        if mode in ("dense", "hybrid"):
+            start = time.perf_counter()
+            dense_results = self.dense_search(query, k=candidates, filters=filters)
+            latency["dense"] = round((time.perf_counter() - start) * 1000, 2)
+        if mode in ("lexical", "hybrid"):
+            start = time.perf_counter()
+            lexical_results = self.lexical_search(query, k=candidates, filters=filters)
+            latency["lexical"] = round((time.perf_counter() - start) * 1000, 2)
+        
+        results = self._combine(mode, dense_results, lexical_results, k, latency)
+        latency["total"] = round((time.perf_counter() - total_start) * 1000, 2)
+        return results, latency
+    
+    async def asearch(self, query: str, k: int = 5, mode: str = None, filters: dict = None) -> Tuple[List[Tuple[Document, float]], dict]:
+        """Non-blocking search, the dense and lexical legs of a hybrid search run concurrently"""
+        mode = self._resolve_mode(mode)
+        candidates = k * HYBRID_CANDIDATE_MULTIPLIER if mode == "hybrid" else k
+        latency = {}
+        total_start = time.perf_counter()
+        
+        async def timed(name, search):
+            start = time.perf_counter()
+            results = await search(query, k=candidates, filters=filters)
+            latency[name] = round((time.perf_counter() - start) * 1000, 2)
+            return results
+        
+        async def skipped():
+            return []
+        
+        dense_results, lexical_results = await asyncio.gather(
+            timed("dense", self.adense_search) if mode in ("dense", "hybrid") else skipped(),
+            timed("lexical", self.alexical_search) if mode in ("lexical", "hybrid") else skipped(),
+        )
+        
+        results = self._combine(mode, dense_results, lexical_results, k, latency)
+        latency["total"] = round((time.perf_counter() - total_start) * 1000, 2)
+        return results, latency
+    
     def similarity_search(self, query: str, k: int = 5) -> List[Document]:
         try:
-            results = self.vectorstore.similarity_search(query, k=k)
-            return results
+            return [doc for doc, _ in self.dense_search(query, k=k)]
         except Exception as e:
             print(f"Error in similarity search: {e}")
             return []
@@ -110,30 +363,36 @@ class RAGManager:
     
     def __init__(self):
         self.vector_managers = {}  
+        self.vector_managers_lock = threading.Lock()
     
-    def get_vector_manager(self, collection_name: str) -> VectorDatabaseManager:
-        if collection_name not in self.vector_managers:
-            self.vector_managers[collection_name] = VectorDatabaseManager(collection_name)
-        return self.vector_managers[collection_name]
+    def get_vector_manager(self, collection_name: str, index_profile: str = None) -> VectorDatabaseManager:
+        with self.vector_managers_lock:
+            if collection_name not in self.vector_managers:
+                self.vector_managers[collection_name] = VectorDatabaseManager(collection_name, index_profile)
+            return self.vector_managers[collection_name]
     
-    def upload_to_knowledge_base(self, kb_id: str, file_path: str) -> dict:
+    def evict_collection(self, collection_name: str):
+        with self.vector_managers_lock:
+            self.vector_managers.pop(collection_name, None)
+    
+    def upload_to_knowledge_base(self, kb_id: str, file_path: str, source_name: str = None) -> dict:
         try:
             kb = kb_manager.get_knowledge_base(kb_id)
             if not kb:
                 raise Exception(f"Knowledge base not found: {kb_id}")
             
-            vector_manager = self.get_vector_manager(kb.collection_name)
+            vector_manager = self.get_vector_manager(kb.collection_name, kb.index_profile)
             
-            documents = load_document(file_path)
+            documents = parse_document(file_path)
+            if source_name:
+                # Stored blobs are named by content hash, cite the uploaded file name instead
+                for document in documents:
+                    document.metadata["source"] = source_name
             
             chunks_count = vector_manager.add_documents(documents)
+            kb_manager.update_kb_stats(kb_id, files_added=1, vectors_added=chunks_count)
             
             collection_info = vector_manager.get_collection_info()
-            kb_manager.update_kb_stats(
-                kb_id, 
-                file_count=kb.file_count + 1,
-                vector_count=collection_info.get("vectors_count", 0)
-            )
             
             return {
                 "success": True,
@@ -149,23 +408,60 @@ class RAGManager:
                 "error": str(e)
             }
     
-    def query_knowledge_base(self, kb_id: str, query: str, k: int = 5) -> dict:
+    def bulk_upload_to_knowledge_base(self, kb_id: str, files: List[Tuple[str, str]]) -> dict:
+        """Ingest (file_path, source_name) pairs, knowledge base stats are updated once at the end"""
         try:
             kb = kb_manager.get_knowledge_base(kb_id)
             if not kb:
                 raise Exception(f"Knowledge base not found: {kb_id}")
             
-            vector_manager = self.get_vector_manager(kb.collection_name)
+            vector_manager = self.get_vector_manager(kb.collection_name, kb.index_profile)
+            results = {}
+            pending = []  # (file index, chunks) waiting for the next flush
+            # Paths are unique, duplicate content is filtered out before ingestion
+            file_indexes = {file_path: index for index, (file_path, _) in enumerate(files)}
+            
+            def flush():
+                chunks = [chunk for _, file_chunks in pending for chunk in file_chunks]
+                try:
+                    vector_manager.add_documents(chunks, split=False)
+                    for index, file_chunks in pending:
+                        results[index] = {"file": files[index][1], "status": "processed", "chunks_count": len(file_chunks)}
+                except Exception as e:
+                    for index, _ in pending:
+                        results[index] = {"file": files[index][1], "status": "failed", "chunks_count": 0, "error": str(e)}
+                pending.clear()
             
-            results = vector_manager.similarity_search(query, k=k)
+            for file_path, documents, error in parse_files(list(file_indexes)):
+                index = file_indexes[file_path]
+                if error:
+                    results[index] = {"file": files[index][1], "status": "failed", "chunks_count": 0, "error": str(error)}
+                    continue
+                for document in documents:
+                    document.metadata["source"] = files[index][1]
+                pending.append((index, vector_manager.text_splitter.split_documents(documents)))
+                if sum(len(chunks) for _, chunks in pending) >= BULK_FLUSH_CHUNKS:
+                    flush()
+            if pending:
+                flush()
+            
+            processed = [result for result in results.values() if result["status"] == "processed"]
+            if processed:
+                kb_manager.update_kb_stats(
+                    kb_id,
+                    files_added=len(processed),
+                    vectors_added=sum(result["chunks_count"] for result in processed)
+                )
+            collection_info = vector_manager.get_collection_info()
             
             return {
                 "success": True,
                 "kb_id": kb_id,
                 "kb_name": kb.name,
-                "query": query,
-                "results": [doc.page_content for doc in results],
-                "total_documents": len(results)
+                "files": [results[index] for index in range(len(files))],
+                "files_processed": len(processed),
+                "chunks_count": sum(result["chunks_count"] for result in processed),
+                "collection_info": collection_info
             }
             
         except Exception as e:
@@ -173,69 +469,203 @@ class RAGManager:
                 "success": False,
                 "error": str(e)
             }
-
-rag_manager = RAGManager()
-
-def load_document(file_path: str) -> List[Document]:
-    """Load document from file path based on file extension"""
-    file_path = Path(file_path)
     
-    if not file_path.exists():
-        raise FileNotFoundError(f"File not found: {file_path}")
+    def query_knowledge_base(self, kb_id: str, query: str, k: int = 5, mode: str = None, filters: dict = None) -> dict:
+        try:
+            kb = kb_manager.get_knowledge_base(kb_id)
+            if not kb:
+                raise Exception(f"Knowledge base not found: {kb_id}")
+            
+            vector_manager = self.get_vector_manager(kb.collection_name, kb.index_profile)
+            
+            # Mode actually searched, hybrid falls back to dense for collections without a lexical index
+            mode = vector_manager._resolve_mode(mode)
+            cache_key = (kb.collection_name, kb.version, query, k, mode, filters_cache_key(filters))
+            cached = query_result_cache.get(cache_key)
+            if cached is not None:
+                results, latency = cached[0], {"total": 0.0, "cache": "hit"}
+            else:
+                results, latency = vector_manager.search(query, k=k, mode=mode, filters=filters)
+                query_result_cache.put(cache_key, (results, latency))
+            
+            return self._query_result(kb, query, mode, results, latency, cached is not None)
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def aquery_knowledge_base(self, kb_id: str, query: str, k: int = 5, mode: str = None, filters: dict = None) -> dict:
+        """query_knowledge_base for async handlers, nothing blocking runs on the event loop"""
+        try:
+            kb = await kb_manager.aget_knowledge_base(kb_id)
+            if not kb:
+                raise Exception(f"Knowledge base not found: {kb_id}")
+            
+            vector_manager = await asyncio.to_thread(self.get_vector_manager, kb.collection_name, kb.index_profile)
+            
+            # Mode actually searched, hybrid falls back to dense for collections without a lexical index
+            mode = vector_manager._resolve_mode(mode)
+            cache_key = (kb.collection_name, kb.version, query, k, mode, filters_cache_key(filters))
+            cached = query_result_cache.get(cache_key)
+            if cached is not None:
+                results, latency = cached[0], {"total": 0.0, "cache": "hit"}
+            else:
+                results, latency = await vector_manager.asearch(query, k=k, mode=mode, filters=filters)
+                query_result_cache.put(cache_key, (results, latency))
+            
+            return self._query_result(kb, query, mode, results, latency, cached is not None)
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
     
-    file_extension = file_path.suffix.lower()
+    def _query_result(self, kb, query: str, mode: str, results: List[Tuple[Document, float]], latency: dict, cached: bool) -> dict:
+        return {
+            "success": True,
+            "kb_id": kb.id,
+            "kb_name": kb.name,
+            "query": query,
+            "mode": mode,
+            "results": [doc.page_content for doc, _ in results],
+            "matches": [
+                {"content": doc.page_content, "metadata": doc.metadata, "score": score}
+                for doc, score in results
+            ],
+            "total_documents": len(results),
+            "latency_ms": latency,
+            "cached": cached
+        }
     
-    try:
-        if file_extension == '.txt':
-            loader = TextLoader(str(file_path), encoding='utf-8')
-        elif file_extension == '.pdf':
-            loader = PyPDFLoader(str(file_path))
-        elif file_extension in ['.docx', '.doc']:
-            loader = Docx2txtLoader(str(file_path))
-        elif file_extension == '.md':
-            loader = UnstructuredMarkdownLoader(str(file_path))
-        elif file_extension == '.csv':
-            loader = CSVLoader(str(file_path))
-        elif file_extension == '.github':
-            loader = GitHubIssuesLoader(repo_name="langchain-ai/langchain", access_token=os.getenv("access_token"), max_issues=10)
+    def query_knowledge_bases(self, kb_ids: List[str], query: str, k: int = 5, mode: str = None,
+                              filters: dict = None, timeout: float = None) -> dict:
+        """Search several knowledge bases concurrently and merge their rankings with reciprocal rank fusion"""
+        timeout = timeout or FEDERATED_TIMEOUT
+        start = time.perf_counter()
+        if (mode or SEARCH_MODE) != "lexical":
+            # Embedded once up front, the searches of every knowledge base find it in the cache.
+            # A cold model load is not charged to the per-collection timeout
+            try:
+                embed_query(query)
+            except Exception as e:
+                return {"success": False, "error": f"Failed to embed the query: {e}"}
+        embedded = time.perf_counter()
+        kb_ids = list(dict.fromkeys(kb_ids))
+        errors = {kb_id: f"not searched, at most {FEDERATED_MAX_KBS} knowledge bases per query" for kb_id in kb_ids[FEDERATED_MAX_KBS:]}
+        kb_ids = kb_ids[:FEDERATED_MAX_KBS]
+        # A pool per call: searches start right away instead of queueing behind other chats, and
+        # stragglers past the timeout finish on threads of their own without holding anyone's workers
+        executor = ThreadPoolExecutor(max_workers=max(len(kb_ids), 1), thread_name_prefix="kb-search")
+        try:
+            futures = {
+                executor.submit(self.query_knowledge_base, kb_id, query, k, mode, filters): kb_id
+                for kb_id in kb_ids
+            }
+            done, not_done = wait(futures, timeout=timeout)
+        finally:
+            executor.shutdown(wait=False)
+        
+        rankings = {}
+        kb_names = []
+        names = {}
+        modes = {}
+        latency = {}
+        for future in done:
+            kb_id = futures[future]
+            result = future.result()
+            if not result["success"]:
+                errors[kb_id] = result["error"]
+                continue
+            kb_names.append(result["kb_name"])
+            names[kb_id] = result["kb_name"]
+            modes[kb_id] = result["mode"]
+            latency[kb_id] = result["latency_ms"].get("total", 0.0)
+            rankings[kb_id] = result["matches"]
+        for future in not_done:
+            errors[futures[future]] = f"timed out after {timeout}s"
+        
+        if not kb_names and errors:
+            return {"success": False, "error": "; ".join(f"{kb_id}: {error}" for kb_id, error in errors.items())}
+        
+        if len(rankings) == 1:
+            matches = next(iter(rankings.values()))[:k]
         else:
-            raise ValueError(f"Unsupported file type: {file_extension}")
+            # Scores are on different scales per knowledge base (RRF for hybrid, cosine for dense), so only ranks are merged
+            fused = reciprocal_rank_fusion([
+                [(kb_id, rank) for rank in range(len(kb_matches))] for kb_id, kb_matches in rankings.items()
+            ])
+            matches = []
+            for (kb_id, rank), score in fused[:k]:
+                match = rankings[kb_id][rank]
+                # Cite the knowledge base only when results come from more than one
+                matches.append(dict(match, kb_name=names[kb_id], kb_score=match["score"], score=score))
+        latency["embedding"] = round((embedded - start) * 1000, 2)
+        latency["total"] = round((time.perf_counter() - start) * 1000, 2)
         
-        documents = loader.load()
-        return documents
+        return {
+            "success": True,
+            "kb_names": kb_names,
+            "query": query,
+            "modes": modes,
+            "results": [match["content"] for match in matches],
+            "matches": matches,
+            "total_documents": len(matches),
+            "latency_ms": latency,
+            "errors": errors
+        }
     
-    except Exception as e:
-        raise Exception(f"Error loading document {file_path}: {str(e)}")
+    def get_cache_stats(self) -> dict:
+        return {
+            "query_embeddings": query_embedding_cache.stats(),
+            "query_results": query_result_cache.stats()
+        }
+
+rag_manager = LazyObject(RAGManager)
 
 @mcp.tool(name="query_rag", description="Query knowledge base using vector similarity search")
-def query_rag(query: Annotated[str, Field(description="Query content to search in knowledge base", examples="terminal operation standards")]) -> str:
+def query_rag(
+    query: Annotated[str, Field(description="Query content to search in knowledge base", examples="terminal operation standards")],
+    kb_ids: Annotated[Optional[List[str]], Field(description="Knowledge base ids to search, all active knowledge bases when empty")] = None,
+    file_types: Annotated[Optional[List[str]], Field(description="Only search these file extensions", examples=[".py", ".md"])] = None,
+    path_prefix: Annotated[Optional[str], Field(description="Only search files under this path", examples="src/api")] = None,
+    repository: Annotated[Optional[str], Field(description="Only search this git repository (project name)", examples="agent-code")] = None,
+    symbol: Annotated[Optional[str], Field(description="Only search code chunks defining this function or class (git repositories)", examples="KnowledgeManager.get_knowledge_base")] = None
+) -> str:
     """Query the knowledge base using vector similarity search"""
     try:
         print("-" * 60)
         print(f"[query_rag] Query: {query}")
+        if file_types or path_prefix or repository or symbol:
+            print(f"[query_rag] Filters: file_types={file_types}, path_prefix={path_prefix}, repository={repository}, symbol={symbol}")
         print("-" * 60)
         
-        active_kbs = kb_manager.get_active_knowledge_bases()
-        if not active_kbs:
-            return "No active knowledge bases found."
+        if not kb_ids:
+            active_kbs = kb_manager.get_active_knowledge_bases()
+            if not active_kbs:
+                return "No active knowledge bases found."
+            kb_ids = [kb.id for kb in active_kbs[:FEDERATED_MAX_KBS]]
         
-        default_kb = active_kbs[0]
-        result = rag_manager.query_knowledge_base(default_kb.id, query, k=5)
+        filters = normalize_filters(file_types, path_prefix, repository, symbol)
+        result = rag_manager.query_knowledge_bases(kb_ids, query, k=RAG_CANDIDATE_COUNT, filters=filters)
         
         if not result["success"]:
             return f"Error querying knowledge base: {result['error']}"
         
-        if not result["results"]:
+        context, stats = pack_context(result["matches"])
+        if not context:
             return "No relevant documents found in the knowledge base."
         
-        result_text = f"Knowledge Base: {result['kb_name']}\n"
+        result_text = f"Knowledge Base: {', '.join(result['kb_names'])}\n"
         result_text += "-" * 40 + "\n"
+        result_text += context
         
-        for i, content in enumerate(result["results"], 1):
-            result_text += f"Document {i}:\n{content}\n"
-            result_text += "-" * 40 + "\n"
-        
-        print(f"Found {len(result['results'])} relevant documents")
+        print(f"Found {len(result['results'])} relevant documents (modes {result['modes']}, {result['latency_ms']} ms)")
+        print(f"Packed context: {stats}")
+        if result["errors"]:
+            print(f"Knowledge bases skipped: {result['errors']}")
         print(result_text)
         print("-" * 60)
         
@@ -256,8 +686,11 @@ def upload_file_to_rag(file_path: Annotated[str, Field(description="Path to loca
         
         active_kbs = kb_manager.get_active_knowledge_bases()
         if not active_kbs:
-            default_kb = kb_manager.create_knowledge_base("Default Knowledge Base", "默认知识库")
-            print(f"Created default knowledge base: {default_kb.name}")
+            try:
+                default_kb = kb_manager.create_knowledge_base("Default Knowledge Base", "默认知识库")
+                print(f"Created default knowledge base: {default_kb.name}")
+            except KnowledgeBaseExistsError:
+                default_kb = kb_manager.get_kb_by_name("Default Knowledge Base")
         else:
             default_kb = active_kbs[0]
         
@@ -279,4 +712,7 @@ def upload_file_to_rag(file_path: Annotated[str, Field(description="Path to loca
         return error_msg
 
 if __name__ == '__main__':
-    mcp.run(transport="stdio") 
\ No newline at end of file
+    if QDRANT_MODE != "remote":
+        # The API process owns embedded storage and serves these tools in-process
+        sys.exit(f"rag_tools cannot run as a separate process with QDRANT_MODE={QDRANT_MODE}, use a Qdrant server (QDRANT_MODE=remote)")
+    mcp.serve()
\ No newline at end of file
@@ -1,23 +1,69 @@
-import subprocess
 import shlex
-from mcp.server.fastmcp import FastMCP
+import os
+import sys
 from pydantic import Field
 from typing import Annotated
-mcp = FastMCP()
+from mcp.server.fastmcp import Context
 
-@mcp.tool(name="run_shell", description="Run a shell command")
-def run_shell_cmd(cmd:Annotated[str, Field(description="shell command will be executed",examples="ls -al")]) -> str:
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.utils.mcp_server import ToolServer
+from app.utils.process import SHELL_MAX_TIMEOUT, SHELL_OUTPUT_LIMIT, SHELL_STREAM_LIMIT, SHELL_TIMEOUT, format_command_result, run_command
+from app.utils.shell_session import ShellSessionManager, sessions_supported
+from app.utils.sandbox import ToolSandbox, ToolLimitError, TOOL_MAX_OUTPUT_MB
+
+mcp = ToolServer("shell_tools")
+sandbox = ToolSandbox()
+shell_sessions = ShellSessionManager(sandbox=sandbox)
+mcp.health_sources.update(sandbox=sandbox.stats, shell_sessions=shell_sessions.stats)
+
+
+@mcp.tool(name="run_shell", description="Run a shell command. Long output is truncated in the middle. Commands run with CPU, memory and file limits and are killed after the timeout, limit hits are returned as JSON errors")
+async def run_shell_cmd(
+    cmd: Annotated[str, Field(description="shell command will be executed", examples="ls -al")],
+    ctx: Context,
+    timeout: Annotated[float, Field(description=f"Seconds before the command is killed, at most {SHELL_MAX_TIMEOUT:g}")] = SHELL_TIMEOUT,
+    session_id: Annotated[str, Field(description="Run in the persistent shell of this session, cwd and environment carry over between commands")] = None
+) -> str:
     try:
         shell_cmd=shlex.split(cmd)
         if "rm" in shell_cmd:
             raise Exception("rm is not allowed")
-        res = subprocess.run(cmd, shell=True,capture_output=True, text=True) 
-        if res.returncode != 0:
-            return res.stderr
-        else:
-            return res.stdout
+        timeout = min(max(timeout, 1), SHELL_MAX_TIMEOUT)
+
+        # Output chunks reach the client as progress notifications, progress counts streamed bytes
+        streamed = 0
+        async def stream_output(text: str):
+            nonlocal streamed
+            streamed += len(text)
+            await ctx.report_progress(streamed, message=text)
+
+        max_output = TOOL_MAX_OUTPUT_MB * 1024 * 1024
+        async with sandbox.slot(session_id):
+            session = await shell_sessions.get(session_id) if session_id and sessions_supported() else None
+            if session:
+                events = sandbox.cgroup_events(session.cgroup)
+                result = await session.run(cmd, timeout, SHELL_OUTPUT_LIMIT, stream_output, SHELL_STREAM_LIMIT, max_output)
+                limit = sandbox.check_result(result, session.cgroup, events)
+            else:
+                cgroup = sandbox.create_cgroup()
+                try:
+                    result = await run_command(
+                        cmd, timeout, SHELL_OUTPUT_LIMIT, stream_output, SHELL_STREAM_LIMIT,
+                        preexec_fn=sandbox.preexec(cgroup) if os.name == "posix" else None,
+                        max_output=max_output
+                    )
+                    limit = sandbox.check_result(result, cgroup)
+                finally:
+                    sandbox.remove_cgroup(cgroup)
+        if limit:
+            raise limit
+        return format_command_result(result)
+    except ToolLimitError:
+        # Raised so the client receives it as a tool error
+        raise
     except Exception as e:
         return str(e)
 
 if __name__ == '__main__':
-    mcp.run(transport="stdio")
\ No newline at end of file
+    mcp.serve()
@@ -0,0 +1,74 @@
+import os
+import zlib
+import lzma
+import tarfile
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import IO, Callable, ContextManager, Iterator, Optional, Tuple
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+MAX_ARCHIVE_SIZE = int(os.getenv("MAX_ARCHIVE_SIZE_MB", "500")) * 1024 * 1024
+# Guards against archive bombs, checked against the sizes declared in the archive
+MAX_ARCHIVE_MEMBERS = int(os.getenv("MAX_ARCHIVE_MEMBERS", "5000"))
+MAX_ARCHIVE_EXTRACTED_SIZE = int(os.getenv("MAX_ARCHIVE_EXTRACTED_SIZE_MB", "2048")) * 1024 * 1024
+# Raised while opening or reading one member: encrypted or unsupported zip entries (RuntimeError,
+# NotImplementedError), CRC mismatches (BadZipFile), corrupt or truncated compressed data
+MEMBER_ERRORS = (RuntimeError, zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error, lzma.LZMAError, OSError)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _member_name(name: str) -> Optional[str]:
+    """Archive-relative posix path, None for hidden files and paths escaping the archive root"""
+    path = PurePosixPath(name.replace("\\", "/"))
+    if path.is_absolute() or ".." in path.parts:
+        return None
+    if any(part.startswith(".") or part == "__MACOSX" for part in path.parts):
+        return None
+    return path.as_posix()
+
+
+def iter_archive_members(archive_path: Path, allowed_extensions) -> Iterator[Tuple[str, Callable[[], ContextManager[IO[bytes]]]]]:
+    """Yield (name, open) for the regular files of a zip or tar archive with an allowed extension.
+
+    open() returns the member as a file object, it raises one of MEMBER_ERRORS for a member that
+    cannot be extracted while the other members stay readable.
+    """
+    try:
+        if zipfile.is_zipfile(archive_path):
+            with zipfile.ZipFile(archive_path) as archive:
+                members = [info for info in archive.infolist() if not info.is_dir()]
+                _check_limits(len(members), sum(info.file_size for info in members))
+                for info in members:
+                    name = _member_name(info.filename)
+                    if name and Path(name).suffix.lower() in allowed_extensions:
+                        yield name, lambda info=info: archive.open(info)
+        elif tarfile.is_tarfile(archive_path):
+            with tarfile.open(archive_path) as archive:
+                members = [info for info in archive.getmembers() if info.isfile()]
+                _check_limits(len(members), sum(info.size for info in members))
+                for info in members:
+                    name = _member_name(info.name)
+                    if name and Path(name).suffix.lower() in allowed_extensions:
+                        yield name, lambda info=info: archive.extractfile(info)
+        else:
+            raise ArchiveError(f"Not a zip or tar archive: {archive_path.name}")
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, zlib.error, lzma.LZMAError) as e:
+        # The archive itself is unreadable, e.g. a corrupt central directory or a truncated tar
+        raise ArchiveError(f"Corrupt archive {archive_path.name}: {e}")
+
+
+def _check_limits(member_count: int, extracted_size: int):
+    if member_count > MAX_ARCHIVE_MEMBERS:
+        raise ArchiveError(f"Archive has {member_count} files, the limit is {MAX_ARCHIVE_MEMBERS}")
+    if extracted_size > MAX_ARCHIVE_EXTRACTED_SIZE:
+        raise ArchiveError(
+            f"Archive expands to {extracted_size // 1024 // 1024} MB, "
+            f"the limit is {MAX_ARCHIVE_EXTRACTED_SIZE // 1024 // 1024} MB"
+        )
@@ -0,0 +1,179 @@
+import os
+import json
+import uuid
+import hashlib
+import time
+import asyncio
+from pathlib import Path
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import redis
+
+from app.utils.lazy import LazyObject
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "./uploads"))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE_MB", "100")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# A stored blob counts as referenced this long, until its upload has added it to a knowledge base file set
+BLOB_PENDING_TTL = int(os.getenv("BLOB_PENDING_TTL", "3600"))
+BLOB_LOCK_TIMEOUT = 60
+
+# KEYS: blob index, filename set, pending set. ARGV: blob key, record, filename, now. The first record of
+# a blob is kept, filenames are added to a set so concurrent uploads of the same content all keep theirs
+SAVE_BLOB_SCRIPT = """
+redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2])
+redis.call('SADD', KEYS[2], ARGV[3])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+return redis.call('HGET', KEYS[1], ARGV[1])
+"""
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+class BlobStore:
+    """Content-addressed upload storage, blobs live at <root>/<sha256[:2]>/<sha256><ext>.
+
+    A blob is identified by digest and extension together, its file name, since the same bytes
+    uploaded as .py and .txt are stored and parsed as two files.
+    """
+
+    def __init__(self, root: Path = UPLOAD_DIR, max_size: int = MAX_UPLOAD_SIZE):
+        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.redis_client = redis.from_url(redis_url)
+        self.root = root.resolve()
+        self.tmp_dir = self.root / ".tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.index_key = "upload_blobs"
+        self.pending_key = "upload_blobs:pending"
+        self._save_script = self.redis_client.register_script(SAVE_BLOB_SCRIPT)
+
+    def blob_key(self, digest: str, extension: str) -> str:
+        return f"{digest}{extension}"
+
+    def blob_path(self, digest: str, extension: str) -> Path:
+        return self.root / digest[:2] / self.blob_key(digest, extension)
+
+    def _filenames_key(self, blob_key: str) -> str:
+        return f"{self.index_key}:filenames:{blob_key}"
+
+    def _lock(self, blob_key: str):
+        """Serializes storing a blob with removing it"""
+        return self.redis_client.lock(f"{self.index_key}:lock:{blob_key}", timeout=BLOB_LOCK_TIMEOUT, blocking_timeout=BLOB_LOCK_TIMEOUT)
+
+    async def spool_upload(self, upload, max_size: int = None) -> Tuple[Path, str, int]:
+        """Stream an upload to a temporary file while hashing it, the caller removes the file"""
+        max_size = max_size or self.max_size
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as buffer:
+                while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    self._check_size(size, max_size)
+                    sha256.update(chunk)
+                    await asyncio.to_thread(buffer.write, chunk)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return tmp_path, sha256.hexdigest(), size
+
+    async def save_upload(self, upload, filename: str) -> Dict[str, object]:
+        """Store an upload, returns the blob record and whether the content was new"""
+        tmp_path, digest, size = await self.spool_upload(upload)
+        try:
+            return await asyncio.to_thread(self._commit, tmp_path, digest, Path(filename).suffix.lower(), size, filename)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def save_file(self, fileobj, filename: str) -> Dict[str, object]:
+        """Blocking counterpart of save_upload for file objects such as archive members"""
+        tmp_path = self.tmp_dir / uuid.uuid4().hex
+        sha256 = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, "wb") as buffer:
+                while chunk := fileobj.read(UPLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    self._check_size(size, self.max_size)
+                    sha256.update(chunk)
+                    buffer.write(chunk)
+            return self._commit(tmp_path, sha256.hexdigest(), Path(filename).suffix.lower(), size, filename)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _check_size(self, size: int, max_size: int):
+        if size > max_size:
+            raise UploadTooLargeError(f"File exceeds the maximum upload size of {max_size // 1024 // 1024} MB")
+
+    def _commit(self, tmp_path: Path, digest: str, extension: str, size: int, filename: str) -> Dict[str, object]:
+        path = self.blob_path(digest, extension)
+        key = self.blob_key(digest, extension)
+        record = {
+            "sha256": digest,
+            "extension": extension,
+            "size": size,
+            "path": str(path),
+            "created_at": datetime.now().isoformat()
+        }
+        with self._lock(key):
+            created = not path.exists()
+            if created:
+                path.parent.mkdir(exist_ok=True)
+                os.replace(tmp_path, path)
+            # Marked pending in the same step, the garbage collector leaves the blob alone until it is referenced
+            stored = self._save_script(keys=[self.index_key, self._filenames_key(key), self.pending_key], args=[key, json.dumps(record), filename, time.time()])
+        return {**self._with_filenames(json.loads(stored), self.redis_client.smembers(self._filenames_key(key))), "created": created}
+
+    def _with_filenames(self, record: Dict[str, object], filenames: set) -> Dict[str, object]:
+        # Records written before filenames moved to a set carry them inline
+        filenames = set(record.get("filenames", [])) | {name.decode() for name in filenames}
+        return {**record, "filenames": sorted(filenames)}
+
+    def get_blob(self, blob_key: str) -> Optional[Dict[str, object]]:
+        data = self.redis_client.hget(self.index_key, blob_key)
+        return self._with_filenames(json.loads(data), self.redis_client.smembers(self._filenames_key(blob_key))) if data else None
+
+    def list_blobs(self) -> List[Dict[str, object]]:
+        records = self.redis_client.hgetall(self.index_key)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in records:
+            pipe.smembers(self._filenames_key(key.decode()))
+        return [self._with_filenames(json.loads(data), filenames) for data, filenames in zip(records.values(), pipe.execute())]
+
+    def remove_unreferenced(self, file_path: str, referenced: Callable[[], bool]) -> bool:
+        """Delete a blob unless referenced() or an upload stored it within BLOB_PENDING_TTL, returns whether it was deleted.
+
+        Runs under the blob lock, an upload deduplicated onto this blob either marked it pending before
+        the check or stores the file again afterwards.
+        """
+        key = Path(file_path).name
+        with self._lock(key):
+            stored_at = self.redis_client.zscore(self.pending_key, key)
+            if stored_at and stored_at > time.time() - BLOB_PENDING_TTL:
+                return False
+            if referenced():
+                return False
+            Path(file_path).unlink(missing_ok=True)
+            self.forget(file_path)
+            return True
+
+    def forget(self, file_path: str):
+        """Drop the index entry of a removed blob"""
+        key = Path(file_path).name
+        pipe = self.redis_client.pipeline()
+        pipe.hdel(self.index_key, key)
+        pipe.delete(self._filenames_key(key))
+        pipe.zrem(self.pending_key, key)
+        pipe.execute()
+        # Entries written before blobs were keyed by extension too are keyed by digest alone
+        legacy = self.redis_client.hget(self.index_key, Path(file_path).stem)
+        if legacy and json.loads(legacy).get("path") == str(Path(file_path)):
+            self.redis_client.hdel(self.index_key, Path(file_path).stem)
+
+
+blob_store = LazyObject(BlobStore)
@@ -0,0 +1,268 @@
+import ast
+import re
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple, NamedTuple
+
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+_MODIFIERS = (
+    r"(?:(?:export|default|public|private|protected|internal|static|final|abstract|async|"
+    r"override|open|sealed|virtual|partial|readonly|unsafe|inline|data|suspend|pub(?:\([^)]*\))?)\s+)*"
+)
+_INDENT = r"^(?P<indent>[ \t]*)"
+
+# Words that look like a return type or a function name in c-like code but are statements
+_NON_SYMBOL_WORDS = {
+    "if", "else", "for", "foreach", "while", "do", "switch", "case", "catch", "try", "return",
+    "throw", "new", "delete", "goto", "sizeof", "typeof", "await", "yield", "using", "lock",
+    "function", "synchronized", "with", "elif", "when", "match", "assert"
+}
+
+_C_LIKE_FUNCTION = _INDENT + _MODIFIERS + r"(?:<[^>]+>\s+)?(?P<type>[\w.:<>\[\],?*&]+)\s+[*&]?(?P<name>[\w:~]+)\s*\([^;]*$"
+_C_LIKE_TYPE = _INDENT + _MODIFIERS + r"(?:class|interface|enum|record|struct|union|namespace)\s+(?P<name>\w+)"
+
+LANGUAGE_PATTERNS = {
+    "python": [
+        _INDENT + r"(?:async\s+)?(?:def|class)\s+(?P<name>\w+)",
+    ],
+    "js": [
+        _INDENT + _MODIFIERS + r"(?:function\*?|class|interface|enum|type|namespace)\s+(?P<name>[\w$]+)",
+        _INDENT + _MODIFIERS + r"(?:const|let|var)\s+(?P<name>[\w$]+)\s*(?::[^=]+)?=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*(?::[^=]+)?=>|[\w$]+\s*=>)",
+        r"^(?P<indent>[ \t]+)" + _MODIFIERS + r"(?:get\s+|set\s+)?(?P<name>[\w$]+)\s*(?:<[^>]*>)?\([^;]*\)\s*(?::[^{;]+)?\{\s*$",
+    ],
+    "go": [
+        _INDENT + r"func\s+(?:\([^)]*\)\s*)?(?P<name>\w+)",
+        _INDENT + r"type\s+(?P<name>\w+)",
+    ],
+    "c_like": [_C_LIKE_TYPE, _C_LIKE_FUNCTION],
+    "kotlin": [
+        _INDENT + _MODIFIERS + r"(?:fun|class|interface|object|enum\s+class)\s+(?:<[^>]+>\s*)?(?:[\w.]+\.)?(?P<name>\w+)",
+    ],
+    "scala": [
+        _INDENT + _MODIFIERS + r"(?:def|class|trait|object|case\s+class)\s+(?P<name>\w+)",
+    ],
+    "swift": [
+        _INDENT + _MODIFIERS + r"(?:func|class|struct|enum|protocol|extension)\s+(?P<name>\w+)",
+    ],
+    "rust": [
+        _INDENT + _MODIFIERS + r"(?:fn|struct|enum|trait|mod|impl(?:\s*<[^>]*>)?)\s+(?P<name>[\w:]+)",
+    ],
+    "php": [
+        _INDENT + _MODIFIERS + r"function\s+&?(?P<name>\w+)",
+        _INDENT + _MODIFIERS + r"(?:class|interface|trait)\s+(?P<name>\w+)",
+    ],
+    "ruby": [
+        _INDENT + r"(?:def\s+(?:self\.)?(?P<name>[\w?!=]+)|(?:class|module)\s+(?P<type_name>[\w:]+))",
+    ],
+    "shell": [
+        _INDENT + r"(?:function\s+(?P<name>[\w-]+)|(?P<type_name>[\w-]+)\s*\(\)\s*\{?)",
+    ],
+}
+
+LANGUAGE_BY_EXTENSION = {
+    ".py": "python",
+    ".js": "js", ".jsx": "js", ".mjs": "js", ".ts": "js", ".tsx": "js",
+    ".go": "go",
+    ".java": "c_like", ".cs": "c_like", ".c": "c_like", ".h": "c_like", ".cpp": "c_like", ".hpp": "c_like",
+    ".kt": "kotlin",
+    ".scala": "scala",
+    ".swift": "swift",
+    ".rs": "rust",
+    ".php": "php",
+    ".rb": "ruby",
+    ".sh": "shell",
+}
+
+# Lines directly above a definition that belong to it (comments, decorators, annotations)
+_LEADING_PREFIXES = {
+    "python": ("#", "@"),
+    "ruby": ("#",),
+    "shell": ("#",),
+}
+_DEFAULT_LEADING_PREFIXES = ("//", "/*", "*", "@", "#[")
+
+
+class _Boundary(NamedTuple):
+    line: int
+    indent: int
+    name: str
+
+
+class _Block(NamedTuple):
+    start: int
+    end: int
+    symbol: Optional[str]
+
+
+class CodeAwareTextSplitter:
+    """Split source code on function, class and block boundaries, other documents with the character splitter"""
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+        self.chunk_size = chunk_size
+        self.fallback_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            length_function=len,
+        )
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        chunks = []
+        for document in documents:
+            language = self.detect_language(document)
+            for text, start_line, end_line, symbol in self.split_text(document.page_content, language):
+                metadata = dict(document.metadata)
+                metadata.update({"start_line": start_line, "end_line": end_line})
+                if language:
+                    metadata["language"] = language
+                if symbol:
+                    metadata["symbol"] = symbol
+                chunks.append(Document(page_content=text, metadata=metadata))
+        return chunks
+
+    def detect_language(self, document: Document) -> Optional[str]:
+        extension = document.metadata.get("file_type") or Path(str(document.metadata.get("source", ""))).suffix
+        return LANGUAGE_BY_EXTENSION.get(extension.lower())
+
+    def split_text(self, text: str, language: Optional[str] = None) -> List[Tuple[str, int, int, Optional[str]]]:
+        """Return (text, start_line, end_line, symbol) chunks, line numbers are 1-based and inclusive"""
+        if not text.strip():
+            return []
+
+        if language is None:
+            return self._fallback_split(text, 1, None)
+
+        lines = text.splitlines(keepends=True)
+        try:
+            boundaries = self._find_boundaries(text, lines, language)
+        except Exception as e:
+            logger.warning(f"failed to parse {language} code, using character splitter: {e}")
+            return self._fallback_split(text, 1, None)
+
+        blocks = self._segment(lines, boundaries, 1, len(lines), None, top_level=True)
+        return self._merge_blocks(lines, blocks)
+
+    def _find_boundaries(self, text: str, lines: List[str], language: str) -> List[_Boundary]:
+        if language == "python":
+            try:
+                return self._python_boundaries(text)
+            except SyntaxError:
+                pass
+
+        patterns = [re.compile(pattern) for pattern in LANGUAGE_PATTERNS[language]]
+        prefixes = _LEADING_PREFIXES.get(language, _DEFAULT_LEADING_PREFIXES)
+        boundaries = []
+        for line_no, line in enumerate(lines, 1):
+            for pattern in patterns:
+                match = pattern.match(line)
+                if not match:
+                    continue
+                groups = match.groupdict()
+                name = groups.get("name") or groups.get("type_name")
+                if not name or name in _NON_SYMBOL_WORDS or groups.get("type") in _NON_SYMBOL_WORDS:
+                    continue
+                indent = len(groups["indent"].expandtabs(4))
+                start = self._extend_to_leading_lines(lines, line_no, prefixes)
+                boundaries.append(_Boundary(start, indent, name))
+                break
+        return boundaries
+
+    def _python_boundaries(self, text: str) -> List[_Boundary]:
+        boundaries = []
+        for node in ast.walk(ast.parse(text)):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+                boundaries.append(_Boundary(start, node.col_offset, node.name))
+        return sorted(boundaries)
+
+    def _extend_to_leading_lines(self, lines: List[str], line_no: int, prefixes: Tuple[str, ...]) -> int:
+        start = line_no
+        while start > 1:
+            previous = lines[start - 2].strip()
+            if not previous or not previous.startswith(prefixes):
+                break
+            start -= 1
+        return start
+
+    def _segment(self, lines: List[str], boundaries: List[_Boundary], start: int, end: int,
+                 parent: Optional[str], top_level: bool = False) -> List[_Block]:
+        """Cut [start, end] at the outermost definitions inside it, descending into blocks that are still too large"""
+        inner = [b for b in boundaries if (start <= b.line if top_level else start < b.line) and b.line <= end]
+        if not inner:
+            return [_Block(start, end, parent)]
+
+        level = min(b.indent for b in inner)
+        heads = []
+        for boundary in inner:
+            if boundary.indent == level and (not heads or boundary.line > heads[-1].line):
+                heads.append(boundary)
+
+        blocks = []
+        if heads[0].line > start:
+            blocks.append(_Block(start, heads[0].line - 1, parent))
+
+        for i, head in enumerate(heads):
+            block_end = heads[i + 1].line - 1 if i + 1 < len(heads) else end
+            symbol = f"{parent}.{head.name}" if parent else head.name
+            if self._length(lines, head.line, block_end) > self.chunk_size:
+                blocks.extend(self._segment(lines, boundaries, head.line, block_end, symbol))
+            else:
+                blocks.append(_Block(head.line, block_end, symbol))
+        return blocks
+
+    def _merge_blocks(self, lines: List[str], blocks: List[_Block]) -> List[Tuple[str, int, int, Optional[str]]]:
+        """Pack adjacent small blocks together, split blocks that are still too large with the character splitter"""
+        chunks = []
+        pending = []
+
+        def flush():
+            if pending:
+                start, end = pending[0].start, pending[-1].end
+                while not lines[start - 1].strip():
+                    start += 1
+                while not lines[end - 1].strip():
+                    end -= 1
+                symbols = [block.symbol for block in pending if block.symbol]
+                symbol = ", ".join(dict.fromkeys(symbols)) or None
+                chunks.append((self._text(lines, start, end), start, end, symbol))
+                pending.clear()
+
+        for block in blocks:
+            if not self._text(lines, block.start, block.end).strip():
+                continue
+            length = self._length(lines, block.start, block.end)
+            if length > self.chunk_size:
+                flush()
+                chunks.extend(self._fallback_split(self._text(lines, block.start, block.end), block.start, block.symbol))
+                continue
+            if pending and self._length(lines, pending[0].start, block.end) > self.chunk_size:
+                flush()
+            pending.append(block)
+        flush()
+
+        return [chunk for chunk in chunks if chunk[0].strip()]
+
+    def _fallback_split(self, text: str, first_line: int, symbol: Optional[str]) -> List[Tuple[str, int, int, Optional[str]]]:
+        chunks = []
+        search_from = 0
+        for chunk in self.fallback_splitter.split_text(text):
+            offset = text.find(chunk, search_from)
+            if offset < 0:
+                offset = search_from
+            start_line = first_line + text.count("\n", 0, offset)
+            end_line = start_line + chunk.rstrip("\n").count("\n")
+            chunks.append((chunk, start_line, end_line, symbol))
+            search_from = offset + 1
+        return chunks
+
+    def _text(self, lines: List[str], start: int, end: int) -> str:
+        return "".join(lines[start - 1:end])
+
+    def _length(self, lines: List[str], start: int, end: int) -> int:
+        return sum(len(line) for line in lines[start - 1:end])
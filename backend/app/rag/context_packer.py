@@ -0,0 +1,183 @@
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from app.rag.lexical import tokenize
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1500"))
+# Minimum dense (cosine) score, chunks found only by the lexical index are not filtered
+MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.3"))
+# 1.0 ranks by relevance only, lower values favour diversity
+MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+MAX_CHUNKS = 8
+# Blocks smaller than this are not worth truncating into the remaining budget
+MIN_BLOCK_TOKENS = 50
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable, estimating tokens from length: {e}")
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _similarity(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def filter_by_score(matches: List[dict], min_score: float = MIN_SCORE) -> List[dict]:
+    return [m for m in matches if m["metadata"].get("_dense_score") is None or m["metadata"]["_dense_score"] >= min_score]
+
+
+def mmr_select(matches: List[dict], limit: int = MAX_CHUNKS, mmr_lambda: float = MMR_LAMBDA) -> List[dict]:
+    """Maximal marginal relevance over the ranked matches, similarity is term overlap between chunks"""
+    if not matches:
+        return []
+    top_score = max(m["score"] for m in matches) or 1.0
+    terms = [set(tokenize(m["content"])) for m in matches]
+    remaining = list(range(len(matches)))
+    selected = []
+    while remaining and len(selected) < limit:
+        def mmr_score(i):
+            redundancy = max((_similarity(terms[i], terms[j]) for j in selected), default=0.0)
+            return mmr_lambda * matches[i]["score"] / top_score - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=mmr_score)
+        selected.append(best)
+        remaining.remove(best)
+    return [matches[i] for i in selected]
+
+
+def _overlap_length(left: str, right: str, max_overlap: int = 400) -> int:
+    for size in range(min(len(left), len(right), max_overlap), 19, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _try_merge(block: dict, match: dict) -> bool:
+    """Extend block with match when they are adjacent or overlapping parts of the same source"""
+    start, end = block.get("start_line"), block.get("end_line")
+    next_start, next_end = match["metadata"].get("start_line"), match["metadata"].get("end_line")
+
+    if None not in (start, end, next_start, next_end):
+        if next_start > end + 1 or next_end < start:
+            return False
+        if next_start >= start and next_end <= end:
+            return True
+        if next_start < start:
+            return False
+        skip = end - next_start + 1
+        block["content"] = block["content"].rstrip("\n") + "\n" + "\n".join(match["content"].split("\n")[skip:])
+        block["end_line"] = next_end
+        return True
+
+    overlap = _overlap_length(block["content"], match["content"])
+    if not overlap:
+        return False
+    block["content"] += match["content"][overlap:]
+    return True
+
+
+def merge_adjacent(matches: List[dict]) -> List[dict]:
+    """Group matches into blocks of contiguous text per source, keeping the best score of each block"""
+    by_source: Dict[Tuple, List[dict]] = {}
+    for order, match in enumerate(matches):
+        metadata = match["metadata"]
+        key = (match.get("kb_name"), metadata.get("source"), metadata.get("page"))
+        by_source.setdefault(key, []).append(dict(match, order=order))
+
+    blocks = []
+    for (kb_name, source, page), source_matches in by_source.items():
+        source_matches.sort(key=lambda m: (m["metadata"].get("start_line") or 0, m["order"]))
+        block = None
+        for match in source_matches:
+            if block is not None and _try_merge(block, match):
+                block["score"] = max(block["score"], match["score"])
+                block["order"] = min(block["order"], match["order"])
+                for symbol in filter(None, [match["metadata"].get("symbol")]):
+                    if symbol not in block["symbols"]:
+                        block["symbols"].append(symbol)
+                continue
+            block = {
+                "content": match["content"],
+                "kb_name": kb_name,
+                "source": source,
+                "page": page,
+                "start_line": match["metadata"].get("start_line"),
+                "end_line": match["metadata"].get("end_line"),
+                "symbols": list(filter(None, [match["metadata"].get("symbol")])),
+                "score": match["score"],
+                "order": match["order"],
+            }
+            blocks.append(block)
+
+    blocks.sort(key=lambda b: b["order"])
+    return blocks
+
+
+def format_citation(block: dict) -> str:
+    citation = str(block["source"] or "unknown source")
+    if block["kb_name"]:
+        citation = f"{block['kb_name']}: {citation}"
+    if block["page"] is not None:
+        citation += f" (page {block['page']})"
+    if block["start_line"] is not None:
+        citation += f":{block['start_line']}-{block['end_line']}"
+    if block["symbols"]:
+        citation += f" [{', '.join(block['symbols'])}]"
+    return citation
+
+
+def pack_context(matches: List[dict], token_budget: Optional[int] = None, min_score: Optional[float] = None,
+                 mmr_lambda: Optional[float] = None) -> Tuple[str, dict]:
+    """Threshold, diversify, merge and pack retrieval matches ({"content", "metadata", "score"}) into a token budget"""
+    token_budget = token_budget or CONTEXT_TOKEN_BUDGET
+    min_score = MIN_SCORE if min_score is None else min_score
+    mmr_lambda = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+
+    relevant = filter_by_score(matches, min_score)
+    selected = mmr_select(relevant, mmr_lambda=mmr_lambda)
+    blocks = merge_adjacent(selected)
+
+    parts = []
+    used_tokens = 0
+    for i, block in enumerate(blocks, 1):
+        header = f"[{i}] {format_citation(block)}\n"
+        text = header + block["content"].strip("\n") + "\n"
+        tokens = count_tokens(text)
+        if used_tokens + tokens > token_budget:
+            remaining = token_budget - used_tokens - count_tokens(header)
+            if remaining < MIN_BLOCK_TOKENS:
+                break
+            lines = block["content"].strip("\n").split("\n")
+            while lines and count_tokens("\n".join(lines)) > remaining:
+                lines = lines[:max(1, len(lines) * 3 // 4)] if len(lines) > 1 else []
+            if not lines:
+                break
+            text = header + "\n".join(lines) + "\n...\n"
+            tokens = count_tokens(text)
+        parts.append(text)
+        used_tokens += tokens
+
+    stats = {
+        "retrieved": len(matches),
+        "above_threshold": len(relevant),
+        "selected": len(selected),
+        "blocks": len(parts),
+        "tokens": used_tokens,
+        "token_budget": token_budget,
+    }
+    return "\n".join(parts), stats
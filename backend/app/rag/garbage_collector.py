@@ -0,0 +1,99 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+from app.rag.knowledge_manager import kb_manager
+from app.rag.vector_store import get_qdrant_client
+from app.rag.blob_store import BlobStore
+from app.utils.lazy import is_loaded, lazy_object
+
+rag_manager = lazy_object("app.mcp.rag_tools", "rag_manager")
+
+logger = logging.getLogger(__name__)
+
+KB_COLLECTION_PREFIX = "kb_"
+
+
+class KnowledgeBaseGarbageCollector:
+    """Releases the collection, uploaded files, caches and Redis records of deleted knowledge bases"""
+
+    def __init__(self, blob_store: BlobStore):
+        self.blob_store = blob_store
+        self._lock = threading.Lock()
+
+    @property
+    def upload_dir(self) -> Path:
+        return self.blob_store.root
+
+    def collect(self, kb_id: str) -> Dict[str, object]:
+        with self._lock:
+            kb = kb_manager.get_knowledge_base(kb_id)
+            if kb is None:
+                kb_manager.purge_knowledge_base(kb_id)
+                return {"kb_id": kb_id, "status": "missing"}
+            if kb.status != "deleted":
+                logger.warning(f"skip garbage collection of knowledge base {kb_id}, status is {kb.status}")
+                return {"kb_id": kb_id, "status": "skipped"}
+
+            result = {"kb_id": kb_id, "collection": kb.collection_name, "files_removed": 0}
+            try:
+                client = get_qdrant_client()
+                if client.collection_exists(kb.collection_name):
+                    client.delete_collection(kb.collection_name)
+                    logger.info(f"dropped collection {kb.collection_name}")
+
+                for file_path in kb_manager.get_kb_files(kb_id):
+                    if self._remove_upload(file_path, kb_id):
+                        result["files_removed"] += 1
+
+                # Nothing is cached before the RAG stack is loaded, it is not imported just to evict
+                if is_loaded(rag_manager):
+                    rag_manager.evict_collection(kb.collection_name)
+                kb_manager.purge_knowledge_base(kb_id)
+                result["status"] = "collected"
+                logger.info(f"knowledge base {kb_id} garbage collected: {result}")
+            except Exception as e:
+                # Stays in the pending set, the next reconciliation pass retries
+                logger.error(f"garbage collection of knowledge base {kb_id} failed: {e}")
+                result.update({"status": "failed", "error": str(e)})
+            return result
+
+    def _remove_upload(self, file_path: str, kb_id: str) -> bool:
+        path = Path(file_path).resolve()
+        if self.upload_dir not in path.parents:
+            logger.warning(f"not removing {file_path}, outside upload directory")
+            return False
+        # Checked and deleted under the blob lock, an upload may be deduplicating onto this blob right now
+        return self.blob_store.remove_unreferenced(file_path, lambda: kb_manager.is_file_referenced(file_path, exclude_kb_id=kb_id))
+
+    def find_orphaned_collections(self) -> List[str]:
+        """kb_* collections that no live knowledge base points to"""
+        # Listed before the knowledge bases so a collection created meanwhile is never taken for an orphan
+        collections = get_qdrant_client().get_collections().collections
+        live_collections = {kb.collection_name for kb in kb_manager.list_knowledge_bases()}
+        return [
+            collection.name for collection in collections
+            if collection.name.startswith(KB_COLLECTION_PREFIX) and collection.name not in live_collections
+        ]
+
+    def reconcile(self, dry_run: bool = True) -> Dict[str, object]:
+        """Retry pending deletions and drop orphaned collections"""
+        pending = kb_manager.get_pending_gc()
+        collected = [] if dry_run else [self.collect(kb_id) for kb_id in pending]
+
+        orphaned = self.find_orphaned_collections()
+        if not dry_run:
+            client = get_qdrant_client()
+            for collection_name in orphaned:
+                client.delete_collection(collection_name)
+                if is_loaded(rag_manager):
+                    rag_manager.evict_collection(collection_name)
+                logger.info(f"dropped orphaned collection {collection_name}")
+
+        return {
+            "dry_run": dry_run,
+            "pending_deletions": pending,
+            "collected": collected,
+            "orphaned_collections": orphaned
+        }
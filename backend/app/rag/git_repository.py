@@ -4,7 +4,7 @@ import logging
 import time
 import uuid
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
 from urllib.parse import urlparse
 import git
 from git import Repo
@@ -12,7 +12,6 @@ from git.remote import RemoteProgress
 
 # Import document processing modules
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import (
     TextLoader,
     UnstructuredMarkdownLoader,
@@ -24,9 +23,18 @@ from langchain_community.document_loaders.pdf import PyPDFLoader
 # Import vector store and knowledge base modules
 from app.rag.knowledge_manager import kb_manager
 from app.mcp.rag_tools import VectorDatabaseManager
+from app.rag.code_splitter import CodeAwareTextSplitter
+from app.rag.symbols import annotate_definitions
+from app.rag.parsing import POOL_EXTENSIONS, parse_files
 
 logger = logging.getLogger(__name__)
 
+# "partial": shallow, blob-filtered fetch reading blobs from the object database
+# "clone": full clone with working tree checkout
+GIT_FETCH_MODES = ("partial", "clone")
+GIT_FETCH_MODE = os.getenv("GIT_FETCH_MODE", "partial")
+PARTIAL_FETCH_BATCH_SIZE = 500
+
 class GitRepositoryAnalyzer:
     """Git repository analyzer for cloning repositories and parsing files into knowledge bases"""
     
@@ -34,10 +42,9 @@ class GitRepositoryAnalyzer:
         timestamp = int(time.time())
         random_id = str(uuid.uuid4())[:8]
         self.local_path = f"./git-cloned-repo-{timestamp}-{random_id}"
-        self.text_splitter = RecursiveCharacterTextSplitter(
+        self.text_splitter = CodeAwareTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
-            length_function=len,
         )
         
         self.supported_extensions = {
@@ -54,6 +61,15 @@ class GitRepositoryAnalyzer:
             'target', 'build', 'dist', 'out', 'bin', 'obj', '.idea', '.vscode',
             '*.log', '*.tmp', '*.temp', '*.cache', '*.lock'
         }
+        
+        # Loaded as plain UTF-8 text (TextLoader)
+        self.plain_text_extensions = {
+            '.py', '.js', '.ts', '.java', '.cpp', '.c', '.h', 
+            '.hpp', '.cs', '.php', '.rb', '.go', '.rs', '.swift', 
+            '.kt', '.scala', '.r', '.m', '.sql', '.sh', '.bat', 
+            '.ps1', '.yml', '.yaml', '.json', '.xml', '.html', 
+            '.css', '.scss', '.less'
+        }
     
     def extract_project_name(self, repo_url: str) -> str:
         parsed_url = urlparse(repo_url)
@@ -94,11 +110,7 @@ class GitRepositoryAnalyzer:
                 loader = Docx2txtLoader(str(file_path))
             elif file_extension == '.csv':
                 loader = CSVLoader(str(file_path))
-            elif file_extension in ['.py', '.js', '.ts', '.java', '.cpp', '.c', '.h', 
-                                   '.hpp', '.cs', '.php', '.rb', '.go', '.rs', '.swift', 
-                                   '.kt', '.scala', '.r', '.m', '.sql', '.sh', '.bat', 
-                                   '.ps1', '.yml', '.yaml', '.json', '.xml', '.html', 
-                                   '.css', '.scss', '.less']:
+            elif file_extension in self.plain_text_extensions:
                 loader = TextLoader(str(file_path), encoding='utf-8')
             else:
                 logger.warning(f"Unsupported file type: {file_extension} for file: {file_path}")
@@ -111,11 +123,14 @@ class GitRepositoryAnalyzer:
             logger.error(f"Error loading document {file_path}: {str(e)}")
             return []
     
-    def analyze_repository(self, repo_url: str, username: str, token: str, kb_id: str) -> Dict[str, Any]:
+    def analyze_repository(self, repo_url: str, username: str, token: str, kb_id: str, fetch_mode: str = None) -> Dict[str, Any]:
         repo_project_name = self.extract_project_name(repo_url)
         local_path = Path(self.local_path)
+        fetch_mode = fetch_mode or GIT_FETCH_MODE
+        if fetch_mode not in GIT_FETCH_MODES:
+            raise ValueError(f"Unsupported fetch mode: {fetch_mode}. Supported modes: {GIT_FETCH_MODES}")
         
-        logger.info(f"start clone repository: {repo_url}")
+        logger.info(f"start fetch repository: {repo_url} (mode: {fetch_mode})")
         logger.info(f"clone path: {local_path.absolute()}")
         
         self._clean_directory(local_path)
@@ -126,62 +141,62 @@ class GitRepositoryAnalyzer:
                 parsed_url = urlparse(repo_url)
                 clone_url = f"{parsed_url.scheme}://{username}:{token}@{parsed_url.netloc}{parsed_url.path}"
             
-            git_repo = Repo.clone_from(
-                url=clone_url,
-                to_path=local_path,
-                progress=GitProgress()
-            )
-            
-            logger.info(f"repository clone completed: {repo_url}")
-            
             kb = kb_manager.get_knowledge_base(kb_id)
             if not kb:
                 raise Exception(f"Knowledge base not found: {kb_id}")
             
-            vector_db_manager = VectorDatabaseManager(kb.collection_name)
+            if fetch_mode == "partial":
+                try:
+                    file_documents = self._iter_partial_fetch_documents(clone_url, local_path)
+                except git.GitCommandError as e:
+                    logger.warning(f"partial fetch failed, falling back to full clone: {e}")
+                    self._clean_directory(local_path)
+                    # Reported as the mode that actually ran
+                    fetch_mode = "clone"
+                    file_documents = self._iter_clone_documents(clone_url, local_path)
+            else:
+                file_documents = self._iter_clone_documents(clone_url, local_path)
+            
+            logger.info(f"repository fetch completed: {repo_url}")
+            
+            vector_db_manager = VectorDatabaseManager(kb.collection_name, kb.index_profile)
             
             files_processed = 0
             total_documents = 0
             
-            for file_path in local_path.rglob('*'):
-                if file_path.is_file() and not self.should_ignore_file(file_path):
-                    try:
-                        logger.info(f"processing file: {file_path.name}")
-                        
-                        documents = self.load_document(file_path)
-                        if not documents:
-                            continue
-                        
-                        for doc in documents:
-                            doc.metadata.update({
-                                "knowledge": repo_project_name,
-                                "source": str(file_path),
-                                "file_type": file_path.suffix.lower(),
-                                "kb_id": kb_id
-                            })
-                        
-                        split_documents = self.text_splitter.split_documents(documents)
-                        
-                        for doc in split_documents:
-                            doc.metadata.update({
-                                "knowledge": repo_project_name,
-                                "source": str(file_path),
-                                "file_type": file_path.suffix.lower(),
-                                "kb_id": kb_id
-                            })
-                        
-                        vector_db_manager.add_documents(split_documents)
-                        
-                        files_processed += 1
-                        total_documents += len(split_documents)
-                        
-                        logger.info(f"file processing completed: {file_path.name}, document count: {len(split_documents)}")
-                        
-                    except Exception as e:
-                        logger.error(f"failed to process file {file_path.name}: {str(e)}")
+            for relative_path, documents in file_documents:
+                try:
+                    if not documents:
                         continue
+                    
+                    metadata = {
+                        "knowledge": repo_project_name,
+                        "source": relative_path.as_posix(),
+                        "file_type": relative_path.suffix.lower(),
+                        "kb_id": kb_id
+                    }
+                    for doc in documents:
+                        doc.metadata.update(metadata)
+                    
+                    split_documents = self.text_splitter.split_documents(documents)
+                    # Same symbol extraction as the workspace symbol index, so chunks can be filtered by definition
+                    annotate_definitions(documents, split_documents)
+                    
+                    for doc in split_documents:
+                        doc.metadata.update(metadata)
+                    
+                    vector_db_manager.add_documents(split_documents, split=False)
+                    
+                    files_processed += 1
+                    total_documents += len(split_documents)
+                    
+                    logger.info(f"file processing completed: {relative_path.name}, document count: {len(split_documents)}")
+                    
+                except Exception as e:
+                    logger.error(f"failed to process file {relative_path.name}: {str(e)}")
+                    continue
             
-            kb_manager.update_kb_stats(kb_id, file_count=files_processed, vector_count=total_documents)
+            kb_manager.update_kb_stats(kb_id, files_added=files_processed, vectors_added=total_documents)
             
             self.add_knowledge_tag_to_redis(repo_project_name)
             
@@ -192,6 +207,7 @@ class GitRepositoryAnalyzer:
                 "total_documents": total_documents,
                 "collection_info": {
                     "collection_name": kb.collection_name,
+                    "fetch_mode": fetch_mode,
                     "status": "completed"
                 }
             }
@@ -203,6 +219,110 @@ class GitRepositoryAnalyzer:
             self._clean_directory(local_path)
             logger.info(f"clean clone directory: {local_path}")
     
+    def _iter_clone_documents(self, clone_url: str, local_path: Path) -> Iterator[Tuple[Path, List[Document]]]:
+        """Full clone with working tree checkout, then walk the checked out files"""
+        Repo.clone_from(
+            url=clone_url,
+            to_path=local_path,
+            progress=GitProgress()
+        )
+        
+        def walk():
+            deferred = []
+            for file_path in local_path.rglob('*'):
+                relative_path = file_path.relative_to(local_path)
+                if file_path.is_file() and not self.should_ignore_file(relative_path):
+                    if relative_path.suffix.lower() in POOL_EXTENSIONS:
+                        deferred.append((relative_path, file_path))
+                        continue
+                    logger.info(f"processing file: {relative_path}")
+                    yield relative_path, self.load_document(file_path)
+            yield from self._parse_in_pool(deferred)
+        
+        return walk()
+    
+    def _iter_partial_fetch_documents(self, clone_url: str, local_path: Path) -> Iterator[Tuple[Path, List[Document]]]:
+        """Shallow, blob-filtered fetch of HEAD; only blobs that pass the filters are downloaded and read from the object database"""
+        git_repo = Repo.init(local_path, bare=True)
+        git_repo.create_remote("origin", clone_url)
+        
+        # Commit and trees only, no history and no file contents
+        git_repo.git.fetch("--depth=1", "--filter=blob:none", "--no-tags", "origin", "HEAD")
+        
+        entries = []
+        tree_listing = git_repo.git.ls_tree("-r", "-z", "--full-tree", "FETCH_HEAD")
+        for line in tree_listing.split("\0"):
+            if not line:
+                continue
+            info, path = line.split("\t", 1)
+            mode, object_type, oid = info.split()
+            # Skip submodules and symlinks
+            if object_type != "blob" or mode == "120000":
+                continue
+            relative_path = Path(path)
+            if not self.should_ignore_file(relative_path):
+                entries.append((relative_path, oid))
+        
+        logger.info(f"{len(entries)} files selected from tree at HEAD")
+        
+        # Download the selected blobs in batches instead of one lazy fetch per object
+        oids = sorted({oid for _, oid in entries})
+        for i in range(0, len(oids), PARTIAL_FETCH_BATCH_SIZE):
+            git_repo.git.fetch(
+                "--no-tags", "--no-write-fetch-head", "--filter=blob:none", "origin",
+                *oids[i:i + PARTIAL_FETCH_BATCH_SIZE]
+            )
+        
+        def read_blobs():
+            deferred = []
+            for relative_path, oid in entries:
+                try:
+                    data = git_repo.odb.stream(bytes.fromhex(oid)).read()
+                except Exception as e:
+                    logger.error(f"failed to read blob {oid} for {relative_path}: {str(e)}")
+                    continue
+                if relative_path.suffix.lower() in POOL_EXTENSIONS:
+                    scratch_path = local_path / f"blob-{uuid.uuid4().hex}{relative_path.suffix.lower()}"
+                    scratch_path.write_bytes(data)
+                    deferred.append((relative_path, scratch_path))
+                    continue
+                logger.info(f"processing file: {relative_path}")
+                yield relative_path, self.load_blob(relative_path, data, local_path)
+            yield from self._parse_in_pool(deferred, remove_files=True)
+        
+        return read_blobs()
+    
+    def _parse_in_pool(self, deferred: List[Tuple[Path, Path]], remove_files: bool = False) -> Iterator[Tuple[Path, List[Document]]]:
+        """Parse PDF, Word and Markdown files in the parse process pool, yielded as each file completes"""
+        relative_paths = {str(file_path): relative_path for relative_path, file_path in deferred}
+        for file_path, documents, error in parse_files(list(relative_paths)):
+            relative_path = relative_paths[file_path]
+            logger.info(f"processing file: {relative_path}")
+            if error:
+                logger.error(f"Error loading document {relative_path}: {str(error)}")
+            if remove_files:
+                Path(file_path).unlink(missing_ok=True)
+            yield relative_path, documents
+    
+    def load_blob(self, relative_path: Path, data: bytes, scratch_dir: Path) -> List[Document]:
+        """Build documents from blob content; binary formats go through their loader via a scratch file"""
+        file_extension = relative_path.suffix.lower()
+        
+        if file_extension == '.txt' or file_extension in self.plain_text_extensions:
+            try:
+                text = data.decode('utf-8')
+            except UnicodeDecodeError as e:
+                logger.error(f"Error loading document {relative_path}: {str(e)}")
+                return []
+            return [Document(page_content=text, metadata={"source": relative_path.as_posix()})]
+        
+        scratch_path = scratch_dir / f"blob-{uuid.uuid4().hex}{file_extension}"
+        try:
+            scratch_path.write_bytes(data)
+            return self.load_document(scratch_path)
+        finally:
+            scratch_path.unlink(missing_ok=True)
+    
     def _clean_directory(self, directory_path: Path):
         """Clean directory safely"""
         if not directory_path.exists():
@@ -233,18 +353,7 @@ class GitRepositoryAnalyzer:
     
     def add_knowledge_tag_to_redis(self, repo_project_name: str):
         try:
-            redis_client = kb_manager.redis_client
-            
-            rag_tag_key = "ragTag"
-            if not redis_client.exists(rag_tag_key):
-                redis_client.lpush(rag_tag_key, repo_project_name)
-            else:
-                existing_tags = redis_client.lrange(rag_tag_key, 0, -1)
-                existing_tags = [tag.decode() if isinstance(tag, bytes) else tag for tag in existing_tags]
-                
-                if repo_project_name not in existing_tags:
-                    redis_client.lpush(rag_tag_key, repo_project_name)
-            
+            kb_manager.add_knowledge_tag(repo_project_name)
             logger.info(f"knowledge base tag added to Redis: {repo_project_name}")
             
         except Exception as e:
@@ -0,0 +1,172 @@
+"""Recall and latency benchmark for vector index profiles.
+
+Run against a Qdrant server (embedded modes search by brute force and have no HNSW index):
+
+    python -m app.rag.index_benchmark --profiles default,balanced,compact --vectors 50000
+    python -m app.rag.index_benchmark --source-collection kb_1234abcd
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+from typing import List
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from qdrant_client.models import Distance, VectorParams, PointStruct, SearchParams, OptimizersConfigDiff
+
+from app.rag.vector_store import get_qdrant_client
+from app.rag.index_profiles import INDEX_PROFILES, collection_params, search_params, estimated_vector_memory
+
+EMBEDDING_DIM = 384
+UPSERT_BATCH_SIZE = 256
+
+
+def synthetic_vectors(count: int, dim: int, seed: int = 42) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(count // 500, 8), dim))
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.5 * rng.normal(size=(count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def load_collection_vectors(client, collection_name: str, limit: int) -> np.ndarray:
+    vectors = []
+    offset = None
+    while len(vectors) < limit:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=min(1000, limit - len(vectors)),
+            offset=offset,
+            with_payload=False,
+            with_vectors=True
+        )
+        for point in points:
+            vector = point.vector.get("") if isinstance(point.vector, dict) else point.vector
+            if vector is not None:
+                vectors.append(vector)
+        if offset is None:
+            break
+    return np.array(vectors, dtype=np.float32)
+
+
+def upsert_vectors(client, collection_name: str, vectors: np.ndarray):
+    for i in range(0, len(vectors), UPSERT_BATCH_SIZE):
+        client.upsert(
+            collection_name=collection_name,
+            points=[
+                PointStruct(id=i + j, vector=vector.tolist())
+                for j, vector in enumerate(vectors[i:i + UPSERT_BATCH_SIZE])
+            ]
+        )
+
+
+def wait_for_index(client, collection_name: str, timeout: float = 600):
+    start = time.time()
+    while time.time() - start < timeout:
+        info = client.get_collection(collection_name)
+        if info.status == "green" and (info.indexed_vectors_count or 0) >= (info.points_count or 0):
+            return
+        time.sleep(1)
+    print(f"  index of {collection_name} not finished after {timeout}s, results may be from a partial index")
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_profile(client, profile, vectors: np.ndarray, queries: np.ndarray, truth: List[set], k: int) -> dict:
+    collection_name = f"bench_{profile.name}_{uuid.uuid4().hex[:6]}"
+    try:
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE, on_disk=profile.on_disk),
+            # Build the HNSW graph right away instead of after the default 20MB segment threshold
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=1),
+            **collection_params(profile)
+        )
+        start = time.perf_counter()
+        upsert_vectors(client, collection_name, vectors)
+        wait_for_index(client, collection_name)
+        build_seconds = time.perf_counter() - start
+
+        latencies = []
+        recalls = []
+        params = search_params(profile)
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            response = client.query_points(collection_name=collection_name, query=query.tolist(), limit=k, search_params=params)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len({point.id for point in response.points} & expected) / len(expected))
+
+        return {
+            "profile": profile.name,
+            "recall": float(np.mean(recalls)),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "build_s": build_seconds,
+            "vector_ram_mb": estimated_vector_memory(profile, len(vectors), vectors.shape[1]) / 1024 / 1024,
+        }
+    finally:
+        client.delete_collection(collection_name)
+
+
+def exact_neighbours(client, vectors: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    collection_name = f"bench_exact_{uuid.uuid4().hex[:6]}"
+    try:
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=vectors.shape[1], distance=Distance.COSINE)
+        )
+        upsert_vectors(client, collection_name, vectors)
+        return [
+            {point.id for point in client.query_points(
+                collection_name=collection_name,
+                query=query.tolist(),
+                limit=k,
+                search_params=SearchParams(exact=True)
+            ).points}
+            for query in queries
+        ]
+    finally:
+        client.delete_collection(collection_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recall and latency of vector index profiles")
+    parser.add_argument("--profiles", default=",".join(INDEX_PROFILES), help="Comma separated profile names")
+    parser.add_argument("--vectors", type=int, default=20000, help="Number of vectors (default: 20000)")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries (default: 200)")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query (default: 10)")
+    parser.add_argument("--source-collection", help="Benchmark with vectors sampled from an existing collection")
+    args = parser.parse_args()
+
+    profiles = [INDEX_PROFILES[name] for name in args.profiles.split(",")]
+    client = get_qdrant_client()
+
+    if args.source_collection:
+        data = load_collection_vectors(client, args.source_collection, args.vectors + args.queries)
+    else:
+        data = synthetic_vectors(args.vectors + args.queries, EMBEDDING_DIM)
+    if len(data) <= args.queries:
+        print(f"Not enough vectors to benchmark: {len(data)}")
+        return
+    queries, vectors = data[:args.queries], data[args.queries:]
+
+    print(f"Benchmarking {len(profiles)} profiles with {len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    truth = exact_neighbours(client, vectors, queries, args.k)
+
+    print(f"{'profile':<14}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'vector RAM MB':>16}")
+    for profile in profiles:
+        result = run_profile(client, profile, vectors, queries, truth, args.k)
+        print(
+            f"{result['profile']:<14}{result['recall']:>10.4f}{result['p50_ms']:>10.2f}"
+            f"{result['p95_ms']:>10.2f}{result['build_s']:>10.1f}{result['vector_ram_mb']:>16.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from typing import TYPE_CHECKING, Dict, Optional
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    from qdrant_client.models import SearchParams
+
+
+class IndexProfile(BaseModel):
+    name: str
+    description: str
+    hnsw_m: Optional[int] = None  # None keeps the server default (16)
+    hnsw_ef_construct: Optional[int] = None  # None keeps the server default (100)
+    search_ef: Optional[int] = None  # None keeps the server default (ef_construct)
+    on_disk: bool = False  # original vectors on disk (memmap) instead of RAM
+    quantization: str = "none"  # none, scalar (int8, 4x smaller) or binary (32x smaller)
+    rescore: bool = True  # re-rank quantized candidates with the original vectors
+    oversampling: Optional[float] = None  # fetch limit * oversampling quantized candidates before rescoring
+
+
+INDEX_PROFILES: Dict[str, IndexProfile] = {
+    profile.name: profile for profile in [
+        IndexProfile(
+            name="default",
+            description="Server defaults, float32 vectors in RAM",
+        ),
+        IndexProfile(
+            name="high_recall",
+            description="Denser graph and wider search for best recall, more RAM and slower indexing",
+            hnsw_m=32,
+            hnsw_ef_construct=256,
+            search_ef=256,
+        ),
+        IndexProfile(
+            name="balanced",
+            description="int8 scalar quantization in RAM, original vectors on disk for rescoring",
+            hnsw_m=16,
+            hnsw_ef_construct=128,
+            search_ef=128,
+            on_disk=True,
+            quantization="scalar",
+            oversampling=2.0,
+        ),
+        IndexProfile(
+            name="compact",
+            description="Binary quantization for large repository KBs, original vectors on disk for rescoring",
+            hnsw_m=16,
+            hnsw_ef_construct=100,
+            search_ef=128,
+            on_disk=True,
+            quantization="binary",
+            oversampling=3.0,
+        ),
+    ]
+}
+
+DEFAULT_INDEX_PROFILE = "default"
+
+
+def get_index_profile(name: Optional[str]) -> IndexProfile:
+    profile = INDEX_PROFILES.get(name or DEFAULT_INDEX_PROFILE)
+    if profile is None:
+        raise ValueError(f"Unknown index profile: {name}. Available profiles: {list(INDEX_PROFILES)}")
+    return profile
+
+
+def collection_params(profile: IndexProfile) -> dict:
+    """Keyword arguments for create_collection, the dense VectorParams take on_disk separately"""
+    from qdrant_client.models import (
+        BinaryQuantization,
+        BinaryQuantizationConfig,
+        HnswConfigDiff,
+        ScalarQuantization,
+        ScalarQuantizationConfig,
+        ScalarType,
+    )
+    params = {}
+    if profile.hnsw_m is not None or profile.hnsw_ef_construct is not None:
+        params["hnsw_config"] = HnswConfigDiff(m=profile.hnsw_m, ef_construct=profile.hnsw_ef_construct)
+    if profile.quantization == "scalar":
+        params["quantization_config"] = ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif profile.quantization == "binary":
+        params["quantization_config"] = BinaryQuantization(
+            binary=BinaryQuantizationConfig(always_ram=True)
+        )
+    return params
+
+
+def search_params(profile: IndexProfile) -> Optional["SearchParams"]:
+    from qdrant_client.models import QuantizationSearchParams, SearchParams
+    quantization = None
+    if profile.quantization != "none":
+        quantization = QuantizationSearchParams(rescore=profile.rescore, oversampling=profile.oversampling)
+    if profile.search_ef is None and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=profile.search_ef, quantization=quantization)
+
+
+def estimated_vector_memory(profile: IndexProfile, vector_count: int, dim: int) -> int:
+    """Bytes of vector data kept in RAM, excluding the HNSW graph"""
+    original = 0 if profile.on_disk else vector_count * dim * 4
+    if profile.quantization == "scalar":
+        return original + vector_count * dim
+    if profile.quantization == "binary":
+        return original + vector_count * dim // 8
+    return original
@@ -0,0 +1,56 @@
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# Parsing, splitting and embedding run in worker processes, each loads its own embedding model once
+INGESTION_WORKERS = int(os.getenv("RAG_INGESTION_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_ingestion_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a process that holds torch and client threads is not safe
+                _pool = ProcessPoolExecutor(
+                    max_workers=INGESTION_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def ingest_file(kb_id: str, file_path: str, source_name: str = None) -> dict:
+    from app.mcp.rag_tools import rag_manager
+    return rag_manager.upload_to_knowledge_base(kb_id, file_path, source_name)
+
+
+def ingest_files(kb_id: str, files: list) -> dict:
+    from app.mcp.rag_tools import rag_manager
+    return rag_manager.bulk_upload_to_knowledge_base(kb_id, files)
+
+
+def analyze_repository(repo_url: str, username: str, token: str, kb_id: str, fetch_mode: str = None) -> dict:
+    from app.rag.git_repository import GitRepositoryAnalyzer
+    analyzer = GitRepositoryAnalyzer()
+    return analyzer.analyze_repository(
+        repo_url=repo_url,
+        username=username,
+        token=token,
+        kb_id=kb_id,
+        fetch_mode=fetch_mode
+    )
+
+
+async def run_ingestion(func, *args):
+    """Run an ingestion job in the process pool without blocking the event loop"""
+    from app.rag.vector_store import QDRANT_MODE
+    if QDRANT_MODE != "remote":
+        # Embedded storage is locked by the client of this process, ingest in a thread instead
+        return await asyncio.to_thread(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(get_ingestion_pool(), func, *args)
@@ -1,11 +1,84 @@
 import os
 import json
+import time
 import uuid
-from typing import List, Dict, Optional
+import logging
+import threading
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import redis
+import redis.asyncio
 from pydantic import BaseModel
 
+from app.utils.lazy import LazyObject
+
+logger = logging.getLogger(__name__)
+
+# Safety net on top of pub/sub invalidation, cached records are re-read at least this often
+KB_CACHE_TTL = float(os.getenv("KB_CACHE_TTL", "60"))
+# Connections shared by all async handlers of an API worker
+KB_REDIS_POOL_SIZE = int(os.getenv("KB_REDIS_POOL_SIZE", "50"))
+
+# Multi-step writes run as Lua scripts, atomic and one round trip each
+# KEYS: name index, record, id list. ARGV: name, id, invalidation channel, then record fields and values
+CREATE_KB_SCRIPT = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[2], unpack(ARGV, 4))
+redis.call('LPUSH', KEYS[3], ARGV[2])
+redis.call('PUBLISH', ARGV[3], ARGV[2])
+return 1
+"""
+
+# KEYS: record. ARGV: files added, vectors added, updated_at, invalidation channel, id. Returns the new version
+INCREMENT_KB_STATS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+redis.call('HINCRBY', KEYS[1], 'file_count', ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'vector_count', ARGV[2])
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('HSET', KEYS[1], 'updated_at', ARGV[3])
+redis.call('PUBLISH', ARGV[4], ARGV[5])
+return version
+"""
+
+# KEYS: name index, record. ARGV: new name, id, invalidation channel, then record fields and values.
+# The name index entry moves with the record, 0 when the new name is taken, false for missing or deleted records
+RENAME_KB_SCRIPT = """
+local old_name = redis.call('HGET', KEYS[2], 'name')
+if not old_name or redis.call('HGET', KEYS[2], 'status') == 'deleted' then
+    return false
+end
+if old_name ~= ARGV[1] then
+    if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+        return 0
+    end
+    if redis.call('HGET', KEYS[1], old_name) == ARGV[2] then
+        redis.call('HDEL', KEYS[1], old_name)
+    end
+end
+redis.call('HSET', KEYS[2], unpack(ARGV, 4))
+redis.call('PUBLISH', ARGV[3], ARGV[2])
+return 1
+"""
+
+# KEYS: tag set. ARGV: tag. Tags used to be kept in a list, converted on first use
+ADD_TAG_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok == 'list' then
+    local tags = redis.call('LRANGE', KEYS[1], 0, -1)
+    redis.call('DEL', KEYS[1])
+    if #tags > 0 then
+        redis.call('SADD', KEYS[1], unpack(tags))
+    end
+end
+return redis.call('SADD', KEYS[1], ARGV[1])
+"""
+
+class KnowledgeBaseExistsError(Exception):
+    pass
+
 class KnowledgeBase(BaseModel):
     id: str
     name: str
@@ -15,74 +88,278 @@ class KnowledgeBase(BaseModel):
     updated_at: str
     file_count: int = 0
     vector_count: int = 0
+    version: int = 0  # bumped on every content change, used to invalidate query caches
+    index_profile: str = "default"  # see app.rag.index_profiles, applied when the collection is created
     status: str = "active"  # active, inactive, deleted
 
 class KnowledgeBaseManager:
     
     def __init__(self):
-        redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
-        self.redis_client = redis.from_url(redis_url)
+        self.redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+        self.redis_client = redis.from_url(self.redis_url)
+        self._async_client = None
+        self._async_scripts = None
         self.kb_prefix = "knowledge_base:"
         self.kb_list_key = "knowledge_bases"
+        self.kb_names_key = "knowledge_bases:names"
+        self.rag_tag_key = "ragTag"
+        self.kb_files_suffix = ":files"
+        self.gc_pending_key = "knowledge_bases:gc_pending"
+        self.invalidation_channel = "knowledge_bases:invalidate"
+        self._scripts = self._register_scripts(self.redis_client)
+        
+        # Read-through cache of KB records, only used while subscribed to invalidations from other processes
+        self._cache: Dict[str, KnowledgeBase] = {}
+        self._cached_ids: Optional[List[str]] = None
+        self._cache_expires = 0.0
+        self._cache_generation = 0
+        self._cache_lock = threading.Lock()
+        self._subscribed = False
+        threading.Thread(target=self._listen_invalidations, name="kb-invalidation", daemon=True).start()
+        self._backfill_name_index()
+    
+    def _listen_invalidations(self):
+        while True:
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.invalidation_channel)
+                # Changes published while disconnected were missed
+                self._invalidate_local()
+                self._subscribed = True
+                for message in pubsub.listen():
+                    self._invalidate_local(message["data"].decode())
+            except Exception as e:
+                self._subscribed = False
+                self._invalidate_local()
+                logger.warning(f"knowledge base invalidation subscription lost, retrying: {e}")
+                time.sleep(1)
+    
+    def _invalidate_local(self, kb_id: str = None):
+        with self._cache_lock:
+            self._cache_generation += 1
+            self._cached_ids = None
+            if kb_id:
+                self._cache.pop(kb_id, None)
+            else:
+                self._cache.clear()
+    
+    def _cache_valid(self) -> bool:
+        if not self._subscribed:
+            return False
+        if time.monotonic() > self._cache_expires:
+            with self._cache_lock:
+                self._cache.clear()
+                self._cached_ids = None
+                self._cache_generation += 1
+                self._cache_expires = time.monotonic() + KB_CACHE_TTL
+        return True
+    
+    def _register_scripts(self, client) -> Dict[str, object]:
+        return {
+            "create": client.register_script(CREATE_KB_SCRIPT),
+            "increment_stats": client.register_script(INCREMENT_KB_STATS_SCRIPT),
+            "rename": client.register_script(RENAME_KB_SCRIPT),
+            "add_tag": client.register_script(ADD_TAG_SCRIPT),
+        }
+    
+    def _backfill_name_index(self):
+        """Index knowledge bases created before the name index existed"""
+        try:
+            if self.redis_client.exists(self.kb_names_key):
+                return
+            pipe = self.redis_client.pipeline()
+            for kb in self.list_knowledge_bases():
+                pipe.hsetnx(self.kb_names_key, kb.name, kb.id)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"failed to backfill knowledge base name index: {e}")
+    
+    def _decode_kb(self, data: dict) -> Optional[KnowledgeBase]:
+        if not data:
+            return None
+        return KnowledgeBase(**{k.decode(): v.decode() for k, v in data.items()})
+    
+    @property
+    def async_redis(self) -> "redis.asyncio.Redis":
+        """Pooled asyncio client for API handlers, callers wait for a free connection when the pool is exhausted"""
+        if self._async_client is None:
+            pool = redis.asyncio.BlockingConnectionPool.from_url(self.redis_url, max_connections=KB_REDIS_POOL_SIZE)
+            self._async_client = redis.asyncio.Redis(connection_pool=pool)
+        return self._async_client
+    
+    @property
+    def async_scripts(self) -> Dict[str, object]:
+        if self._async_scripts is None:
+            self._async_scripts = self._register_scripts(self.async_redis)
+        return self._async_scripts
+    
+    def _cache_lookup(self, kb_id: str) -> Tuple[bool, int, Optional[KnowledgeBase]]:
+        """(use_cache, generation, cached copy or None)"""
+        if not self._cache_valid():
+            return False, 0, None
+        with self._cache_lock:
+            kb = self._cache.get(kb_id)
+            return True, self._cache_generation, kb.model_copy() if kb else None
+    
+    def _cache_fill(self, kb: KnowledgeBase, generation: int):
+        with self._cache_lock:
+            # Skip the fill when an invalidation arrived during the read
+            if generation == self._cache_generation:
+                self._cache[kb.id] = kb.model_copy()
     
-    def create_knowledge_base(self, name: str, description: str = "") -> KnowledgeBase:
+    def _cached_list(self) -> Tuple[bool, int, Optional[List[KnowledgeBase]]]:
+        if not self._cache_valid():
+            return False, 0, None
+        with self._cache_lock:
+            if self._cached_ids is not None:
+                cached = [self._cache.get(kb_id) for kb_id in self._cached_ids]
+                if all(cached):
+                    return True, self._cache_generation, [kb.model_copy() for kb in cached if kb.status != "deleted"]
+            return True, self._cache_generation, None
+    
+    def _list_result(self, kb_ids: List[str], records: list, use_cache: bool, generation: int) -> List[KnowledgeBase]:
+        records = {kb_id: self._decode_kb(data) for kb_id, data in zip(kb_ids, records)}
+        if use_cache:
+            with self._cache_lock:
+                if generation == self._cache_generation:
+                    self._cache.update({kb_id: kb.model_copy() for kb_id, kb in records.items() if kb})
+                    self._cached_ids = [kb_id for kb_id, kb in records.items() if kb]
+        return [kb for kb in records.values() if kb and kb.status != "deleted"]
+    
+    def _new_knowledge_base(self, name: str, description: str, index_profile: str) -> KnowledgeBase:
         kb_id = str(uuid.uuid4())
-        collection_name = f"kb_{kb_id[:8]}"
         now = datetime.now().isoformat()
-        
-        kb = KnowledgeBase(
+        return KnowledgeBase(
             id=kb_id,
             name=name,
             description=description,
-            collection_name=collection_name,
+            collection_name=f"kb_{kb_id[:8]}",
             created_at=now,
-            updated_at=now
-        )
-        
-        self.redis_client.hset(
-            f"{self.kb_prefix}{kb_id}",
-            mapping=kb.model_dump()
+            updated_at=now,
+            index_profile=index_profile
         )
-        
-        self.redis_client.lpush(self.kb_list_key, kb_id)
-        
+    
+    def _create_script_args(self, kb: KnowledgeBase) -> dict:
+        fields = [item for field in kb.model_dump().items() for item in field]
+        return {
+            "keys": [self.kb_names_key, f"{self.kb_prefix}{kb.id}", self.kb_list_key],
+            "args": [kb.name, kb.id, self.invalidation_channel, *fields],
+        }
+    
+    def _increment_script_args(self, kb_id: str, files_added: int, vectors_added: int) -> dict:
+        return {
+            "keys": [f"{self.kb_prefix}{kb_id}"],
+            "args": [files_added, vectors_added, datetime.now().isoformat(), self.invalidation_channel, kb_id],
+        }
+    
+    def _apply_update(self, kb: KnowledgeBase, changes: dict) -> dict:
+        """Apply changes to kb, returns the fields to write"""
+        fields = {key: value for key, value in changes.items() if key in KnowledgeBase.model_fields}
+        fields["updated_at"] = datetime.now().isoformat()
+        for key, value in fields.items():
+            setattr(kb, key, value)
+        return fields
+    
+    def _rename_script_args(self, kb_id: str, fields: dict) -> dict:
+        return {
+            "keys": [self.kb_names_key, f"{self.kb_prefix}{kb_id}"],
+            "args": [fields["name"], kb_id, self.invalidation_channel, *(item for field in fields.items() for item in field)],
+        }
+    
+    def _queue_update(self, pipe, kb_id: str, fields: dict):
+        # Changed fields only, counters incremented concurrently are not overwritten
+        pipe.hset(f"{self.kb_prefix}{kb_id}", mapping=fields)
+        # Sent with the write, other processes drop their cached copy
+        pipe.publish(self.invalidation_channel, kb_id)
+    
+    def _queue_delete(self, pipe, kb: KnowledgeBase):
+        self._queue_update(pipe, kb.id, self._apply_update(kb, {"status": "deleted"}))
+        pipe.hincrby(f"{self.kb_prefix}{kb.id}", "version", 1)
+        pipe.hdel(self.kb_names_key, kb.name)
+        # Resources are released by the garbage collector, pending ids survive restarts
+        pipe.sadd(self.gc_pending_key, kb.id)
+    
+    def _queue_purge(self, pipe, kb_id: str):
+        pipe.lrem(self.kb_list_key, 0, kb_id)
+        pipe.delete(f"{self.kb_prefix}{kb_id}", f"{self.kb_prefix}{kb_id}{self.kb_files_suffix}")
+        pipe.srem(self.gc_pending_key, kb_id)
+        pipe.publish(self.invalidation_channel, kb_id)
+    
+    def create_knowledge_base(self, name: str, description: str = "", index_profile: str = "default") -> KnowledgeBase:
+        """Raises KnowledgeBaseExistsError when the name is taken"""
+        kb = self._new_knowledge_base(name, description, index_profile)
+        if not self._scripts["create"](**self._create_script_args(kb)):
+            raise KnowledgeBaseExistsError(f"Knowledge base name already exists: {name}")
+        self._invalidate_local(kb.id)
+        return kb
+    
+    async def acreate_knowledge_base(self, name: str, description: str = "", index_profile: str = "default") -> KnowledgeBase:
+        kb = self._new_knowledge_base(name, description, index_profile)
+        if not await self.async_scripts["create"](**self._create_script_args(kb)):
+            raise KnowledgeBaseExistsError(f"Knowledge base name already exists: {name}")
+        self._invalidate_local(kb.id)
         return kb
     
     def get_knowledge_base(self, kb_id: str) -> Optional[KnowledgeBase]:
-        data = self.redis_client.hgetall(f"{self.kb_prefix}{kb_id}")
-        if not data:
-            return None
-        
-        kb_data = {k.decode(): v.decode() for k, v in data.items()}
-        return KnowledgeBase(**kb_data)
+        use_cache, generation, kb = self._cache_lookup(kb_id)
+        if kb:
+            return kb
+        kb = self._decode_kb(self.redis_client.hgetall(f"{self.kb_prefix}{kb_id}"))
+        if kb and use_cache:
+            self._cache_fill(kb, generation)
+        return kb
+    
+    async def aget_knowledge_base(self, kb_id: str) -> Optional[KnowledgeBase]:
+        use_cache, generation, kb = self._cache_lookup(kb_id)
+        if kb:
+            return kb
+        kb = self._decode_kb(await self.async_redis.hgetall(f"{self.kb_prefix}{kb_id}"))
+        if kb and use_cache:
+            self._cache_fill(kb, generation)
+        return kb
     
     def list_knowledge_bases(self) -> List[KnowledgeBase]:
-        kb_ids = self.redis_client.lrange(self.kb_list_key, 0, -1)
-        knowledge_bases = []
-        
+        use_cache, generation, cached = self._cached_list()
+        if cached is not None:
+            return cached
+        kb_ids = [kb_id.decode() for kb_id in self.redis_client.lrange(self.kb_list_key, 0, -1)]
+        pipe = self.redis_client.pipeline(transaction=False)
         for kb_id in kb_ids:
-            kb_id_str = kb_id.decode()
-            kb = self.get_knowledge_base(kb_id_str)
-            if kb and kb.status != "deleted":
-                knowledge_bases.append(kb)
-        
-        return knowledge_bases
+            pipe.hgetall(f"{self.kb_prefix}{kb_id}")
+        return self._list_result(kb_ids, pipe.execute(), use_cache, generation)
+    
+    async def alist_knowledge_bases(self) -> List[KnowledgeBase]:
+        use_cache, generation, cached = self._cached_list()
+        if cached is not None:
+            return cached
+        kb_ids = [kb_id.decode() for kb_id in await self.async_redis.lrange(self.kb_list_key, 0, -1)]
+        async with self.async_redis.pipeline(transaction=False) as pipe:
+            for kb_id in kb_ids:
+                pipe.hgetall(f"{self.kb_prefix}{kb_id}")
+            records = await pipe.execute()
+        return self._list_result(kb_ids, records, use_cache, generation)
     
     def update_knowledge_base(self, kb_id: str, **kwargs) -> Optional[KnowledgeBase]:
+        """Raises KnowledgeBaseExistsError when renaming to a taken name"""
         kb = self.get_knowledge_base(kb_id)
         if not kb:
             return None
         
-        for key, value in kwargs.items():
-            if hasattr(kb, key):
-                setattr(kb, key, value)
+        fields = self._apply_update(kb, kwargs)
+        if "name" in fields:
+            # The name index entry moves atomically with the record
+            renamed = self._scripts["rename"](**self._rename_script_args(kb_id, fields))
+            self._invalidate_local(kb_id)
+            if renamed is None:
+                return None
+            if not renamed:
+                raise KnowledgeBaseExistsError(f"Knowledge base name already exists: {fields['name']}")
+            return kb
         
-        kb.updated_at = datetime.now().isoformat()
-        
-        self.redis_client.hset(
-            f"{self.kb_prefix}{kb_id}",
-            mapping=kb.model_dump()
-        )
+        pipe = self.redis_client.pipeline()
+        self._queue_update(pipe, kb_id, fields)
+        pipe.execute()
+        self._invalidate_local(kb_id)
         
         return kb
     
@@ -91,35 +368,84 @@ class KnowledgeBaseManager:
         if not kb:
             return False
         
-        kb.status = "deleted"
-        kb.updated_at = datetime.now().isoformat()
+        pipe = self.redis_client.pipeline()
+        self._queue_delete(pipe, kb)
+        pipe.execute()
+        self._invalidate_local(kb_id)
         
-        self.redis_client.hset(
-            f"{self.kb_prefix}{kb_id}",
-            mapping=kb.model_dump()
-        )
+        return True
+    
+    async def adelete_knowledge_base(self, kb_id: str) -> bool:
+        kb = await self.aget_knowledge_base(kb_id)
+        if not kb:
+            return False
+        
+        async with self.async_redis.pipeline() as pipe:
+            self._queue_delete(pipe, kb)
+            await pipe.execute()
+        self._invalidate_local(kb_id)
         
         return True
     
+    def add_kb_file(self, kb_id: str, file_path: str) -> bool:
+        """False when the file is already part of the knowledge base"""
+        return bool(self.redis_client.sadd(f"{self.kb_prefix}{kb_id}{self.kb_files_suffix}", file_path))
+    
+    async def aadd_kb_file(self, kb_id: str, file_path: str) -> bool:
+        return bool(await self.async_redis.sadd(f"{self.kb_prefix}{kb_id}{self.kb_files_suffix}", file_path))
+    
+    def remove_kb_file(self, kb_id: str, *file_paths: str):
+        if file_paths:
+            self.redis_client.srem(f"{self.kb_prefix}{kb_id}{self.kb_files_suffix}", *file_paths)
+    
+    async def aremove_kb_file(self, kb_id: str, *file_paths: str):
+        if file_paths:
+            await self.async_redis.srem(f"{self.kb_prefix}{kb_id}{self.kb_files_suffix}", *file_paths)
+    
+    def get_kb_files(self, kb_id: str) -> List[str]:
+        files = self.redis_client.smembers(f"{self.kb_prefix}{kb_id}{self.kb_files_suffix}")
+        return [f.decode() for f in files]
+    
+    def is_file_referenced(self, file_path: str, exclude_kb_id: str = None) -> bool:
+        kb_ids = [kb_id.decode() for kb_id in self.redis_client.lrange(self.kb_list_key, 0, -1)]
+        pipe = self.redis_client.pipeline()
+        for kb_id in kb_ids:
+            pipe.sismember(f"{self.kb_prefix}{kb_id}{self.kb_files_suffix}", file_path)
+        return any(found for kb_id, found in zip(kb_ids, pipe.execute()) if kb_id != exclude_kb_id)
+    
+    def get_pending_gc(self) -> List[str]:
+        return [kb_id.decode() for kb_id in self.redis_client.smembers(self.gc_pending_key)]
+    
+    def purge_knowledge_base(self, kb_id: str):
+        """Remove every Redis trace of a deleted knowledge base"""
+        pipe = self.redis_client.pipeline()
+        self._queue_purge(pipe, kb_id)
+        pipe.execute()
+        self._invalidate_local(kb_id)
+    
     def get_active_knowledge_bases(self) -> List[KnowledgeBase]:
         all_kbs = self.list_knowledge_bases()
         return [kb for kb in all_kbs if kb.status == "active"]
     
-    def update_kb_stats(self, kb_id: str, file_count: int = None, vector_count: int = None):
-        update_data = {}
-        if file_count is not None:
-            update_data["file_count"] = file_count
-        if vector_count is not None:
-            update_data["vector_count"] = vector_count
-        
-        if update_data:
-            self.update_knowledge_base(kb_id, **update_data)
+    async def aget_active_knowledge_bases(self) -> List[KnowledgeBase]:
+        return [kb for kb in await self.alist_knowledge_bases() if kb.status == "active"]
+    
+    def update_kb_stats(self, kb_id: str, files_added: int = 0, vectors_added: int = 0) -> Optional[int]:
+        """Increment the file and vector counts and bump the version, returns the new version or None when the knowledge base is gone"""
+        version = self._scripts["increment_stats"](**self._increment_script_args(kb_id, files_added, vectors_added))
+        self._invalidate_local(kb_id)
+        return version
     
     def get_kb_by_name(self, name: str) -> Optional[KnowledgeBase]:
-        all_kbs = self.list_knowledge_bases()
-        for kb in all_kbs:
-            if kb.name == name:
-                return kb
-        return None
+        kb_id = self.redis_client.hget(self.kb_names_key, name)
+        return self.get_knowledge_base(kb_id.decode()) if kb_id else None
+    
+    async def aget_kb_by_name(self, name: str) -> Optional[KnowledgeBase]:
+        kb_id = await self.async_redis.hget(self.kb_names_key, name)
+        return await self.aget_knowledge_base(kb_id.decode()) if kb_id else None
+    
+    def add_knowledge_tag(self, tag: str) -> bool:
+        """False when the tag already exists"""
+        return bool(self._scripts["add_tag"](keys=[self.rag_tag_key], args=[tag]))
 
-kb_manager = KnowledgeBaseManager() 
\ No newline at end of file
+kb_manager = LazyObject(KnowledgeBaseManager)
\ No newline at end of file
@@ -0,0 +1,55 @@
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+# BM25 term-frequency saturation and length normalisation, IDF is applied by Qdrant (Modifier.IDF)
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_AVG_DOC_LENGTH = 150
+
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+(?:[./:-][A-Za-z0-9_]+)*|[一-鿿]")
+_CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; identifiers, paths and dotted names are kept whole and also split into their parts"""
+    tokens = []
+    for match in _TOKEN_PATTERN.findall(text):
+        tokens.append(match.lower())
+        parts = [part for word in re.split(r"[./:_-]+", match) for part in _CAMEL_PATTERN.findall(word)]
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+def term_index(term: str) -> int:
+    """Stable across processes, unlike hash()"""
+    return zlib.crc32(term.encode("utf-8")) & 0x7FFFFFFF
+
+
+def document_sparse_vector(text: str) -> Tuple[List[int], List[float]]:
+    tokens = tokenize(text)
+    length_norm = 1 - BM25_B + BM25_B * len(tokens) / BM25_AVG_DOC_LENGTH
+    weights: Dict[int, float] = {}
+    for term, tf in Counter(tokens).items():
+        index = term_index(term)
+        weights[index] = weights.get(index, 0.0) + tf * (BM25_K1 + 1) / (tf + BM25_K1 * length_norm)
+    return list(weights.keys()), list(weights.values())
+
+
+def query_sparse_vector(text: str) -> Tuple[List[int], List[float]]:
+    indices = sorted({term_index(term) for term in tokenize(text)})
+    return indices, [1.0] * len(indices)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Merge ranked key lists, score(key) = sum over lists of 1 / (k + rank)"""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,284 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+PARSE_WORKERS = int(os.getenv("RAG_PARSE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Per task from the moment a worker starts it, a document still parsing after this long has its worker killed
+PARSE_TIMEOUT = float(os.getenv("RAG_PARSE_TIMEOUT", "120"))
+# PDFs with at least this many pages are parsed as page ranges in parallel
+PDF_PARALLEL_MIN_PAGES = 40
+PDF_PAGES_PER_TASK = 20
+# Formats whose loaders are slow enough to be worth a worker process, plain text and CSV load in-process
+POOL_EXTENSIONS = {".pdf", ".docx", ".doc", ".md"}
+
+
+def load_document(file_path: str) -> List[Document]:
+    """Load document from file path based on file extension"""
+    file_path = Path(file_path)
+
+    if not file_path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    file_extension = file_path.suffix.lower()
+
+    # langchain_community is slow to import, loaded on the first document
+    from langchain_community.document_loaders import (
+        TextLoader,
+        Docx2txtLoader,
+        UnstructuredMarkdownLoader,
+        CSVLoader,
+        GitHubIssuesLoader
+    )
+    from langchain_community.document_loaders.pdf import PyPDFLoader
+
+    try:
+        if file_extension == '.txt':
+            loader = TextLoader(str(file_path), encoding='utf-8')
+        elif file_extension == '.pdf':
+            loader = PyPDFLoader(str(file_path))
+        elif file_extension in ['.docx', '.doc']:
+            loader = Docx2txtLoader(str(file_path))
+        elif file_extension == '.md':
+            loader = UnstructuredMarkdownLoader(str(file_path))
+        elif file_extension == '.csv':
+            loader = CSVLoader(str(file_path))
+        elif file_extension == '.github':
+            loader = GitHubIssuesLoader(repo_name="langchain-ai/langchain", access_token=os.getenv("access_token"), max_issues=10)
+        else:
+            raise ValueError(f"Unsupported file type: {file_extension}")
+
+        documents = loader.load()
+        return documents
+
+    except Exception as e:
+        raise Exception(f"Error loading document {file_path}: {str(e)}")
+
+
+def load_pdf_pages(file_path: str, start: int, end: int) -> List[Document]:
+    """Pages [start, end) of a PDF, same metadata as PyPDFLoader"""
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    return [
+        Document(page_content=reader.pages[page].extract_text(), metadata={"source": file_path, "page": page})
+        for page in range(start, end)
+    ]
+
+
+def load_pdf_head(file_path: str) -> Tuple[List[Document], int]:
+    """Counts the pages of a PDF in the worker, returns (documents, page count).
+
+    A small PDF is loaded whole and the count is 0. A large one returns its first page range and
+    the count, the caller fans the other ranges out to more workers.
+    """
+    from pypdf import PdfReader
+    page_count = len(PdfReader(file_path).pages)
+    if page_count < PDF_PARALLEL_MIN_PAGES:
+        return load_document(file_path), 0
+    return load_pdf_pages(file_path, 0, min(PDF_PAGES_PER_TASK, page_count)), page_count
+
+
+def _plan(file_path: str) -> List[tuple]:
+    """Worker tasks for one file as (function, args), opening a PDF is left to a worker under the parse deadline"""
+    if Path(file_path).suffix.lower() == ".pdf":
+        return [(load_pdf_head, (file_path,))]
+    return [(load_document, (file_path,))]
+
+
+def _pdf_range_tasks(file_path: str, page_count: int) -> List[tuple]:
+    """Page ranges of a large PDF after the first one, which load_pdf_head already parsed"""
+    return [
+        (load_pdf_pages, (file_path, start, min(start + PDF_PAGES_PER_TASK, page_count)))
+        for start in range(PDF_PAGES_PER_TASK, page_count, PDF_PAGES_PER_TASK)
+    ]
+
+
+def _worker_main(conn):
+    """Run tasks received on the pipe until it closes"""
+    while True:
+        try:
+            func, args = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            conn.send((True, func(*args)))
+        except Exception as e:
+            try:
+                conn.send((False, e))
+            except Exception:
+                # The exception does not pickle
+                conn.send((False, Exception(str(e))))
+
+
+class WorkerCrashed(Exception):
+    pass
+
+
+class ParseWorker:
+    """A parse process that runs one task at a time, so a stuck document can be killed without touching other tasks"""
+
+    def __init__(self):
+        # spawn: forking a process that holds torch and client threads is not safe
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.is_alive()
+
+    def submit(self, func, args):
+        self.conn.send((func, args))
+
+    def result(self):
+        """Result of the submitted task, raises its exception or WorkerCrashed if the process died"""
+        try:
+            ok, value = self.conn.recv()
+        except (EOFError, OSError):
+            self.process.join(timeout=1)
+            raise WorkerCrashed(f"parse worker exited with code {self.process.exitcode}")
+        if not ok:
+            raise value
+        return value
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+# Idle workers are reused across calls, at most PARSE_WORKERS tasks run at once over all callers
+_idle_workers: List[ParseWorker] = []
+_worker_slots = threading.BoundedSemaphore(PARSE_WORKERS)
+_workers_lock = threading.Lock()
+
+
+def _acquire_worker(blocking: bool) -> Optional[ParseWorker]:
+    if not _worker_slots.acquire(blocking=blocking):
+        return None
+    with _workers_lock:
+        while _idle_workers:
+            worker = _idle_workers.pop()
+            if worker.alive:
+                return worker
+    try:
+        return ParseWorker()
+    except BaseException:
+        _worker_slots.release()
+        raise
+
+
+def _release_worker(worker: ParseWorker, reuse: bool = True):
+    if reuse and worker.alive:
+        with _workers_lock:
+            _idle_workers.append(worker)
+    else:
+        worker.kill()
+    _worker_slots.release()
+
+
+def parse_files(file_paths: List[str], timeout: float = PARSE_TIMEOUT) -> Iterator[Tuple[str, List[Document], Optional[Exception]]]:
+    """Parse files in worker processes, yields (file_path, documents, error) in completion order"""
+    tasks = deque()
+    parts = []
+    for file_index, file_path in enumerate(file_paths):
+        plan = _plan(file_path)
+        parts.append([None] * len(plan))
+        tasks.extend((file_index, part_index, task, 0) for part_index, task in enumerate(plan))
+
+    running = {}  # worker -> (file_index, part_index, task, attempt, deadline)
+    failed = set()
+
+    try:
+        while tasks or running:
+            while tasks:
+                file_index, part_index, (func, args), attempt = tasks[0]
+                if file_index in failed:
+                    tasks.popleft()
+                    continue
+                # Blocks only when this call has nothing running, workers are freed by other calls
+                worker = _acquire_worker(blocking=not running)
+                if worker is None:
+                    break
+                tasks.popleft()
+                worker.submit(func, args)
+                # Workers are idle when they get a task, so the deadline counts from the moment it starts
+                running[worker] = (file_index, part_index, (func, args), attempt, time.monotonic() + timeout)
+            if not running:
+                break
+
+            next_deadline = min(entry[4] for entry in running.values())
+            wait_timeout = max(0, next_deadline - time.monotonic())
+            if tasks:
+                # Check again soon for workers freed by other calls
+                wait_timeout = min(wait_timeout, 0.5)
+            ready = multiprocessing.connection.wait([worker.conn for worker in running], timeout=wait_timeout)
+
+            for worker in [worker for worker in running if worker.conn in ready]:
+                file_index, part_index, task, attempt, _ = running.pop(worker)
+                try:
+                    result = worker.result()
+                except WorkerCrashed as e:
+                    _release_worker(worker, reuse=False)
+                    # Retry once on a fresh worker, loaders can crash on resources like memory
+                    if attempt == 0 and file_index not in failed:
+                        tasks.appendleft((file_index, part_index, task, 1))
+                        continue
+                    if file_index not in failed:
+                        failed.add(file_index)
+                        yield file_paths[file_index], [], e
+                    continue
+                except Exception as e:
+                    _release_worker(worker)
+                    if file_index not in failed:
+                        failed.add(file_index)
+                        yield file_paths[file_index], [], e
+                    continue
+                _release_worker(worker)
+                if file_index in failed:
+                    continue
+                if task[0] is load_pdf_head:
+                    result, page_count = result
+                    ranges = _pdf_range_tasks(file_paths[file_index], page_count)
+                    # Queued first so a large PDF finishes before more files start
+                    tasks.extendleft(reversed([(file_index, len(parts[file_index]) + i, range_task, 0) for i, range_task in enumerate(ranges)]))
+                    parts[file_index].extend([None] * len(ranges))
+                parts[file_index][part_index] = result
+                if all(part is not None for part in parts[file_index]):
+                    yield file_paths[file_index], [document for part in parts[file_index] for document in part], None
+
+            now = time.monotonic()
+            for worker in [worker for worker, entry in running.items() if entry[4] <= now]:
+                # Only the stuck worker is killed, other tasks keep running
+                file_index = running.pop(worker)[0]
+                _release_worker(worker, reuse=False)
+                if file_index not in failed:
+                    failed.add(file_index)
+                    logger.warning(f"parsing {file_paths[file_index]} timed out after {timeout:.0f}s")
+                    yield file_paths[file_index], [], TimeoutError(f"Parsing {file_paths[file_index]} timed out after {timeout:.0f}s")
+    finally:
+        # The caller stopped early, results of tasks still running are not wanted
+        for worker in running:
+            _release_worker(worker, reuse=False)
+
+
+def parse_document(file_path: str, timeout: float = PARSE_TIMEOUT) -> List[Document]:
+    """Parse one file, in a worker process for slow formats, raises on failure or timeout"""
+    if Path(file_path).suffix.lower() not in POOL_EXTENSIONS:
+        return load_document(file_path)
+    for _, documents, error in parse_files([file_path], timeout):
+        if error:
+            raise error
+        return documents
+    return []
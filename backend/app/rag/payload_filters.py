@@ -0,0 +1,61 @@
+from pathlib import PurePosixPath
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from qdrant_client.models import Filter
+
+# Chunk metadata is stored under the "metadata" payload key (langchain Qdrant layout),
+# values are qdrant_client.models.PayloadSchemaType names
+PAYLOAD_INDEXES: Dict[str, str] = {
+    "metadata.kb_id": "keyword",
+    "metadata.knowledge": "keyword",
+    "metadata.file_type": "keyword",
+    "metadata.source": "keyword",
+    "metadata.path_prefixes": "keyword",
+    "metadata.defines": "keyword",
+}
+
+
+def path_prefixes(source: str) -> List[str]:
+    """Every directory prefix of a source path plus the path itself, so a prefix filter is an exact keyword match"""
+    parts = PurePosixPath(str(source).replace("\\", "/").strip("/")).parts
+    return ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+
+
+def normalize_filters(file_types: Optional[List[str]] = None, path_prefix: Optional[str] = None,
+                      repository: Optional[str] = None, symbol: Optional[str] = None) -> Optional[dict]:
+    filters = {}
+    if file_types:
+        filters["file_types"] = sorted({
+            file_type.lower() if file_type.startswith(".") else f".{file_type.lower()}" for file_type in file_types
+        })
+    if path_prefix and path_prefix.strip("/"):
+        filters["path_prefix"] = path_prefix.replace("\\", "/").strip("/")
+    if repository:
+        filters["repository"] = repository
+    if symbol and symbol.strip():
+        filters["symbol"] = symbol.strip()
+    return filters or None
+
+
+def filters_cache_key(filters: Optional[dict]) -> tuple:
+    if not filters:
+        return ()
+    return tuple(sorted((key, tuple(value) if isinstance(value, list) else value) for key, value in filters.items()))
+
+
+def build_filter(filters: Optional[dict]) -> Optional["Filter"]:
+    """Translate normalized filters into a Qdrant filter evaluated server-side with the payload indexes"""
+    if not filters:
+        return None
+    from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue
+    conditions = []
+    if filters.get("file_types"):
+        conditions.append(FieldCondition(key="metadata.file_type", match=MatchAny(any=filters["file_types"])))
+    if filters.get("path_prefix"):
+        conditions.append(FieldCondition(key="metadata.path_prefixes", match=MatchValue(value=filters["path_prefix"])))
+    if filters.get("repository"):
+        conditions.append(FieldCondition(key="metadata.knowledge", match=MatchValue(value=filters["repository"])))
+    if filters.get("symbol"):
+        conditions.append(FieldCondition(key="metadata.defines", match=MatchValue(value=filters["symbol"])))
+    return Filter(must=conditions) if conditions else None
@@ -0,0 +1,143 @@
+import ast
+import re
+import logging
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from langchain_core.documents import Document
+
+from app.rag.code_splitter import LANGUAGE_BY_EXTENSION, LANGUAGE_PATTERNS, _NON_SYMBOL_WORDS
+
+logger = logging.getLogger(__name__)
+
+_IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+_TYPE_KEYWORDS = re.compile(r"\b(?:class|interface|enum|struct|union|trait|type|record|protocol|object|module|namespace|extension|impl)\b")
+
+
+class Definition(NamedTuple):
+    name: str
+    qualname: str
+    kind: str
+    line: int
+    end_line: int
+
+
+class FileSymbols(NamedTuple):
+    language: str
+    definitions: List[Definition]
+    # identifier -> lines it appears on, definition lines excluded
+    references: Dict[str, List[int]]
+
+
+def language_for(path: str) -> Optional[str]:
+    dot = path.rfind(".")
+    return LANGUAGE_BY_EXTENSION.get(path[dot:].lower()) if dot >= 0 else None
+
+
+def extract_symbols(text: str, language: str) -> FileSymbols:
+    """Definitions and identifier references of a source file, Python through ast, other languages through the splitter patterns"""
+    if language == "python":
+        try:
+            return _python_symbols(text)
+        except (SyntaxError, ValueError):
+            pass
+    lines = text.splitlines()
+    definitions = _pattern_definitions(lines, language)
+    def_lines = {(d.name, d.line) for d in definitions}
+    references = defaultdict(list)
+    for line_no, line in enumerate(lines, 1):
+        for name in dict.fromkeys(_IDENTIFIER.findall(line)):
+            if (name, line_no) not in def_lines and name not in _NON_SYMBOL_WORDS:
+                references[name].append(line_no)
+    return FileSymbols(language, definitions, dict(references))
+
+
+def _python_symbols(text: str) -> FileSymbols:
+    tree = ast.parse(text)
+    definitions = []
+
+    def visit(node, parent: Optional[str], in_class: bool):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                qualname = f"{parent}.{child.name}" if parent else child.name
+                kind = "class" if isinstance(child, ast.ClassDef) else ("method" if in_class else "function")
+                definitions.append(Definition(child.name, qualname, kind, child.lineno, child.end_lineno))
+                visit(child, qualname, isinstance(child, ast.ClassDef))
+            elif isinstance(child, (ast.Assign, ast.AnnAssign)) and (parent is None or in_class):
+                # Module constants and class attributes
+                targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                for target in targets:
+                    if isinstance(target, ast.Name):
+                        qualname = f"{parent}.{target.id}" if parent else target.id
+                        definitions.append(Definition(target.id, qualname, "variable", child.lineno, child.end_lineno))
+            elif not isinstance(child, ast.expr):
+                visit(child, parent, False if parent is None else in_class)
+
+    visit(tree, None, False)
+    def_lines = {(d.name, d.line) for d in definitions if d.kind != "variable"}
+
+    references = defaultdict(set)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            references[node.id].add(node.lineno)
+        elif isinstance(node, ast.Attribute):
+            references[node.attr].add(node.end_lineno)
+        elif isinstance(node, ast.alias) and hasattr(node, "lineno"):
+            for name in {node.name.split(".")[-1], node.asname} - {None}:
+                references[name].add(node.lineno)
+    return FileSymbols("python", sorted(definitions, key=lambda d: d.line), {
+        name: sorted(line for line in lines if (name, line) not in def_lines) for name, lines in references.items()
+    })
+
+
+def _pattern_definitions(lines: List[str], language: str) -> List[Definition]:
+    patterns = [re.compile(pattern) for pattern in LANGUAGE_PATTERNS.get(language, [])]
+    found = []
+    for line_no, line in enumerate(lines, 1):
+        for pattern in patterns:
+            match = pattern.match(line)
+            if not match:
+                continue
+            groups = match.groupdict()
+            name = groups.get("name") or groups.get("type_name")
+            if not name or name in _NON_SYMBOL_WORDS or groups.get("type") in _NON_SYMBOL_WORDS:
+                continue
+            kind = "class" if groups.get("type_name") or _TYPE_KEYWORDS.search(line[:match.end()]) else "function"
+            found.append((line_no, len(groups["indent"].expandtabs(4)), name, kind))
+            break
+
+    # Nesting and extent follow indentation: a definition ends where the next one at its level or above starts
+    definitions = []
+    stack = []
+    for i, (line_no, indent, name, kind) in enumerate(found):
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        qualname = ".".join([entry[1] for entry in stack] + [name])
+        end_line = next((other[0] - 1 for other in found[i + 1:] if other[1] <= indent), len(lines))
+        if stack and kind == "function" and stack[-1][2] == "class":
+            kind = "method"
+        definitions.append(Definition(name, qualname, kind, line_no, max(end_line, line_no)))
+        stack.append((indent, name, kind))
+    return definitions
+
+
+def annotate_definitions(source: List[Document], chunks: List[Document]) -> List[Document]:
+    """Set metadata["defines"] of code chunks to the symbols defined in their line range, by name and qualified name"""
+    if len(source) != 1:
+        return chunks
+    language = language_for(str(source[0].metadata.get("file_type") or source[0].metadata.get("source", "")))
+    if not language:
+        return chunks
+    try:
+        definitions = extract_symbols(source[0].page_content, language).definitions
+    except Exception as e:
+        logger.warning(f"symbol extraction failed for {source[0].metadata.get('source')}: {e}")
+        return chunks
+    for chunk in chunks:
+        start, end = chunk.metadata.get("start_line"), chunk.metadata.get("end_line")
+        if start is None or end is None:
+            continue
+        defines = [d for d in definitions if start <= d.line <= end and d.kind != "variable"]
+        if defines:
+            chunk.metadata["defines"] = list(dict.fromkeys([d.name for d in defines] + [d.qualname for d in defines]))
+    return chunks
@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from qdrant_client import QdrantClient, AsyncQdrantClient
+
+# "remote": Qdrant server (REST or gRPC), for production
+# "local": embedded on-disk storage at VECTOR_DB_PATH, single process only since the storage is locked by its client
+# "memory": embedded in-memory storage, for tests and benchmarks
+# Embedded modes are single-process: the API serves the RAG tools in-process and the rag_tools server refuses to start
+QDRANT_MODE = os.getenv("QDRANT_MODE", "remote")
+VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "./vector_db")
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() in ("1", "true", "yes")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "30"))
+
+# gRPC channel tuning, large upserts and search responses exceed the 4MB default message size
+QDRANT_GRPC_OPTIONS = {
+    "grpc.max_send_message_length": 64 * 1024 * 1024,
+    "grpc.max_receive_message_length": 64 * 1024 * 1024,
+    "grpc.keepalive_time_ms": 30000,
+    "grpc.keepalive_timeout_ms": 10000,
+    "grpc.keepalive_permit_without_calls": 1,
+}
+
+_client: Optional["QdrantClient"] = None
+_async_client: Optional["AsyncQdrantClient"] = None
+_client_lock = threading.Lock()
+
+
+def _remote_params() -> dict:
+    connection = {"url": QDRANT_URL} if QDRANT_URL else {"host": QDRANT_HOST, "port": QDRANT_PORT}
+    return dict(
+        **connection,
+        grpc_port=QDRANT_GRPC_PORT,
+        prefer_grpc=QDRANT_PREFER_GRPC,
+        grpc_options=QDRANT_GRPC_OPTIONS if QDRANT_PREFER_GRPC else None,
+        api_key=QDRANT_API_KEY,
+        timeout=QDRANT_TIMEOUT,
+    )
+
+
+def create_qdrant_client(mode: str = None) -> "QdrantClient":
+    from qdrant_client import QdrantClient
+    mode = mode or QDRANT_MODE
+    if mode == "memory":
+        return QdrantClient(location=":memory:")
+    if mode == "local":
+        os.makedirs(VECTOR_DB_PATH, exist_ok=True)
+        return QdrantClient(path=VECTOR_DB_PATH)
+    if mode == "remote":
+        return QdrantClient(**_remote_params())
+    raise ValueError(f"Unsupported Qdrant mode: {mode}. Supported modes: remote, local, memory")
+
+
+def get_qdrant_client() -> "QdrantClient":
+    """Process-wide client shared by all collections, embedded modes only work with a single client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_qdrant_client()
+    return _client
+
+
+def get_async_qdrant_client() -> Optional["AsyncQdrantClient"]:
+    """Process-wide async client for remote mode, None for embedded modes whose storage belongs to the sync client"""
+    global _async_client
+    if QDRANT_MODE != "remote":
+        return None
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                from qdrant_client import AsyncQdrantClient
+                _async_client = AsyncQdrantClient(**_remote_params())
+    return _async_client
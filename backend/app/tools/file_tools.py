@@ -1,4 +1,117 @@
 from langchain_community.agent_toolkits.file_management import FileManagementToolkit
-import os
+from langchain_core.tools import StructuredTool, ToolException
+from pydantic import BaseModel, Field
+from typing import Optional
+import linecache
 
-file_tools = FileManagementToolkit(root_dir=os.getcwd()).get_tools()
\ No newline at end of file
+from app.utils.workspace import WORKSPACE_ROOT, READ_MAX_LINES, SEARCH_MAX_MATCHES, format_lines, format_search, read_lines, resolve_path, search_workspace
+from app.utils.symbol_index import symbol_index
+
+SYMBOL_MAX_RESULTS = 50
+
+
+class ReadFileLinesInput(BaseModel):
+    file_path: str = Field(description="Path of the file, relative to the workspace", examples=["app/main.py"])
+    start_line: int = Field(default=1, description="First line to read, 1-based")
+    end_line: Optional[int] = Field(default=None, description=f"Last line to read, inclusive. At most {READ_MAX_LINES} lines are returned")
+
+
+class SearchWorkspaceInput(BaseModel):
+    pattern: str = Field(description="Python regular expression searched line by line", examples=["def agent_respond", r"class \w+Manager"])
+    glob: Optional[str] = Field(default=None, description="Only search files matching this glob", examples=["*.py", "app/api/*"])
+    ignore_case: bool = Field(default=False, description="Case insensitive search")
+    context: int = Field(default=2, description="Lines of context shown around each match", ge=0, le=10)
+    max_matches: int = Field(default=50, description=f"Stop after this many matches, at most {SEARCH_MAX_MATCHES}", ge=1)
+
+
+class FindSymbolInput(BaseModel):
+    name: str = Field(description="Function, class, method or variable name, optionally qualified", examples=["agent_respond", "KnowledgeManager.get_knowledge_base"])
+    include_references: bool = Field(default=False, description="Also list the lines where the name is used")
+
+
+class FileOutlineInput(BaseModel):
+    file_path: str = Field(description="Path of the source file, relative to the workspace", examples=["app/rag/knowledge_manager.py"])
+
+
+def read_file_lines(file_path: str, start_line: int = 1, end_line: Optional[int] = None) -> str:
+    try:
+        return format_lines(read_lines(file_path, start_line, end_line))
+    except (OSError, ValueError) as e:
+        raise ToolException(str(e))
+
+
+def search_files(pattern: str, glob: Optional[str] = None, ignore_case: bool = False, context: int = 2, max_matches: int = 50) -> str:
+    try:
+        return format_search(search_workspace(pattern, glob, ignore_case, context, max_matches))
+    except Exception as e:
+        raise ToolException(f"search failed: {e}")
+
+
+def _source_line(path: str, line: int) -> str:
+    return linecache.getline(str(resolve_path(path)), line).strip()
+
+
+def find_symbol(name: str, include_references: bool = False) -> str:
+    name = name.strip()
+    ready = symbol_index.wait_ready()
+    definitions = symbol_index.find_definitions(name)
+    lines = [f"{path}:{d.line}-{d.end_line} {d.kind} {d.qualname}" for path, d in definitions[:SYMBOL_MAX_RESULTS]]
+    if not definitions:
+        lines.append(f"no definition of {name}")
+        suggestions = symbol_index.suggest(name)
+        if suggestions:
+            lines.append(f"similar names: {', '.join(suggestions)}")
+    if include_references:
+        references = symbol_index.find_references(name)
+        linecache.checkcache()
+        lines.append(f"{len(references)} references" + (f", first {SYMBOL_MAX_RESULTS}" if len(references) > SYMBOL_MAX_RESULTS else ""))
+        lines.extend(f"{path}:{line}:{_source_line(path, line)}" for path, line in references[:SYMBOL_MAX_RESULTS])
+    if not ready:
+        lines.append("[the symbol index is still being built, results may be incomplete]")
+    return "\n".join(lines)
+
+
+def file_outline(file_path: str) -> str:
+    symbol_index.wait_ready()
+    try:
+        relative = resolve_path(file_path).relative_to(symbol_index.root).as_posix()
+    except ValueError as e:
+        raise ToolException(str(e))
+    definitions = symbol_index.outline(relative)
+    if definitions is None:
+        raise ToolException(f"{file_path} is not an indexed source file")
+    return "\n".join(f"{'  ' * d.qualname.count('.')}{d.line}-{d.end_line} {d.kind} {d.name}" for d in definitions) or f"no definitions in {file_path}"
+
+
+workspace_tools = [
+    StructuredTool.from_function(
+        func=read_file_lines,
+        name="read_file_lines",
+        description="Read a line range of a file with line numbers. Prefer it over read_file for large files, search first to find the lines",
+        args_schema=ReadFileLinesInput,
+        handle_tool_error=True,
+    ),
+    StructuredTool.from_function(
+        func=search_files,
+        name="search_workspace",
+        description="Regex search across the workspace files, skipping .gitignore'd and binary files. Returns path:line:text matches with context lines",
+        args_schema=SearchWorkspaceInput,
+        handle_tool_error=True,
+    ),
+    StructuredTool.from_function(
+        func=find_symbol,
+        name="find_symbol",
+        description="Find where a function, class, method or variable is defined and optionally used (usages match by name), from an index of the workspace kept up to date as files change",
+        args_schema=FindSymbolInput,
+        handle_tool_error=True,
+    ),
+    StructuredTool.from_function(
+        func=file_outline,
+        name="file_outline",
+        description="List the classes, functions and methods of a source file with their line ranges",
+        args_schema=FileOutlineInput,
+        handle_tool_error=True,
+    ),
+]
+
+file_tools = FileManagementToolkit(root_dir=WORKSPACE_ROOT).get_tools() + workspace_tools
@@ -1,4 +1,5 @@
-from app.utils.mcp import create_mcp_stdio_client
+from app.utils.mcp import create_mcp_client
+from app.tools.shell_tools import with_output_streaming
 
 async def get_stdio_powershell_tools():
     params = {
@@ -6,6 +7,7 @@ async def get_stdio_powershell_tools():
         "args": ["app/mcp/powershell_tools.py"]
     }
     
-    client, tools = await create_mcp_stdio_client("powershell_tools", params)
+    client, tools = await create_mcp_client("powershell_tools", params)
     
-    return tools
+    # Output streaming and one PowerShell session per chat, as for run_shell
+    return [with_output_streaming(client, "powershell_tools", tool) if "session_id" in tool.args_schema["properties"] else tool for tool in tools]
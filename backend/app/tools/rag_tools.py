@@ -1,12 +1,53 @@
-from app.utils.mcp import create_mcp_stdio_client
+import asyncio
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool
+from app.utils.mcp import create_mcp_client
+
+
+class QueryRagInput(BaseModel):
+    query: str = Field(description="Query content to search in knowledge base", examples=["terminal operation standards"])
+    file_types: Optional[List[str]] = Field(default=None, description="Only search these file extensions", examples=[[".py", ".md"]])
+    path_prefix: Optional[str] = Field(default=None, description="Only search files under this path", examples=["src/api"])
+    repository: Optional[str] = Field(default=None, description="Only search this git repository (project name)", examples=["agent-code"])
+    symbol: Optional[str] = Field(default=None, description="Only search code chunks defining this function or class (git repositories)", examples=["KnowledgeManager.get_knowledge_base"])
+
+
+def with_kb_selection(tool: BaseTool) -> BaseTool:
+    """Hide kb_ids from the model and fill it from the run config of the chat request"""
+    async def query_rag(config: RunnableConfig, **arguments) -> str:
+        kb_ids = config.get("configurable", {}).get("kb_ids") or []
+        arguments = {key: value for key, value in arguments.items() if value is not None}
+        return await tool.ainvoke({**arguments, "kb_ids": kb_ids})
+
+    return StructuredTool.from_function(
+        coroutine=query_rag,
+        name=tool.name,
+        description=tool.description,
+        args_schema=QueryRagInput,
+    )
+
+
+def get_local_rag_tools() -> List[BaseTool]:
+    """The rag_tools server's tools, run inside this process"""
+    from app.mcp.rag_tools import query_rag, upload_file_to_rag
+    return [StructuredTool.from_function(func=query_rag), StructuredTool.from_function(func=upload_file_to_rag)]
 
 
 async def get_stdio_rag_tools():
+    from app.rag.vector_store import QDRANT_MODE
+    if QDRANT_MODE != "remote":
+        # Embedded storage is opened by this process only, a tool server process would fail on its lock
+        # (local) or search a store of its own (memory). The import is heavy, kept off the event loop
+        tools = await asyncio.to_thread(get_local_rag_tools)
+        return [with_kb_selection(tool) if tool.name == "query_rag" else tool for tool in tools]
+
     params = {
         "command": "python",
         "args": ["app/mcp/rag_tools.py"]
     }
 
-    client, tools = await create_mcp_stdio_client("rag_tools", params)
+    client, tools = await create_mcp_client("rag_tools", params)
 
-    return tools
\ No newline at end of file
+    return [with_kb_selection(tool) if tool.name == "query_rag" else tool for tool in tools]
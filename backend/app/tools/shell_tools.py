@@ -1,11 +1,57 @@
-from app.utils.mcp import create_mcp_stdio_client
+from langchain_core.runnables import RunnableConfig
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langgraph.config import get_stream_writer
+from app.utils.mcp import create_mcp_client, daemon_url
+
+
+def with_output_streaming(client: MultiServerMCPClient, server_name: str, tool: BaseTool) -> BaseTool:
+    """Forward output the tool reports while running to the custom stream of the agent run.
+
+    session_id is hidden from the model. With a shared daemon it is set to the thread id, so each
+    chat keeps one shell, a stdio server only lives for one call and gets none.
+    """
+    args_schema = dict(tool.args_schema)
+    args_schema["properties"] = {name: field for name, field in args_schema["properties"].items() if name != "session_id"}
+    persistent_sessions = bool(daemon_url(server_name))
+
+    async def call_tool(config: RunnableConfig, **arguments) -> str:
+        try:
+            writer = get_stream_writer()
+        except RuntimeError:
+            # Called outside an agent run
+            writer = None
+
+        async def on_progress(progress: float, total: float, message: str):
+            if writer and message:
+                writer({"tool": tool.name, "output": message})
+
+        thread_id = (config or {}).get("configurable", {}).get("thread_id")
+        if persistent_sessions and thread_id:
+            arguments["session_id"] = thread_id
+
+        async with client.session(server_name) as session:
+            result = await session.call_tool(tool.name, arguments, progress_callback=on_progress)
+        text = "\n".join(content.text for content in result.content if content.type == "text")
+        if result.isError:
+            raise ToolException(text)
+        return text
+
+    return StructuredTool(
+        name=tool.name,
+        description=tool.description,
+        args_schema=args_schema,
+        coroutine=call_tool,
+        metadata=tool.metadata,
+    )
+
 
 async def get_stdio_shell_tools():
     params = {
         "command": "python",
         "args": ["app/mcp/shell_tools.py"]
     }
-    
-    client, tools = await create_mcp_stdio_client("shell_tools", params)
-    
-    return tools
+
+    client, tools = await create_mcp_client("shell_tools", params)
+
+    return [with_output_streaming(client, "shell_tools", tool) if tool.name == "run_shell" else tool for tool in tools]
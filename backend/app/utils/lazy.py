@@ -0,0 +1,48 @@
+import asyncio
+import importlib
+import threading
+from typing import Any, Callable
+
+
+class LazyObject:
+    """Stands in for a module-level singleton, the instance is built on first attribute access"""
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _get_instance(self) -> Any:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    object.__setattr__(self, "_instance", self._factory())
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get_instance(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._get_instance(), name, value)
+
+    def __repr__(self) -> str:
+        if self._instance is None:
+            return f"<LazyObject {getattr(self._factory, '__qualname__', self._factory)} (not loaded)>"
+        return repr(self._instance)
+
+
+def lazy_object(module_name: str, attribute: str) -> LazyObject:
+    """Proxy for module_name.attribute, the module is only imported on first use"""
+    return LazyObject(lambda: getattr(importlib.import_module(module_name), attribute))
+
+
+def is_loaded(proxy: LazyObject) -> bool:
+    """Whether the instance behind a proxy is built, checked without building it"""
+    return object.__getattribute__(proxy, "_instance") is not None
+
+
+async def aload(proxy: LazyObject) -> Any:
+    """Build the instance behind a proxy in a thread, slow imports stay off the event loop"""
+    if is_loaded(proxy):
+        return object.__getattribute__(proxy, "_instance")
+    return await asyncio.to_thread(proxy._get_instance)
@@ -0,0 +1,57 @@
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+
+
+class EventLoopLagMonitor:
+    """Measures how late the event loop wakes up a sleeping task, i.e. how long callbacks block it"""
+
+    def __init__(self, interval: float = 0.5, window: int = 600, slow_threshold_ms: float = 100.0):
+        self.interval = interval
+        self.slow_threshold_ms = slow_threshold_ms
+        self.samples = deque(maxlen=window)
+        self.max_lag_ms = 0.0
+        self.slow_count = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - start - self.interval) * 1000)
+            self.samples.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > self.slow_threshold_ms:
+                self.slow_count += 1
+
+    def stats(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"running": self._task is not None, "samples": 0}
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "samples": len(samples),
+            "last_ms": round(self.samples[-1], 2),
+            "p50_ms": round(samples[len(samples) // 2], 2),
+            "p99_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.99))], 2),
+            "max_ms": round(self.max_lag_ms, 2),
+            "slow_count": self.slow_count,
+            "slow_threshold_ms": self.slow_threshold_ms
+        }
+
+
+loop_monitor = EventLoopLagMonitor()
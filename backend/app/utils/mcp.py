@@ -1,5 +1,41 @@
+import os
+import asyncio
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import httpx
 from langchain_mcp_adapters.client import MultiServerMCPClient
 
+# Tool servers in app/mcp, each can run as a shared daemon: MCP_<NAME>_URL=http://127.0.0.1:8101/mcp or unix:///run/agent/rag_tools.sock
+MCP_SERVERS = ("shell_tools", "powershell_tools", "rag_tools")
+MCP_HTTP_PATH = "/mcp"
+MCP_HEALTH_TIMEOUT = 2.0
+
+
+def daemon_url(name: str) -> Optional[str]:
+    return os.getenv(f"MCP_{name.upper()}_URL")
+
+
+def _resolve_daemon_url(url: str) -> Tuple[str, Optional[str]]:
+    """HTTP base URL and Unix socket path of a daemon URL"""
+    parsed = urlparse(url)
+    if parsed.scheme == "unix":
+        return "http://localhost", parsed.path
+    return f"{parsed.scheme}://{parsed.netloc}", None
+
+
+def _uds_client_factory(uds: str):
+    def factory(headers: Dict[str, str] = None, timeout: httpx.Timeout = None, auth: httpx.Auth = None) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=uds),
+            headers=headers,
+            timeout=timeout,
+            auth=auth,
+            follow_redirects=True
+        )
+    return factory
+
+
 async def create_mcp_stdio_client(name, params):
     config = {
         name: {
@@ -14,3 +50,43 @@ async def create_mcp_stdio_client(name, params):
     tools = await client.get_tools()
     
     return client, tools
+
+
+async def create_mcp_http_client(name, url):
+    """Network counterpart of create_mcp_stdio_client for a long-lived daemon shared by all workers"""
+    base_url, uds = _resolve_daemon_url(url)
+    connection = {"transport": "streamable_http", "url": url}
+    if uds:
+        connection.update(url=base_url + MCP_HTTP_PATH, httpx_client_factory=_uds_client_factory(uds))
+
+    client = MultiServerMCPClient({name: connection})
+
+    tools = await client.get_tools()
+
+    return client, tools
+
+
+async def create_mcp_client(name, params):
+    """Connect to the daemon at MCP_<NAME>_URL when configured, spawn a stdio server otherwise"""
+    url = daemon_url(name)
+    if url:
+        return await create_mcp_http_client(name, url)
+    return await create_mcp_stdio_client(name, params)
+
+
+async def get_daemon_health() -> Dict[str, dict]:
+    """GET /health of every configured daemon"""
+    async def check(name: str, url: str) -> dict:
+        base_url, uds = _resolve_daemon_url(url)
+        transport = httpx.AsyncHTTPTransport(uds=uds) if uds else None
+        try:
+            async with httpx.AsyncClient(transport=transport, timeout=MCP_HEALTH_TIMEOUT) as client:
+                response = await client.get(f"{base_url}/health")
+                response.raise_for_status()
+                return response.json()
+        except Exception as e:
+            return {"name": name, "status": "unreachable", "url": url, "error": str(e)}
+
+    daemons = {name: daemon_url(name) for name in MCP_SERVERS if daemon_url(name)}
+    results = await asyncio.gather(*(check(name, url) for name, url in daemons.items()))
+    return dict(zip(daemons, results))
@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+import argparse
+import functools
+import inspect
+import threading
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict
+
+from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+LATENCY_WINDOW = 1000
+
+
+class ToolStats:
+    """Call counts and latency percentiles over the last LATENCY_WINDOW calls of one tool"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, seconds: float, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.errors += int(failed)
+            self.latencies.append(seconds * 1000)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            calls, errors, in_flight = self.calls, self.errors, self.in_flight
+
+        def percentile(q: float) -> float:
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2) if latencies else 0.0
+
+        return {
+            "calls": calls,
+            "errors": errors,
+            "in_flight": in_flight,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        }
+
+
+class ToolServer(FastMCP):
+    """FastMCP server that runs sync tools off the event loop and records per-tool stats.
+
+    Over stdio it behaves like FastMCP. As a daemon it serves streamable HTTP on a TCP port or a
+    Unix socket, stateless so any number of API workers can share it, with GET /health for stats.
+    """
+
+    def __init__(self, name: str, **settings):
+        super().__init__(name, stateless_http=True, **settings)
+        self.started_at = time.time()
+        self.tool_stats = defaultdict(ToolStats)
+        self.health_sources: Dict[str, Callable[[], Any]] = {}
+        self.custom_route("/health", methods=["GET"])(self._health)
+
+    def add_tool(self, fn: Callable[..., Any], *args, **kwargs):
+        if not inspect.iscoroutinefunction(fn):
+            sync_fn = fn
+
+            # Sync tools block, run them on worker threads so concurrent requests overlap
+            @functools.wraps(sync_fn)
+            async def fn(*fn_args, **fn_kwargs):
+                return await asyncio.to_thread(sync_fn, *fn_args, **fn_kwargs)
+
+        return super().add_tool(fn, *args, **kwargs)
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]):
+        stats = self.tool_stats[name]
+        stats.start()
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = await super().call_tool(name, arguments)
+            failed = False
+            return result
+        finally:
+            stats.finish(time.perf_counter() - start, failed)
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "status": "healthy",
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "tools": {name: stats.snapshot() for name, stats in self.tool_stats.items()},
+            **{name: source() for name, source in self.health_sources.items()},
+        }
+
+    async def _health(self, request: Request) -> JSONResponse:
+        return JSONResponse(self.health())
+
+    def serve(self):
+        """Entry point of the app/mcp servers, stdio unless started as a daemon"""
+        parser = argparse.ArgumentParser(description=f"{self.name} MCP server")
+        parser.add_argument("--transport", choices=["stdio", "http"], default=os.getenv("MCP_TRANSPORT", "stdio"))
+        parser.add_argument("--host", default="127.0.0.1", help="HTTP host (default: 127.0.0.1)")
+        parser.add_argument("--port", type=int, default=0, help="HTTP port")
+        parser.add_argument("--uds", help="Serve HTTP on this Unix socket instead of a TCP port")
+        args = parser.parse_args()
+
+        if args.transport == "stdio":
+            self.run(transport="stdio")
+            return
+
+        if not args.uds and not args.port:
+            parser.error("--port or --uds is required with --transport http")
+
+        import uvicorn
+        if args.uds:
+            os.makedirs(os.path.dirname(os.path.abspath(args.uds)), exist_ok=True)
+            if os.path.exists(args.uds):
+                os.unlink(args.uds)
+            # Socket clients send a bare "Host: localhost", FastMCP's rebinding check only allows "localhost:*"
+            security = self.settings.transport_security
+            if security and security.enable_dns_rebinding_protection:
+                security.allowed_hosts.append("localhost")
+            print(f"{self.name} MCP daemon on unix:{args.uds}{self.settings.streamable_http_path}")
+            uvicorn.run(self.streamable_http_app(), uds=args.uds, log_level="warning")
+        else:
+            print(f"{self.name} MCP daemon on http://{args.host}:{args.port}{self.settings.streamable_http_path}")
+            uvicorn.run(self.streamable_http_app(), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,115 @@
+import os
+import re
+import base64
+import shutil
+import asyncio
+import subprocess
+from typing import Optional
+
+from app.utils.process import BoundedOutput, kill_process_tree
+from app.utils.sandbox import ToolSandbox
+from app.utils.shell_session import ShellSession, ShellSessionClosed
+
+# pwsh (PowerShell 7) or Windows PowerShell. A POSIX shell can stand in, scripts then run as shell commands
+POWERSHELL_EXECUTABLE = os.getenv("POWERSHELL_EXECUTABLE") or shutil.which("pwsh") or shutil.which("powershell")
+POWERSHELL_START_TIMEOUT = float(os.getenv("POWERSHELL_START_TIMEOUT", "30"))
+# Line width objects are rendered at, Out-String wraps longer table rows
+POWERSHELL_OUTPUT_WIDTH = 4096
+
+# Sent once per session: UTF-8 output, no prompt, no progress records
+POWERSHELL_INIT = (
+    "[Console]::OutputEncoding = [Text.UTF8Encoding]::new($false); $OutputEncoding = [Console]::OutputEncoding; "
+    "$ProgressPreference = 'SilentlyContinue'; $ConfirmPreference = 'None'; function global:prompt { '' }"
+)
+
+
+def powershell_available() -> bool:
+    return bool(POWERSHELL_EXECUTABLE)
+
+
+def is_powershell(executable: str) -> bool:
+    return os.path.basename(executable).lower().split(".")[0] in ("pwsh", "powershell")
+
+
+class PowerShellSession(ShellSession):
+    """Headless PowerShell on pipes that keeps variables, functions, modules and location between scripts.
+
+    Each script is sent base64 encoded on one line and run by Invoke-Expression in the global scope,
+    with every output stream merged and rendered as text, followed by the session marker and the exit
+    status. Pipes carry no Ctrl-C, so a timeout ends the session and the next script starts a new one.
+    """
+
+    def __init__(self, session_id: str, sandbox: ToolSandbox = None, executable: str = None):
+        super().__init__(session_id, sandbox)
+        self.executable = executable or POWERSHELL_EXECUTABLE
+        self.powershell = bool(self.executable) and is_powershell(self.executable)
+        # Windows pipes end lines with \r\n, native exit codes can be negative
+        self.done_pattern = re.compile(rb"\r?\n?" + re.escape(self.marker.encode()) + rb" (-?\d+)\r?\n")
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        if not self.executable:
+            raise ShellSessionClosed("PowerShell is not installed")
+        if self.sandbox:
+            self.cgroup = self.sandbox.create_cgroup(f"powershell-{self.session_id}")
+        # .NET reserves far more address space than RLIMIT_AS allows
+        preexec_fn = self.sandbox.preexec(self.cgroup, address_space=False) if self.sandbox and os.name == "posix" else None
+
+        argv = [self.executable, "-NoLogo", "-NoProfile", "-NonInteractive", "-Command", "-"] if self.powershell else [self.executable]
+        env = {**os.environ, "TERM": "dumb", "PAGER": "cat", "GIT_PAGER": "cat", "POWERSHELL_TELEMETRY_OPTOUT": "1", "POWERSHELL_UPDATECHECK": "Off"}
+        self.proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=env,
+            start_new_session=os.name != "nt",
+            preexec_fn=preexec_fn,
+            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0
+        )
+        self.reader = self.proc.stdout
+        try:
+            if self.powershell:
+                self._write(POWERSHELL_INIT + "\n")
+            self._write(self._marker_command())
+            await asyncio.wait_for(self._read_until_done(None, None), POWERSHELL_START_TIMEOUT)
+        except BaseException:
+            await self.close()
+            raise
+
+    def _write(self, text: str):
+        if not self.alive:
+            raise ShellSessionClosed("PowerShell session exited")
+        self.proc.stdin.write(text.encode())
+
+    def _marker_command(self) -> str:
+        if not self.powershell:
+            return super()._marker_command()
+        return f'[Console]::Out.Write("`n{self.marker} 0`n"); [Console]::Out.Flush()\n'
+
+    def _command(self, cmd: str) -> str:
+        if not self.powershell:
+            return super()._command(cmd)
+        script = base64.b64encode(cmd.encode("utf-8")).decode()
+        render = f"Out-String -Stream -Width {POWERSHELL_OUTPUT_WIDTH}"
+        # $LASTEXITCODE is the status of native programs, entries in $Error mark a failed cmdlet
+        return (
+            "$global:LASTEXITCODE = 0; $Error.Clear(); "
+            f"try {{ Invoke-Expression ([Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{script}'))) *>&1 | {render} }} "
+            f"catch {{ $_ | {render} }}; "
+            "$__agent_status = if ($LASTEXITCODE) { $LASTEXITCODE } elseif ($Error.Count) { 1 } else { 0 }; "
+            f'[Console]::Out.Write("`n{self.marker} $__agent_status`n"); [Console]::Out.Flush()\n'
+        )
+
+    async def _interrupt(self, output: Optional[BoundedOutput]):
+        await self.close()
+
+    async def close(self):
+        if self.proc and self.proc.returncode is None:
+            await asyncio.shield(kill_process_tree(self.proc))
+        if self.sandbox and self.cgroup:
+            self.sandbox.remove_cgroup(self.cgroup)
+            self.cgroup = None
@@ -0,0 +1,201 @@
+import os
+import time
+import codecs
+import signal
+import asyncio
+import logging
+import subprocess
+from typing import Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_SIZE = 64 * 1024
+KILL_GRACE_PERIOD = 2.0
+STREAM_INTERVAL = 0.2
+
+# Settings of the run_shell and run_powershell_script tools
+SHELL_TIMEOUT = float(os.getenv("SHELL_TIMEOUT", "60"))
+SHELL_MAX_TIMEOUT = float(os.getenv("SHELL_MAX_TIMEOUT", "600"))
+# Bytes of output returned to the model, the middle of longer output is cut
+SHELL_OUTPUT_LIMIT = int(os.getenv("SHELL_OUTPUT_LIMIT", "16384"))
+# Bytes of output streamed to the chat while the command runs
+SHELL_STREAM_LIMIT = int(os.getenv("SHELL_STREAM_LIMIT", str(1024 * 1024)))
+
+
+class BoundedOutput:
+    """Keeps the first and last limit / 2 bytes of a stream and counts everything"""
+
+    def __init__(self, limit: int):
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def feed(self, data: bytes):
+        self.total += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self.head) + len(self.tail)
+
+    def render(self) -> str:
+        head = self.head.decode(errors="replace")
+        tail = self.tail.decode(errors="replace")
+        if not self.truncated:
+            return head + tail
+        omitted = self.total - len(self.head) - len(self.tail)
+        return f"{head}\n... [{omitted} of {self.total} bytes omitted] ...\n{tail}"
+
+
+class OutputStreamer:
+    """Forwards decoded output to a callback at most every STREAM_INTERVAL seconds, up to limit bytes"""
+
+    def __init__(self, callback: Callable[[str], Awaitable[None]], limit: int):
+        self.callback = callback
+        self.limit = limit
+        self.sent = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.pending = []
+        self.last_flush = 0.0
+
+    async def feed(self, data: bytes):
+        if self.sent >= self.limit:
+            return
+        data = data[:self.limit - self.sent]
+        self.sent += len(data)
+        self.pending.append(self.decoder.decode(data))
+        if self.sent >= self.limit:
+            self.pending.append(self.decoder.decode(b"", final=True) + f"\n... [streaming stopped after {self.limit} bytes] ...\n")
+            await self.flush()
+        elif time.monotonic() - self.last_flush >= STREAM_INTERVAL:
+            await self.flush()
+
+    async def flush(self):
+        text = "".join(self.pending)
+        self.pending.clear()
+        self.last_flush = time.monotonic()
+        if not text:
+            return
+        try:
+            await self.callback(text)
+        except Exception as e:
+            # A client that stopped listening must not fail the command
+            logger.warning(f"failed to stream command output: {e}")
+            self.sent = self.limit
+
+
+async def kill_process_tree(proc: asyncio.subprocess.Process, grace: float = KILL_GRACE_PERIOD):
+    """Terminate the process group of proc, anything still alive after the grace period is killed"""
+    if os.name == "nt":
+        await asyncio.to_thread(subprocess.run, ["taskkill", "/F", "/T", "/PID", str(proc.pid)], capture_output=True)
+        await proc.wait()
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(proc.wait(), grace)
+    except asyncio.TimeoutError:
+        pass
+    # Children that ignored SIGTERM or outlived the shell
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+
+async def run_command(
+    cmd: str,
+    timeout: float,
+    output_limit: int,
+    on_output: Callable[[str], Awaitable[None]] = None,
+    stream_limit: int = 0,
+    cwd: str = None,
+    env: Dict[str, str] = None,
+    preexec_fn: Callable[[], None] = None,
+    max_output: int = 0
+) -> dict:
+    """Run a shell command in its own process group with stdout and stderr merged.
+
+    The group is killed when the timeout expires, the command prints more than max_output
+    bytes or the caller is cancelled. Output is streamed to on_output while the command
+    runs and kept head and tail bounded.
+    """
+    output = BoundedOutput(output_limit)
+    streamer = OutputStreamer(on_output, stream_limit) if on_output and stream_limit else None
+    start = time.monotonic()
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=cwd,
+        env=env,
+        start_new_session=os.name != "nt",
+        preexec_fn=preexec_fn
+    )
+    output_exceeded = False
+
+    async def collect():
+        nonlocal output_exceeded
+        while True:
+            try:
+                if streamer and streamer.pending:
+                    # Output held back by the stream interval goes out when the command goes quiet
+                    data = await asyncio.wait_for(proc.stdout.read(READ_CHUNK_SIZE), STREAM_INTERVAL)
+                else:
+                    data = await proc.stdout.read(READ_CHUNK_SIZE)
+            except asyncio.TimeoutError:
+                await streamer.flush()
+                continue
+            if not data:
+                break
+            output.feed(data)
+            if streamer:
+                await streamer.feed(data)
+            if max_output and output.total > max_output:
+                output_exceeded = True
+                return
+        await proc.wait()
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(collect(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+    finally:
+        if proc.returncode is None or timed_out:
+            await asyncio.shield(kill_process_tree(proc))
+    if streamer:
+        await streamer.flush()
+
+    return {
+        "exit_code": proc.returncode,
+        "timed_out": timed_out,
+        "timeout": timeout,
+        "output_exceeded": output_exceeded,
+        "duration_s": round(time.monotonic() - start, 2),
+        "output": output.render(),
+        "output_bytes": output.total,
+        "truncated": output.truncated,
+    }
+
+
+def format_command_result(result: dict) -> str:
+    """Output of a run_command or shell session result followed by a one-line summary for the model"""
+    size = f"{result['output_bytes']} bytes of output" + (", truncated" if result["truncated"] else "")
+    notes = [f"exit code {result['exit_code']}", size, f"{result['duration_s']}s"]
+    if result.get("session_closed"):
+        notes.append("shell session ended, the next command starts a fresh shell")
+    return f"{result['output']}\n[{', '.join(notes)}]"
@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import uuid
+import signal
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# rlimits of every tool process, 0 disables a limit
+TOOL_CPU_SECONDS = int(os.getenv("TOOL_CPU_SECONDS", "300"))
+# RLIMIT_AS per process, off by default: JVMs, node and .NET reserve far more address space than they use.
+# Memory is capped by the cgroup limit TOOL_CGROUP_MEMORY_MB instead
+TOOL_MEMORY_MB = int(os.getenv("TOOL_MEMORY_MB", "0"))
+TOOL_OPEN_FILES = int(os.getenv("TOOL_OPEN_FILES", "1024"))
+TOOL_FILE_SIZE_MB = int(os.getenv("TOOL_FILE_SIZE_MB", "1024"))  # largest file a process may write
+# Output read from a command before it is killed, the model only ever sees SHELL_OUTPUT_LIMIT of it
+TOOL_MAX_OUTPUT_MB = int(os.getenv("TOOL_MAX_OUTPUT_MB", "64"))
+
+# cgroup v2 group per session, used when the tool server may create groups under TOOL_CGROUP_ROOT
+TOOL_CGROUP_ROOT = os.getenv("TOOL_CGROUP_ROOT", "/sys/fs/cgroup/agent-tools")
+TOOL_CGROUP_MEMORY_MB = int(os.getenv("TOOL_CGROUP_MEMORY_MB", "2048"))
+TOOL_CGROUP_CPUS = float(os.getenv("TOOL_CGROUP_CPUS", "1"))
+TOOL_CGROUP_PIDS = int(os.getenv("TOOL_CGROUP_PIDS", "256"))
+
+TOOL_MAX_CONCURRENT = int(os.getenv("TOOL_MAX_CONCURRENT", "8"))
+TOOL_MAX_CONCURRENT_PER_SESSION = int(os.getenv("TOOL_MAX_CONCURRENT_PER_SESSION", "2"))  # per chat thread
+TOOL_QUEUE_TIMEOUT = float(os.getenv("TOOL_QUEUE_TIMEOUT", "30"))
+
+CGROUP_PERIOD_US = 100000
+
+# Signals the kernel sends on an rlimit hit, reported only for a negative Popen return code: a shell
+# status of 128 + signal cannot be told apart from a program exiting with that code
+SIGNAL_LIMITS = {signal.SIGXCPU: "cpu_time", signal.SIGXFSZ: "file_size"}
+# cgroup event counters that mark a limit hit, (file, key) -> limit
+CGROUP_EVENTS = {("memory.events", "oom_kill"): "memory", ("pids.events", "max"): "processes"}
+
+
+class ToolLimitError(Exception):
+    """A tool hit a resource limit, sent to the client as a JSON tool error"""
+
+    def __init__(self, limit: str, message: str, **details):
+        super().__init__(message)
+        self.limit = limit
+        self.details = details
+
+    def __str__(self) -> str:
+        return json.dumps({"error": "resource_limit", "limit": self.limit, "message": self.args[0], **self.details}, ensure_ascii=False)
+
+
+class ToolSandbox:
+    """Resource limits, cgroups and concurrency slots for processes started by tools"""
+
+    def __init__(self):
+        self.global_slots = asyncio.Semaphore(TOOL_MAX_CONCURRENT)
+        self.session_slots: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(TOOL_MAX_CONCURRENT_PER_SESSION))
+        self.session_waiters: Counter = Counter()
+        self.limit_hits: Counter = Counter()
+        self.running = 0
+        self.cgroups_enabled = self._init_cgroup_root()
+
+    def _init_cgroup_root(self) -> bool:
+        if os.name != "posix" or not os.path.exists("/sys/fs/cgroup/cgroup.controllers"):
+            return False
+        try:
+            os.makedirs(TOOL_CGROUP_ROOT, exist_ok=True)
+            with open(os.path.join(TOOL_CGROUP_ROOT, "cgroup.subtree_control"), "w") as f:
+                f.write("+memory +cpu +pids")
+            return True
+        except OSError as e:
+            logger.info(f"tool cgroups disabled, {TOOL_CGROUP_ROOT} is not writable: {e}")
+            return False
+
+    @asynccontextmanager
+    async def slot(self, session_id: str = None):
+        """Hold a per-session and a global execution slot, waiting at most TOOL_QUEUE_TIMEOUT.
+
+        The session is the chat thread, the tool servers see no user identity. Calls without a
+        session id only take a global slot.
+        """
+        if not session_id:
+            async with self._global_slot():
+                yield
+            return
+        session_slots = self.session_slots[session_id]
+        self.session_waiters[session_id] += 1
+        try:
+            try:
+                await asyncio.wait_for(session_slots.acquire(), TOOL_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise self.limit_error("session_concurrency", f"{TOOL_MAX_CONCURRENT_PER_SESSION} commands of this session are already running", max_concurrent=TOOL_MAX_CONCURRENT_PER_SESSION)
+            try:
+                async with self._global_slot():
+                    yield
+            finally:
+                session_slots.release()
+        finally:
+            self.session_waiters[session_id] -= 1
+            if not self.session_waiters[session_id]:
+                # Idle sessions do not keep a semaphore
+                del self.session_waiters[session_id]
+                self.session_slots.pop(session_id, None)
+
+    @asynccontextmanager
+    async def _global_slot(self):
+        try:
+            await asyncio.wait_for(self.global_slots.acquire(), TOOL_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise self.limit_error("concurrency", f"the tool server is running {TOOL_MAX_CONCURRENT} commands, try again later", max_concurrent=TOOL_MAX_CONCURRENT)
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.global_slots.release()
+
+    def create_cgroup(self, name: str = None) -> Optional[str]:
+        """New cgroup for a session or a single call, None when cgroups are unavailable"""
+        if not self.cgroups_enabled:
+            return None
+        path = os.path.join(TOOL_CGROUP_ROOT, re.sub(r"[^A-Za-z0-9_.-]", "_", name or f"call-{uuid.uuid4().hex}"))
+        limits = {
+            "memory.max": TOOL_CGROUP_MEMORY_MB * 1024 * 1024 if TOOL_CGROUP_MEMORY_MB else "max",
+            "memory.swap.max": 0,
+            "cpu.max": f"{int(TOOL_CGROUP_CPUS * CGROUP_PERIOD_US)} {CGROUP_PERIOD_US}" if TOOL_CGROUP_CPUS else "max",
+            "pids.max": TOOL_CGROUP_PIDS or "max",
+        }
+        try:
+            os.makedirs(path, exist_ok=True)
+            for control, value in limits.items():
+                try:
+                    with open(os.path.join(path, control), "w") as f:
+                        f.write(str(value))
+                except FileNotFoundError:
+                    # Controller not delegated to this group
+                    pass
+            return path
+        except OSError as e:
+            logger.warning(f"failed to create tool cgroup {path}: {e}")
+            return None
+
+    def remove_cgroup(self, path: Optional[str]):
+        if path:
+            try:
+                os.rmdir(path)
+            except OSError as e:
+                logger.warning(f"failed to remove tool cgroup {path}: {e}")
+
+    def cgroup_events(self, path: Optional[str]) -> Dict[str, int]:
+        """Limit event counts of a cgroup, taken before a command to compare with afterwards"""
+        events = {}
+        if not path:
+            return events
+        for (control, key), limit in CGROUP_EVENTS.items():
+            try:
+                with open(os.path.join(path, control)) as f:
+                    counters = dict(line.split() for line in f if line.strip())
+                events[limit] = int(counters.get(key, 0))
+            except (OSError, ValueError):
+                pass
+        return events
+
+    def preexec(self, cgroup: Optional[str] = None, address_space: bool = True) -> Callable[[], None]:
+        """preexec_fn applying the rlimits and moving the child into cgroup.
+
+        address_space=False leaves out RLIMIT_AS even when TOOL_MEMORY_MB sets one, for sessions of
+        runtimes such as .NET that reserve far more virtual memory than they use.
+        """
+        import resource
+
+        limits = [
+            (resource.RLIMIT_CPU, TOOL_CPU_SECONDS),
+            (resource.RLIMIT_AS, TOOL_MEMORY_MB * 1024 * 1024 if address_space else 0),
+            (resource.RLIMIT_NOFILE, TOOL_OPEN_FILES),
+            (resource.RLIMIT_FSIZE, TOOL_FILE_SIZE_MB * 1024 * 1024),
+        ]
+
+        def apply():
+            for kind, value in limits:
+                if value:
+                    _, hard = resource.getrlimit(kind)
+                    if hard != resource.RLIM_INFINITY:
+                        value = min(value, hard)
+                    # Soft limit first: SIGXCPU / SIGXFSZ identify the hit, the hard limit is a backstop
+                    backstop = value + 5 if kind == resource.RLIMIT_CPU else value
+                    resource.setrlimit(kind, (value, backstop if hard == resource.RLIM_INFINITY else min(backstop, hard)))
+            if cgroup:
+                with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+                    f.write(str(os.getpid()))
+
+        return apply
+
+    def limit_error(self, limit: str, message: str, **details) -> ToolLimitError:
+        self.limit_hits[limit] += 1
+        return ToolLimitError(limit, message, **details)
+
+    def check_result(self, result: dict, cgroup: str = None, events_before: Dict[str, int] = None) -> Optional[ToolLimitError]:
+        """Limit a finished command ran into, from its result of app.utils.process.run_command.
+
+        Only evidence counts: the killing signal of the process or a new cgroup event. A command that
+        fails on its own, e.g. printing MemoryError, is an ordinary failure.
+        """
+        details = {key: result[key] for key in ("exit_code", "duration_s", "output_bytes", "output") if key in result}
+        if result.get("output_exceeded"):
+            return self.limit_error("output_size", f"command printed more than {TOOL_MAX_OUTPUT_MB} MB and was killed", **details)
+        if result.get("timed_out"):
+            return self.limit_error("wall_time", f"command did not finish within {result.get('timeout', 0):g}s and was killed", **details)
+        exit_code = result.get("exit_code")
+        for sig, limit in SIGNAL_LIMITS.items():
+            if exit_code == -sig:
+                return self.limit_error(limit, f"command was killed by {signal.Signals(sig).name}, {limit.replace('_', ' ')} limit exceeded", **details)
+        events_before = events_before or {}
+        for limit, count in self.cgroup_events(cgroup).items():
+            if count > events_before.get(limit, 0):
+                if limit == "memory":
+                    return self.limit_error(limit, f"command exceeded the {TOOL_CGROUP_MEMORY_MB} MB memory limit of its cgroup and was killed", **details)
+                return self.limit_error(limit, f"command tried to run more than {TOOL_CGROUP_PIDS} processes", **details)
+        return None
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "max_concurrent": TOOL_MAX_CONCURRENT,
+            "max_concurrent_per_session": TOOL_MAX_CONCURRENT_PER_SESSION,
+            "active_sessions": len(self.session_waiters),
+            "cgroups": self.cgroups_enabled,
+            "limit_hits": dict(self.limit_hits),
+        }
@@ -0,0 +1,309 @@
+import os
+import re
+import time
+import shutil
+import signal
+import asyncio
+import logging
+import secrets
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.utils.process import BoundedOutput, OutputStreamer, KILL_GRACE_PERIOD, READ_CHUNK_SIZE, STREAM_INTERVAL
+from app.utils.sandbox import ToolSandbox
+
+logger = logging.getLogger(__name__)
+
+SHELL_SESSION_SHELL = os.getenv("SHELL_SESSION_SHELL") or shutil.which("bash")
+SHELL_MAX_SESSIONS = int(os.getenv("SHELL_MAX_SESSIONS", "16"))
+SHELL_SESSION_IDLE_TIMEOUT = float(os.getenv("SHELL_SESSION_IDLE_TIMEOUT", "900"))
+REAP_INTERVAL = 30.0
+
+
+def sessions_supported() -> bool:
+    return os.name == "posix" and bool(SHELL_SESSION_SHELL)
+
+
+class ShellSessionClosed(Exception):
+    pass
+
+
+class ShellOutputExceeded(Exception):
+    pass
+
+
+class ShellSession:
+    """Interactive shell on a PTY that keeps cwd, variables and activated environments between commands.
+
+    Echo and output post-processing are off, so the terminal returns exactly what commands print.
+    Each command is followed by a printf of a per-session random marker and $?, output is read up
+    to the marker. Commands read stdin from /dev/null. Job control puts every command in its own process group, so a timeout sends
+    Ctrl-C to the command and leaves the shell alive.
+    """
+
+    def __init__(self, session_id: str, sandbox: ToolSandbox = None):
+        self.session_id = session_id
+        self.sandbox = sandbox
+        self.cgroup = None
+        self.marker = f"__agent_shell_done_{secrets.token_hex(8)}__"
+        self.done_pattern = re.compile(rb"\n?" + re.escape(self.marker.encode()) + rb" (\d+)\n")
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.master_fd = None
+        self.transport: Optional[asyncio.ReadTransport] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.buffer = bytearray()
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None and self.master_fd is not None
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+    async def start(self):
+        import pty
+        import tty
+        import fcntl
+        import termios
+
+        master_fd, slave_fd = pty.openpty()
+        attrs = termios.tcgetattr(slave_fd)
+        attrs[tty.OFLAG] &= ~termios.OPOST
+        attrs[tty.LFLAG] &= ~(termios.ECHO | termios.ECHONL)
+        termios.tcsetattr(slave_fd, termios.TCSANOW, attrs)
+
+        if self.sandbox:
+            # Commands inherit the rlimits and the cgroup of the shell
+            self.cgroup = self.sandbox.create_cgroup(f"session-{self.session_id}")
+        apply_limits = self.sandbox.preexec(self.cgroup) if self.sandbox else None
+
+        def set_controlling_terminal():
+            os.setsid()
+            fcntl.ioctl(0, termios.TIOCSCTTY, 0)
+            if apply_limits:
+                apply_limits()
+
+        # Activated environments like to prepend to PS1, prompts are reset before each one is printed
+        env = {**os.environ, "PS1": "", "PS2": "", "PROMPT_COMMAND": "PS1=''; PS2=''", "VIRTUAL_ENV_DISABLE_PROMPT": "1", "TERM": "dumb", "HISTFILE": "/dev/null", "PAGER": "cat", "GIT_PAGER": "cat"}
+        try:
+            self.proc = await asyncio.create_subprocess_exec(
+                SHELL_SESSION_SHELL, "--noprofile", "--norc", "--noediting", "-i",
+                stdin=slave_fd,
+                stdout=slave_fd,
+                stderr=slave_fd,
+                env=env,
+                preexec_fn=set_controlling_terminal
+            )
+        finally:
+            os.close(slave_fd)
+
+        self.master_fd = master_fd
+        self.reader = asyncio.StreamReader()
+        protocol = asyncio.StreamReaderProtocol(self.reader)
+        self.transport, _ = await asyncio.get_running_loop().connect_read_pipe(lambda: protocol, os.fdopen(master_fd, "rb", 0))
+        try:
+            # Startup noise such as job control notices is discarded with the first marker
+            self._write(self._marker_command())
+            await asyncio.wait_for(self._read_until_done(None, None), KILL_GRACE_PERIOD * 5)
+        except BaseException:
+            await self.close()
+            raise
+
+    def _marker_command(self) -> str:
+        return f"printf '\\n%s %s\\n' '{self.marker}' $?\n"
+
+    def _command(self, cmd: str) -> str:
+        # The marker is written along with the command, commands reading stdin must not consume it
+        return f"{{ {cmd}\n}} < /dev/null\n{self._marker_command()}"
+
+    def _write(self, text: str):
+        os.write(self.master_fd, text.encode())
+
+    async def _read_until_done(self, output: Optional[BoundedOutput], streamer: Optional[OutputStreamer], max_output: int = 0) -> int:
+        """Read output up to the next marker, returns the exit status printed with it"""
+        while True:
+            if max_output and output.total > max_output:
+                raise ShellOutputExceeded()
+            match = self.done_pattern.search(self.buffer)
+            if match:
+                status, end = int(match.group(1)), match.end()
+                await self._emit(self.buffer[:match.start()], output, streamer)
+                del self.buffer[:end]
+                return status
+            # Everything except a possible marker prefix at the end is command output
+            keep = len(self.marker) + 16
+            if len(self.buffer) > keep:
+                await self._emit(self.buffer[:-keep], output, streamer)
+                del self.buffer[:-keep]
+            try:
+                if streamer and streamer.pending:
+                    data = await asyncio.wait_for(self.reader.read(READ_CHUNK_SIZE), STREAM_INTERVAL)
+                else:
+                    data = await self.reader.read(READ_CHUNK_SIZE)
+            except asyncio.TimeoutError:
+                await streamer.flush()
+                continue
+            except OSError:
+                # EIO once the shell has exited and the slave side is closed
+                data = b""
+            if not data:
+                await self._emit(self.buffer, output, streamer)
+                self.buffer.clear()
+                raise ShellSessionClosed("shell session exited")
+            self.buffer += data
+
+    async def _emit(self, data: bytes, output: Optional[BoundedOutput], streamer: Optional[OutputStreamer]):
+        if not data:
+            return
+        data = bytes(data)
+        if output:
+            output.feed(data)
+        if streamer:
+            await streamer.feed(data)
+
+    async def run(
+        self,
+        cmd: str,
+        timeout: float,
+        output_limit: int,
+        on_output: Callable[[str], Awaitable[None]] = None,
+        stream_limit: int = 0,
+        max_output: int = 0
+    ) -> dict:
+        """Same result as app.utils.process.run_command, run in this session"""
+        async with self.lock:
+            self.last_used = time.monotonic()
+            output = BoundedOutput(output_limit)
+            streamer = OutputStreamer(on_output, stream_limit) if on_output and stream_limit else None
+            start = time.monotonic()
+            timed_out = output_exceeded = False
+            exit_code = None
+            try:
+                self._write(self._command(cmd))
+                try:
+                    exit_code = await asyncio.wait_for(self._read_until_done(output, streamer, max_output), timeout)
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    await self._interrupt(output)
+                except ShellOutputExceeded:
+                    output_exceeded = True
+                    await self._interrupt(None)
+            except ShellSessionClosed:
+                await self.close()
+            except BaseException:
+                # Cancelled or failed mid-command, the shell is in an unknown state
+                await self.close()
+                raise
+            finally:
+                self.last_used = time.monotonic()
+            if streamer:
+                await streamer.flush()
+
+            return {
+                "exit_code": exit_code if exit_code is not None else (self.proc.returncode if self.proc else None),
+                "timed_out": timed_out,
+                "timeout": timeout,
+                "output_exceeded": output_exceeded,
+                "duration_s": round(time.monotonic() - start, 2),
+                "output": output.render(),
+                "output_bytes": output.total,
+                "truncated": output.truncated,
+                "session": self.session_id,
+                "session_closed": not self.alive,
+            }
+
+    async def _interrupt(self, output: Optional[BoundedOutput]):
+        """Ctrl-C the running command, the shell is closed when it does not come back"""
+        # Ctrl-C also flushes the terminal input queue, so the marker is sent again
+        self._write("\x03")
+        await asyncio.sleep(0.1)
+        self._write(self._marker_command())
+        try:
+            await asyncio.wait_for(self._read_until_done(output, None), KILL_GRACE_PERIOD)
+        except (asyncio.TimeoutError, ShellSessionClosed):
+            await self.close()
+
+    async def close(self):
+        if self.proc and self.proc.returncode is None:
+            # The shell forwards SIGHUP to its jobs
+            for sig in (signal.SIGHUP, signal.SIGKILL):
+                try:
+                    self.proc.send_signal(sig)
+                except ProcessLookupError:
+                    break
+                try:
+                    await asyncio.wait_for(self.proc.wait(), KILL_GRACE_PERIOD)
+                    break
+                except asyncio.TimeoutError:
+                    continue
+        if self.transport is not None:
+            # Closes the master side, hanging up whatever still runs on the terminal
+            self.transport.close()
+            self.transport = None
+        self.master_fd = None
+        if self.sandbox and self.cgroup:
+            self.sandbox.remove_cgroup(self.cgroup)
+            self.cgroup = None
+
+
+class ShellSessionManager:
+    """Shell sessions by id with an idle timeout and a cap, the least recently used idle session makes room"""
+
+    def __init__(self, max_sessions: int = SHELL_MAX_SESSIONS, idle_timeout: float = SHELL_SESSION_IDLE_TIMEOUT, sandbox: ToolSandbox = None,
+                 session_class: type = ShellSession):
+        self.max_sessions = max_sessions
+        self.sandbox = sandbox
+        self.session_class = session_class
+        self.idle_timeout = idle_timeout
+        self.sessions: "OrderedDict[str, ShellSession]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._reaper: Optional[asyncio.Task] = None
+
+    async def get(self, session_id: str) -> Optional[ShellSession]:
+        """Existing or new session, None when every session is busy and the cap is reached"""
+        async with self._lock:
+            if self._reaper is None or self._reaper.done():
+                self._reaper = asyncio.create_task(self._reap())
+
+            session = self.sessions.get(session_id)
+            if session and session.alive:
+                self.sessions.move_to_end(session_id)
+                return session
+            self.sessions.pop(session_id, None)
+
+            if len(self.sessions) >= self.max_sessions:
+                idle = next((sid for sid, s in self.sessions.items() if not s.busy), None)
+                if idle is None:
+                    return None
+                await self.sessions.pop(idle).close()
+
+            session = self.session_class(session_id, self.sandbox)
+            await session.start()
+            self.sessions[session_id] = session
+            return session
+
+    async def close(self, session_id: str) -> bool:
+        session = self.sessions.pop(session_id, None)
+        if session:
+            await session.close()
+        return session is not None
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(REAP_INTERVAL)
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if not session.busy and (not session.alive or now - session.last_used > self.idle_timeout):
+                    logger.info(f"closing idle shell session {session_id}")
+                    self.sessions.pop(session_id, None)
+                    await session.close()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "sessions": len(self.sessions),
+            "busy": sum(session.busy for session in self.sessions.values()),
+            "max_sessions": self.max_sessions,
+        }
@@ -0,0 +1,64 @@
+import os
+import sys
+import subprocess
+from collections import defaultdict
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules a cold start pays for: the API server and every MCP server subprocess
+STARTUP_MODULES = ["main", "app.mcp.rag_tools", "app.mcp.shell_tools", "app.mcp.powershell_tools"]
+
+
+def measure_import(module_name: str) -> Dict[str, object]:
+    """Import a module in a fresh interpreter with -X importtime, times in milliseconds"""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module_name}; "
+        "print(f'{(time.perf_counter() - start) * 1000:.1f}')"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        error_lines = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        return {"module": module_name, "error": error_lines[-1] if error_lines else f"exit code {result.returncode}"}
+
+    modules = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    packages = defaultdict(float)
+    for name, self_ms, _ in modules:
+        packages[name.split(".")[0]] += self_ms
+
+    return {
+        "module": module_name,
+        "total_ms": float(result.stdout.strip().splitlines()[-1]),
+        "modules_imported": len(modules),
+        "packages": sorted(packages.items(), key=lambda item: item[1], reverse=True),
+        "slowest_modules": sorted(((name, cumulative) for name, _, cumulative in modules), key=lambda item: item[1], reverse=True),
+    }
+
+
+def print_startup_profile(module_names: List[str] = None, top: int = 15):
+    for module_name in module_names or STARTUP_MODULES:
+        report = measure_import(module_name)
+        print("=" * 80)
+        if "error" in report:
+            print(f"{module_name}: import failed: {report['error']}")
+            continue
+        print(f"{module_name}: {report['total_ms']:.0f} ms, {report['modules_imported']} modules imported")
+        print(f"  {'package (self time)':<50}{'ms':>10}")
+        for name, milliseconds in report["packages"][:top]:
+            print(f"  {name:<50}{milliseconds:>10.1f}")
+        print(f"  {'module (cumulative time)':<50}{'ms':>10}")
+        for name, milliseconds in report["slowest_modules"][:top]:
+            print(f"  {name:<50}{milliseconds:>10.1f}")
@@ -0,0 +1,211 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.rag.symbols import Definition, FileSymbols, extract_symbols, language_for
+from app.utils.lazy import LazyObject
+from app.utils.workspace import WORKSPACE_ROOT, IgnoreRules, iter_workspace_files
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_MAX_FILE_KB = int(os.getenv("SYMBOL_MAX_FILE_KB", "1024"))
+# Rescan interval when filesystem notifications (watchfiles) are unavailable
+SYMBOL_POLL_INTERVAL = float(os.getenv("SYMBOL_POLL_INTERVAL", "5"))
+SYMBOL_READY_TIMEOUT = float(os.getenv("SYMBOL_READY_TIMEOUT", "30"))
+
+
+class SymbolIndex:
+    """Definitions, references and outlines of the workspace source files.
+
+    A background thread builds the index once and then applies filesystem change notifications,
+    so lookups are dictionary reads. Files are re-parsed only when their mtime or size changes.
+    """
+
+    def __init__(self, root: str = None):
+        self.root = Path(root or WORKSPACE_ROOT).resolve()
+        self.files: Dict[str, Tuple[int, int, FileSymbols]] = {}
+        # name and qualified name -> files defining it, identifier -> files using it
+        self.definitions: Dict[str, Set[str]] = defaultdict(set)
+        self.references: Dict[str, Set[str]] = defaultdict(set)
+        self.ignore_rules = IgnoreRules(self.root)
+        self.ready = threading.Event()
+        self.watch_mode = None
+        self.last_update = 0.0
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="symbol-index", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self):
+        # Joined so the interpreter does not exit while the watcher is inside native code
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+
+    def wait_ready(self, timeout: float = SYMBOL_READY_TIMEOUT) -> bool:
+        self.start()
+        return self.ready.wait(timeout)
+
+    def _run(self):
+        try:
+            start = time.perf_counter()
+            self.scan()
+            self.ready.set()
+            logger.info(f"symbol index built: {len(self.files)} files in {time.perf_counter() - start:.2f}s")
+            self._watch()
+        except Exception as e:
+            logger.error(f"symbol index stopped: {e}")
+        finally:
+            self.ready.set()
+
+    def _watch(self):
+        try:
+            from watchfiles import Change, watch
+        except ImportError:
+            self.watch_mode = "polling"
+            logger.info(f"watchfiles is not installed, rescanning the workspace every {SYMBOL_POLL_INTERVAL:g}s")
+            while not self._stop.wait(SYMBOL_POLL_INTERVAL):
+                self.scan()
+            return
+
+        self.watch_mode = "notify"
+        caught_up = False
+        for changes in watch(self.root, stop_event=self._stop, debounce=200, rust_timeout=1000, yield_on_timeout=True):
+            # Changes made between the first scan and the watcher starting are picked up by one more scan
+            rescan = not caught_up
+            caught_up = True
+            for change, path in changes:
+                relative = Path(path).relative_to(self.root).as_posix()
+                is_dir = os.path.isdir(path)
+                if self.ignore_rules.ignored_path(relative, is_dir):
+                    # Churn in ignored trees such as .git/objects or node_modules
+                    continue
+                if relative.endswith(".gitignore") or is_dir:
+                    # Ignore rules changed or a directory appeared, e.g. moved in with its files
+                    rescan = True
+                elif change == Change.deleted or not os.path.isfile(path):
+                    self.remove(relative)
+                elif language_for(relative):
+                    self.update(relative)
+            if rescan:
+                self.ignore_rules = IgnoreRules(self.root)
+                self.scan()
+
+    def scan(self):
+        """Sync the index with the files on disk"""
+        seen = set()
+        for relative, entry in iter_workspace_files(str(self.root)):
+            if not language_for(relative):
+                continue
+            seen.add(relative)
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            current = self.files.get(relative)
+            if not current or current[:2] != (stat.st_mtime_ns, stat.st_size):
+                self.update(relative, stat)
+        for relative in set(self.files) - seen:
+            self.remove(relative)
+
+    def update(self, relative: str, stat: os.stat_result = None):
+        path = self.root / relative
+        try:
+            stat = stat or path.stat()
+            if stat.st_size > SYMBOL_MAX_FILE_KB * 1024:
+                self.remove(relative)
+                return
+            text = path.read_text(encoding="utf-8", errors="replace")
+            symbols = extract_symbols(text, language_for(relative))
+        except (OSError, ValueError) as e:
+            logger.debug(f"symbol index skipped {relative}: {e}")
+            self.remove(relative)
+            return
+        with self._lock:
+            self._unlink(relative)
+            self.files[relative] = (stat.st_mtime_ns, stat.st_size, symbols)
+            for definition in symbols.definitions:
+                self.definitions[definition.name].add(relative)
+                self.definitions[definition.qualname].add(relative)
+            for name in symbols.references:
+                self.references[name].add(relative)
+            self.last_update = time.time()
+
+    def remove(self, relative: str):
+        """Drop a file, or every file below a removed directory"""
+        with self._lock:
+            prefix = relative.rstrip("/") + "/"
+            for path in [path for path in self.files if path == relative or path.startswith(prefix)]:
+                self._unlink(path)
+                del self.files[path]
+                self.last_update = time.time()
+
+    def _unlink(self, relative: str):
+        current = self.files.get(relative)
+        if not current:
+            return
+        symbols = current[2]
+        for definition in symbols.definitions:
+            for name in (definition.name, definition.qualname):
+                paths = self.definitions.get(name)
+                if paths is not None:
+                    paths.discard(relative)
+                    if not paths:
+                        del self.definitions[name]
+        for name in symbols.references:
+            paths = self.references.get(name)
+            if paths is not None:
+                paths.discard(relative)
+                if not paths:
+                    del self.references[name]
+
+    def find_definitions(self, name: str) -> List[Tuple[str, Definition]]:
+        """Definitions matching a name or a dotted qualified name such as Class.method"""
+        with self._lock:
+            results = []
+            for path in sorted(self.definitions.get(name, ())):
+                results.extend((path, d) for d in self.files[path][2].definitions if name in (d.name, d.qualname))
+            return results
+
+    def find_references(self, name: str) -> List[Tuple[str, int]]:
+        """Lines using a name, the last part of a dotted name is looked up"""
+        name = name.rsplit(".", 1)[-1]
+        with self._lock:
+            return [(path, line) for path in sorted(self.references.get(name, ())) for line in self.files[path][2].references.get(name, ())]
+
+    def outline(self, relative: str) -> Optional[List[Definition]]:
+        with self._lock:
+            current = self.files.get(relative)
+            return list(current[2].definitions) if current else None
+
+    def suggest(self, name: str, limit: int = 10) -> List[str]:
+        """Defined names containing name, case-insensitively, for lookups that found nothing"""
+        needle = name.lower()
+        with self._lock:
+            return sorted((defined for defined in self.definitions if needle in defined.lower()), key=len)[:limit]
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "root": str(self.root),
+                "ready": self.ready.is_set(),
+                "watch_mode": self.watch_mode,
+                "files": len(self.files),
+                "definitions": sum(len(entry[2].definitions) for entry in self.files.values()),
+                "last_update": self.last_update,
+            }
+
+
+symbol_index = LazyObject(SymbolIndex)
@@ -0,0 +1,286 @@
+import os
+import re
+import mmap
+import fnmatch
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT") or os.getcwd()
+READ_MAX_LINES = int(os.getenv("READ_MAX_LINES", "500"))
+SEARCH_MAX_MATCHES = int(os.getenv("SEARCH_MAX_MATCHES", "100"))
+SEARCH_MAX_FILE_MB = int(os.getenv("SEARCH_MAX_FILE_MB", "20"))
+# Longest line printed in search results, minified files would flood the context otherwise
+SEARCH_MAX_LINE_CHARS = 300
+BINARY_SNIFF_BYTES = 8192
+
+# Skipped everywhere, on top of the .gitignore files of the workspace
+DEFAULT_IGNORES = [
+    ".git/", "__pycache__/", "node_modules/", ".venv/", "venv/", ".idea/", ".vscode/",
+    ".mypy_cache/", ".pytest_cache/", "*.pyc", "*.log", ".DS_Store",
+]
+
+
+class IgnoreRule:
+    """One .gitignore pattern, relative to the directory of its file"""
+
+    def __init__(self, base: str, pattern: str):
+        self.negate = pattern.startswith("!")
+        pattern = pattern[1:] if self.negate else pattern
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A slash anywhere but at the end anchors the pattern to its directory
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        regex = ""
+        for part in re.split(r"(\*\*/|/\*\*$|\*\*)", pattern):
+            if part == "**/":
+                regex += "(?:.*/)?"
+            elif part in ("/**", "**"):
+                regex += "(?:/.*)?" if part == "/**" else ".*"
+            else:
+                regex += fnmatch.translate(part)[4:-3].replace(".*", "[^/]*")
+        prefix = re.escape(base + "/") if base else ""
+        self.regex = re.compile(prefix + ("" if anchored else "(?:.*/)?") + regex + r"\Z")
+
+    def matches(self, path: str, is_dir: bool) -> bool:
+        return (is_dir or not self.dir_only) and bool(self.regex.match(path))
+
+
+class IgnoreRules:
+    """DEFAULT_IGNORES and the .gitignore files met while walking the workspace, the last match wins"""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.rules = [IgnoreRule("", pattern) for pattern in DEFAULT_IGNORES]
+        self.loaded = set()
+        self.load("")
+
+    def load(self, directory: str):
+        if directory in self.loaded:
+            return
+        self.loaded.add(directory)
+        try:
+            with open(self.root / directory / ".gitignore", encoding="utf-8", errors="replace") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        for line in lines:
+            line = line.rstrip()
+            if line and not line.startswith("#"):
+                self.rules.append(IgnoreRule(directory, line.replace("\\#", "#")))
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        result = False
+        for rule in self.rules:
+            if rule.matches(path, is_dir):
+                result = not rule.negate
+        return result
+
+    def ignored_path(self, path: str, is_dir: bool = False) -> bool:
+        """ignored() for a path anywhere in the tree, checking each of its directories on the way down"""
+        parts = path.split("/")
+        for i in range(1, len(parts)):
+            directory = "/".join(parts[:i])
+            self.load("/".join(parts[:i - 1]))
+            if self.ignored(directory, True):
+                return True
+        self.load("/".join(parts[:-1]))
+        return self.ignored(path, is_dir)
+
+
+def resolve_path(path: str, root: str = None) -> Path:
+    """Absolute path of a workspace path, ValueError for paths outside the workspace"""
+    root = Path(root or WORKSPACE_ROOT).resolve()
+    resolved = (root / path).resolve()
+    if resolved != root and root not in resolved.parents:
+        raise ValueError(f"{path} is outside the workspace")
+    return resolved
+
+
+def iter_workspace_files(root: str = None, glob: str = None) -> Iterator[Tuple[str, os.DirEntry]]:
+    """(relative path, entry) of every file not ignored, optionally filtered by a glob on the relative path"""
+    root = Path(root or WORKSPACE_ROOT).resolve()
+    rules = IgnoreRules(root)
+    stack = [""]
+    while stack:
+        directory = stack.pop()
+        if directory:
+            rules.load(directory)
+        try:
+            with os.scandir(root / directory) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            relative = f"{directory}/{entry.name}" if directory else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if not is_dir and not entry.is_file(follow_symlinks=False):
+                    continue
+            except OSError:
+                continue
+            if rules.ignored(relative, is_dir):
+                continue
+            if is_dir:
+                subdirs.append(relative)
+            elif not glob or fnmatch.fnmatch(relative, glob) or fnmatch.fnmatch(entry.name, glob):
+                yield relative, entry
+        stack.extend(reversed(subdirs))
+
+
+def read_lines(path: str, start_line: int = 1, end_line: int = None, root: str = None) -> Dict[str, object]:
+    """Lines start_line..end_line (1-based, inclusive) of a file, at most READ_MAX_LINES of them"""
+    file_path = resolve_path(path, root)
+    start_line = max(start_line, 1)
+    if end_line is None or end_line < start_line:
+        end_line = start_line + READ_MAX_LINES - 1
+    end_line = min(end_line, start_line + READ_MAX_LINES - 1)
+
+    lines = []
+    total = 0
+    with open(file_path, "rb") as f:
+        for total, line in enumerate(f, 1):
+            if start_line <= total <= end_line:
+                lines.append(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+    return {
+        "path": path,
+        "start_line": start_line,
+        "end_line": start_line + len(lines) - 1,
+        "total_lines": total,
+        "lines": lines,
+    }
+
+
+def format_lines(result: Dict[str, object]) -> str:
+    width = len(str(result["end_line"]))
+    body = "\n".join(f"{number:>{width}}| {line}" for number, line in enumerate(result["lines"], result["start_line"]))
+    if not result["lines"]:
+        return f"[{result['path']} has {result['total_lines']} lines, none from line {result['start_line']}]"
+    return f"{body}\n[{result['path']} lines {result['start_line']}-{result['end_line']} of {result['total_lines']}]"
+
+
+def _line_end(data, pos: int) -> int:
+    end = data.find(b"\n", pos)
+    return len(data) if end < 0 else end
+
+
+def _decode_line(data, start: int, end: int) -> str:
+    line = data[start:end].decode("utf-8", errors="replace").rstrip("\r")
+    return line if len(line) <= SEARCH_MAX_LINE_CHARS else line[:SEARCH_MAX_LINE_CHARS] + " ..."
+
+
+def search_file(data, regex: re.Pattern, context: int, max_matches: int) -> List[Tuple[int, List[Tuple[int, str, bool]]]]:
+    """Matching lines of a buffer as (line number, [(line number, text, is_match)]) including context lines"""
+    hits = []
+    line_number = 1
+    counted_to = 0
+    pos = 0
+    while len(hits) < max_matches and pos < len(data):
+        match = regex.search(data, pos)
+        # A zero-width match after the final newline is not on a line
+        if not match or (match.start() == len(data) and data[-1:] == b"\n"):
+            break
+        line_start = data.rfind(b"\n", 0, match.start()) + 1
+        line_end = _line_end(data, match.start())
+        # Newlines are counted once, from the previous hit on (mmap has no count)
+        line_number += data[counted_to:line_start].count(b"\n")
+        counted_to = line_start
+
+        starts = [line_start]
+        while len(starts) <= context and starts[0] > 0:
+            starts.insert(0, data.rfind(b"\n", 0, starts[0] - 1) + 1)
+        block = [(line_number - len(starts) + 1 + i, _decode_line(data, start, _line_end(data, start)), False) for i, start in enumerate(starts[:-1])]
+        block.append((line_number, _decode_line(data, line_start, line_end), True))
+        start = line_end + 1
+        for offset in range(1, context + 1):
+            if start >= len(data):
+                break
+            end = _line_end(data, start)
+            block.append((line_number + offset, _decode_line(data, start, end), False))
+            start = end + 1
+        hits.append((line_number, block))
+        # One hit per line
+        pos = line_end + 1
+    return hits
+
+
+def search_workspace(
+    pattern: str,
+    glob: str = None,
+    ignore_case: bool = False,
+    context: int = 2,
+    max_matches: int = SEARCH_MAX_MATCHES,
+    root: str = None
+) -> Dict[str, object]:
+    """Regex search over the workspace files, each file memory-mapped instead of read"""
+    regex = re.compile(pattern.encode(), re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    max_matches = max(1, min(max_matches, SEARCH_MAX_MATCHES))
+    context = max(0, context)
+    max_size = SEARCH_MAX_FILE_MB * 1024 * 1024
+    results: List[Tuple[str, List]] = []
+    matches = files_searched = files_skipped = 0
+
+    for relative, entry in iter_workspace_files(root, glob):
+        if matches >= max_matches:
+            break
+        try:
+            size = entry.stat(follow_symlinks=False).st_size
+            if size == 0:
+                continue
+            if size > max_size:
+                files_skipped += 1
+                continue
+            with open(entry.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if b"\0" in data[:BINARY_SNIFF_BYTES]:
+                    continue
+                files_searched += 1
+                hits = search_file(data, regex, context, max_matches - matches)
+        except (OSError, ValueError) as e:
+            logger.debug(f"search skipped {relative}: {e}")
+            files_skipped += 1
+            continue
+        if hits:
+            matches += len(hits)
+            results.append((relative, hits))
+
+    return {
+        "pattern": pattern,
+        "matches": matches,
+        "files": results,
+        "files_searched": files_searched,
+        "files_skipped": files_skipped,
+        "limit_reached": matches >= max_matches,
+    }
+
+
+def format_search(result: Dict[str, object]) -> str:
+    """grep -n style: path:line:text for matches, path-line-text for context, -- between groups"""
+    groups = []
+    for path, hits in result["files"]:
+        # Context shared by neighbouring hits is printed once
+        lines: Dict[int, Tuple[str, bool]] = {}
+        for _, block in hits:
+            for number, text, is_match in block:
+                lines[number] = (text, is_match or lines.get(number, ("", False))[1])
+        group, last = [], None
+        for number in sorted(lines):
+            if last is not None and number > last + 1:
+                groups.append("\n".join(group))
+                group = []
+            text, is_match = lines[number]
+            sep = ":" if is_match else "-"
+            group.append(f"{path}{sep}{number}{sep}{text}")
+            last = number
+        if group:
+            groups.append("\n".join(group))
+
+    summary = f"{result['matches']} matches in {len(result['files'])} files, {result['files_searched']} files searched"
+    if result["files_skipped"]:
+        summary += f", {result['files_skipped']} skipped (unreadable or over {SEARCH_MAX_FILE_MB} MB)"
+    if result["limit_reached"]:
+        summary += ", stopped at the match limit, narrow the pattern or glob"
+    return "\n--\n".join(groups) + f"\n[{summary}]" if groups else f"[no matches for {result['pattern']}, {result['files_searched']} files searched]"
@@ -1,7 +1,9 @@
 
 import sys
 import os
+import asyncio
 import argparse
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -9,13 +11,26 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Import all API routers
 from app.api.chat_api import router as chat_router
-from app.api.upload_api import router as upload_router
+from app.api.upload_api import router as upload_router, warm_rag_stack
+from app.utils.loop_monitor import loop_monitor
+from app.utils.symbol_index import symbol_index
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    warmup = asyncio.create_task(warm_rag_stack())
+    # Built in its background thread while the server comes up, so find_symbol never waits for the first scan
+    symbol_index.start()
+    yield
+    warmup.cancel()
+    await loop_monitor.stop()
 
 # Create main app
 app = FastAPI(
     title="AI Agent & RAG System API",
     description="AI Agent Chat System and RAG Document Retrieval System - Support Multi-Knowledge Base Management and Intelligent Tool Calling",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -58,12 +73,15 @@ async def root():
                 "description": "RAG document retrieval system",
                 "endpoints": {
                     "upload": "POST /rag/upload",
+                    "bulk_upload": "POST /rag/upload/bulk",
                     "query": "POST /rag/query",
                     "analyze_git_repository": "POST /rag/analyze-git-repository",
                     "knowledge_bases": "GET /rag/knowledge-bases",
                     "create_kb": "POST /rag/knowledge-bases",
+                    "index_profiles": "GET /rag/index-profiles",
                     "get_kb": "GET /rag/knowledge-bases/{kb_id}",
                     "delete_kb": "DELETE /rag/knowledge-bases/{kb_id}",
+                    "gc_reconcile": "POST /rag/gc/reconcile",
                     "health": "GET /rag/health",
                     "files": "GET /rag/files"
                 }
@@ -74,6 +92,7 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Global health check"""
+    from app.utils.mcp import get_daemon_health
     return {
         "status": "healthy",
         "message": "AI Agent & RAG System API is running",
@@ -86,7 +105,9 @@ async def health_check():
             "file_tools": "integrated", 
             "shell_tools": "integrated",
             "powershell_tools": "integrated"
-        }
+        },
+        "event_loop_lag": loop_monitor.stats(),
+        "mcp_daemons": await get_daemon_health()
     }
 
 def main():
@@ -108,8 +129,19 @@ def main():
         help="Enable hot reload"
     )
     
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="Report import time per module for the API server and the MCP servers, then exit"
+    )
+    
     args = parser.parse_args()
     
+    if args.profile_startup:
+        from app.utils.startup_profile import print_startup_profile
+        print_startup_profile()
+        return
+    
     print("🚀 Start AI Agent & RAG System API Server...")
     print(f"API service will start at http://{args.host}:{args.port}")
     print("API documentation: http://localhost:8000/docs")
@@ -127,11 +159,14 @@ def main():
     print("")
     print("📚 RAG System:")
     print("  - POST /rag/upload - Upload file to knowledge base")
+    print("  - POST /rag/upload/bulk - Upload many files or a zip/tar archive")
     print("  - POST /rag/query - Query knowledge base")
     print("  - GET  /rag/knowledge-bases - List all knowledge bases")
     print("  - POST /rag/knowledge-bases - Create new knowledge base")
+    print("  - GET  /rag/index-profiles - List vector index profiles")
     print("  - GET  /rag/knowledge-bases/{kb_id} - Get knowledge base details")
     print("  - DELETE /rag/knowledge-bases/{kb_id} - Delete knowledge base")
+    print("  - POST /rag/gc/reconcile - Clean up deleted knowledge bases and orphaned collections")
     print("  - GET  /rag/health - RAG system health check")
     print("  - GET  /rag/files - View uploaded files")
     print("")
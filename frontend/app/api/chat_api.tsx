@@ -6,7 +6,8 @@ export interface ChatRequest {
 
 export interface ChatResponse {
   content: string;
-  type: 'thinking' | 'tool_result' | 'kb_info' | 'DONE';
+  type: 'thinking' | 'tool_result' | 'tool_output' | 'kb_info' | 'DONE';
+  tool?: string;
   error?: string;
 }
 
@@ -97,6 +97,9 @@ export default function ChatInterface({ onToggleLeftSidebar }: ChatInterfaceProp
               newContent = prevContent + (prevContent ? '\n\n' : '') + chunk.content;
             } else if (chunk.type === 'tool_result' || chunk.type === 'kb_info') {
               newContent = prevContent + (prevContent ? '\n\n' : '') + chunk.content;
+            } else if (chunk.type === 'tool_output') {
+              // Partial output of a running command, appended as it arrives
+              newContent = prevContent + chunk.content;
             }
             
             console.log('New content:', newContent);